@@ -15,7 +15,7 @@ from functools import wraps
 from views.decorators import is_admin_user, is_logged_in, is_case_set
 
 from webservice import WebService
-from util.database import Database
+from util.database import get_database
 
 from views.admin.admin_routes import admin_routes
 from views.cases.case_routes import case_routes
@@ -32,8 +32,7 @@ from views.decorators import is_admin_user, is_case_set, is_logged_in
 
 WEBSERVICE = None
 
-DATABASE = Database()
-DATABASE.connect()
+DATABASE = get_database()
 
 app = Flask(__name__)
 
@@ -0,0 +1,11 @@
+"""
+benchmarks - Timings for the search-result parsing and mapping code.
+
+The responses are synthetic, made by benchmarks.pages, but shaped like what
+PublicData and Zillow send us. Run from the app directory:
+
+    python -m benchmarks            # every benchmark
+    python -m benchmarks backends   # just the named ones
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
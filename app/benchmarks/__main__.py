@@ -0,0 +1,232 @@
+"""
+__main__.py - Run the benchmarks. See benchmarks/__init__.py.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from datetime import datetime
+import gc
+import random
+import sys
+import timeit
+import tracemalloc
+
+from benchmarks.pages import (dl_page, dmv_details_page, dmv_page, rp_details_page, rp_page,
+                              ERROR, ZILLOW)
+from util import parsepool, xmlbackend
+from util.classes.baserecord import records_to_dicts, records_to_json
+from util.classes.dlsummary import DlSummary
+from util.classes.dmv_lienholder import DmvLienHolder
+from util.classes.dmvdetails import DmvDetails
+from util.classes.dmvsummary import DmvSummary
+from util.classes.rpdetails import RealPropertyDetails
+from util.classes.rpsummary import RealPropertySummary
+from util.depreciation import depreciation_schedules
+from util.publicdata import error_message
+from util.resultparser import ResultParser
+from util.zillow import search_result_fields
+
+
+def summaries(record_class, raw: bytes, state: str)->list:
+    return list(record_class.from_records(ResultParser().parse(raw), "PUBLICDATA", state))
+
+
+def memory():
+    # Bytes held per parsed search result once the XML has been released.
+    number = 10000
+    for (record_class, page, state) in [(DmvSummary, dmv_page, "TX"), (DlSummary, dl_page, "FL"),
+                                        (RealPropertySummary, rp_page, "TX")]:
+        results = xmlbackend.fromstring(page(number)).find("results")
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        records = record_class.from_results(results, "PUBLICDATA", state)
+        held = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        print("{:<20} {:>6} records  {:>5} bytes/record".format(record_class.__name__, len(records), held // number))
+        del results, records
+
+
+def serialization():
+    # Serializing records from their schema, compared with walking dir(), as to_dict() used to.
+    def dir_to_dict(record):
+        result = {}
+        for attr in [x for x in dir(record) if x[:2] != "__"]:
+            value = getattr(record, attr)
+            if not callable(value):
+                result[attr] = value
+        return result
+
+    number = 10000
+    records = summaries(DmvSummary, dmv_page(number), "TX")
+    print("DIR:     {:.3f} sec for {} records".format(timeit.timeit(lambda: [dir_to_dict(r) for r in records], number=1), number))
+    print("SCHEMA:  {:.3f} sec for {} records".format(timeit.timeit(lambda: records_to_dicts(records), number=1), number))
+    print("JSON:    {:.3f} sec for {} records".format(timeit.timeit(lambda: records_to_json(records), number=1), number))
+
+
+def details_mapping():
+    # The single-pass mapping engine, compared with one XPath search per mapping,
+    # which is how RealPropertyDetails.from_xml() used to work.
+    def xpath_from_xml(details, root, mappings):
+        for mapping in mappings:
+            path = ".//field[@label='{}']".format(mapping["label"])
+            elem = root.findall(path)
+            if elem:
+                if "prop" in mapping:
+                    value = elem[0].get(mapping["prop"])
+                else:
+                    value = elem[0].text
+
+                if value:
+                    if "transform" in mapping and mapping["transform"]:
+                        value = mapping["transform"](value)
+
+                    if getattr(details, mapping["attr"]):
+                        existing_value = getattr(details, mapping["attr"])
+                        value = str(existing_value + " " + value).strip()
+                    setattr(details, mapping["attr"], value)
+
+    mappings = RealPropertyDetails.MAPPINGS["PUBLICDATA"]["TX"]
+    textdata = xmlbackend.fromstring(rp_details_page(unmapped=60)).find("./dataset/dataitem/textdata")
+
+    before = RealPropertyDetails(county="Collin")
+    before.source, before.state = "PUBLICDATA", "TX"
+    xpath_from_xml(before, textdata, mappings)
+    after = RealPropertyDetails(county="Collin")
+    after.from_xml(textdata, "PUBLICDATA", "TX")
+    print("Same result:", all(getattr(before, name) == getattr(after, name) for name in RealPropertyDetails.field_names()))
+
+    number = 5000
+    xpath = timeit.timeit(lambda: xpath_from_xml(RealPropertyDetails(county="Collin"), textdata, mappings), number=number)
+    compiled = timeit.timeit(lambda: RealPropertyDetails(county="Collin").from_xml(textdata, "PUBLICDATA", "TX"), number=number)
+    print("XPATH:    {:.1f} usec/record".format(xpath / number * 1e6))
+    print("COMPILED: {:.1f} usec/record".format(compiled / number * 1e6))
+
+
+def backends():
+    # Throughput of each XML backend. tests/test_xmlbackend.py checks that they
+    # produce the same results.
+    def dmv_details(raw: bytes)->dict:
+        root = xmlbackend.fromstring(raw)
+        details = DmvDetails()
+        details.from_xml(root.findall("./dataset/dataitem/textdata")[0], "PUBLICDATA", "TX")
+        for lien in root.findall("./dataset/dataitem/dataset[@label='Lien Holders']"):
+            lien_holder = DmvLienHolder()
+            lien_holder.from_xml(lien, "PUBLICDATA", "TX")
+            details.lien_holders.append(lien_holder)
+        return details.to_dict()
+
+    def rp_details(raw: bytes)->dict:
+        details = RealPropertyDetails(county="Collin")
+        details.from_xml(xmlbackend.fromstring(raw).find("./dataset/dataitem/textdata"), "PUBLICDATA", "TX")
+        return details.to_dict()
+
+    number = 500
+    pages = {"dmv": dmv_page(number), "dl": dl_page(number), "rp": rp_page(number),
+             "dmv details": dmv_details_page(), "rp details": rp_details_page()}
+    cases = {
+        "DMV summaries": lambda: records_to_dicts(summaries(DmvSummary, pages["dmv"], "TX")),
+        "DL summaries": lambda: records_to_dicts(summaries(DlSummary, pages["dl"], "FL")),
+        "RP summaries": lambda: records_to_dicts(summaries(RealPropertySummary, pages["rp"], "TX")),
+        "DMV details": lambda: dmv_details(pages["dmv details"]),
+        "RP details": lambda: rp_details(pages["rp details"]),
+        "Zillow": lambda: search_result_fields(xmlbackend.fromstring(ZILLOW)),
+        "Error message": lambda: error_message(xmlbackend.fromstring(ERROR)),
+    }
+
+    names = ["stdlib"] + (["lxml"] if xmlbackend.LXML_ET is not None else [])
+    if xmlbackend.LXML_ET is None:
+        print("lxml is not installed, so only the standard library is timed.")
+
+    repeat = 20
+    print("{:<14} {}".format("usec/call", "".join("{:>10}".format(name) for name in names)))
+    for case, function in cases.items():
+        times = []
+        for name in names:
+            xmlbackend.use(name)
+            times.append(timeit.timeit(function, number=repeat) / repeat * 1e6)
+        print("{:<14} {}".format(case, "".join("{:>10.1f}".format(t) for t in times)))
+    print("Summary pages hold {} records each.".format(number))
+
+
+def parse_pool():
+    # The page size at which parsing in the pool starts to beat parsing in-process.
+    workers = parsepool.PARSE_POOL_WORKERS
+
+    def pooled(raw: bytes)->list:
+        return parsepool.unpack_page(DmvSummary, parsepool.submit(DmvSummary, raw, "PUBLICDATA", "TX").result())
+
+    # Start the workers before timing anything.
+    list(parsepool.get_pool().map(parsepool.parse_page, [DmvSummary] * workers, [dmv_page(1)] * workers,
+                                  ["PUBLICDATA"] * workers, ["TX"] * workers))
+
+    print("{:>8} {:>12} {:>12} {:>22}".format("records", "inline ms", "pool ms", "request thread ms"))
+    for number in [100, 250, 500, 1000, 2000, 5000]:
+        raw = dmv_page(number)
+        assert records_to_dicts(summaries(DmvSummary, raw, "TX")) == records_to_dicts(pooled(raw))
+        repeat = max(3, 20000 // number)
+        inline_ms = timeit.timeit(lambda: summaries(DmvSummary, raw, "TX"), number=repeat) / repeat * 1e3
+        pool_ms = timeit.timeit(lambda: pooled(raw), number=repeat) / repeat * 1e3
+
+        # Time the pool would leave the request thread holding the GIL: just the rebuild.
+        page = parsepool.parse_page(DmvSummary, raw, "PUBLICDATA", "TX")
+        thread_ms = timeit.timeit(lambda: parsepool.unpack_page(DmvSummary, page), number=repeat) / repeat * 1e3
+        print("{:>8} {:>12.2f} {:>12.2f} {:>22.2f}".format(number, inline_ms, pool_ms, thread_ms))
+
+    # Several large pages at once, e.g. concurrent searches: the pool parses them in parallel.
+    pages = [dmv_page(2000) for i in range(workers)]
+    inline_ms = timeit.timeit(lambda: [summaries(DmvSummary, raw, "TX") for raw in pages], number=3) / 3 * 1e3
+    pool_ms = timeit.timeit(
+        lambda: [parsepool.unpack_page(DmvSummary, future.result())
+                 for future in [parsepool.submit(DmvSummary, raw, "PUBLICDATA", "TX") for raw in pages]], number=3) / 3 * 1e3
+    print("{} pages of 2000 records: inline {:.1f} ms, pool {:.1f} ms".format(len(pages), inline_ms, pool_ms))
+
+
+def depreciation():
+    # depreciation_schedules() compared with WebService.amortization_schedule(), one vehicle at a time.
+    from webservice import WebService
+
+    random.seed(2019)
+    this_year = int(datetime.now().strftime("%Y"))
+    vehicles = []
+    for i in range(10000):
+        year = random.randint(this_year - 20, this_year + 1)
+        title = random.choice([
+            "{}0615".format(year + random.randint(-1, 8)), "{}0101".format(year), "", None, "00000000", "bad"])
+        price = random.choice([random.randint(500, 90000) + 0.37, random.randint(500, 90000), 0, "1500"])
+        vehicles.append({"year": str(year), "sold_price": price, "title_date": title, "sold_date": "20190101"})
+
+    def scalar():
+        return [WebService.amortization_schedule(None, vehicle) for vehicle in vehicles]
+
+    def batch():
+        return depreciation_schedules(
+            [v["year"] for v in vehicles],
+            [v["sold_price"] for v in vehicles],
+            [v["title_date"] for v in vehicles],
+            [v["sold_date"] for v in vehicles])
+
+    print("Same result:", scalar() == batch().results())
+    number = 5
+    print("Scalar: {:.1f} ms for {} vehicles".format(timeit.timeit(scalar, number=number) / number * 1e3, len(vehicles)))
+    print("Batch:  {:.1f} ms for {} vehicles".format(timeit.timeit(batch, number=number) / number * 1e3, len(vehicles)))
+
+
+BENCHMARKS = {
+    "memory": memory,
+    "serialization": serialization,
+    "details-mapping": details_mapping,
+    "backends": backends,
+    "parse-pool": parse_pool,
+    "depreciation": depreciation,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit("Unknown benchmark: {}. Choose from: {}".format(", ".join(unknown), ", ".join(BENCHMARKS)))
+
+    for name in names:
+        print("== {}".format(name))
+        BENCHMARKS[name]()
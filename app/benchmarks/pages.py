@@ -0,0 +1,102 @@
+"""
+pages.py - Synthetic PublicData and Zillow responses for the benchmarks.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from util.classes.dmvdetails import DmvDetails
+from util.classes.rpdetails import RealPropertyDetails
+
+RP_COUNTIES = ["Collin County (Texas)", "Garland County (Arkansas)", "Washington County (Arkansas)"]
+
+ZILLOW = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<SearchResults:searchresults xmlns:SearchResults="http://www.zillow.com/static/xsd/SearchResults.xsd">'
+    b'<message><text>Request successfully processed</text><code>0</code></message>'
+    b'<response><results><result><zpid>48749425</zpid>'
+    b'<links><homedetails>https://www.zillow.com/homedetails/48749425_zpid/</homedetails>'
+    b'<comparables>https://www.zillow.com/homes/comps/48749425_zpid/</comparables></links>'
+    b'<address><street>2114 Bigelow Ave N</street><zipcode>98109</zipcode><city>SEATTLE</city><state>WA</state>'
+    b'<latitude>47.637933</latitude><longitude>-122.347938</longitude></address>'
+    b'<zestimate><amount currency="USD">1219500</amount></zestimate></result></results></response>'
+    b'</SearchResults:searchresults>')
+
+ERROR = b'<pd type="error"><pdheaders><pdheader1>Invalid login. &lt;Try again&gt;</pdheader1></pdheaders></pd>'
+
+
+def search_page(records: str)->bytes:
+    """
+    Wrap <record> elements in a search response.
+    """
+    return '<pd type="search"><results ismore="false" searchmoreid="">{}</results></pd>'.format(records).encode()
+
+
+def dmv_page(number: int)->bytes:
+    """
+    Search response with *number* Texas vehicle records.
+    """
+    return search_page("".join(
+        '<record db="txdmv" ed="20190701" rec="{0}">'
+        '<disp_fld1>DALEY, THOMAS {0}</disp_fld1><disp_fld2>Y/M/M: 2010 FORD F150</disp_fld2>'
+        '<disp_fld3>Plate: ABC{0}</disp_fld3><disp_fld5>XYZ{0}</disp_fld5>'
+        '<source>Texas Motor Vehicles &amp; Registrations</source></record>'.format(i) for i in range(number)))
+
+
+def dl_page(number: int)->bytes:
+    """
+    Search response with *number* Florida driver's license records.
+    """
+    return search_page("".join(
+        '<record db="fldl" ed="20190701" rec="{0}">'
+        '<disp_fld1>DALEY, THOMAS {0}</disp_fld1><disp_fld2>Date of Birth: 19600829</disp_fld2>'
+        '<disp_fld4>DL Number: P2352106{0:05d}</disp_fld4><disp_fld5>City, State ZIP Code: MIAMI , 33189</disp_fld5>'
+        '<source>Florida Driver Licenses</source></record>'.format(i) for i in range(number)))
+
+
+def rp_page(number: int)->bytes:
+    """
+    Search response with *number* real property records, from counties with
+    different mappings.
+    """
+    return search_page("".join(
+        '<record db="grp_cad_tx" ed="20190701" rec="{0}">'
+        '<disp_fld1>DALEY, THOMAS {0}</disp_fld1><disp_fld2>Owner Address: {0} MAIN ST</disp_fld2>'
+        '<disp_fld3>Property Address: {0} ELM ST</disp_fld3><disp_fld4>Address: {0} OAK ST</disp_fld4>'
+        '<source>{1} - Appraisal District</source></record>'.format(i, RP_COUNTIES[i % len(RP_COUNTIES)])
+        for i in range(number)))
+
+
+def field(label: str, value: str, **attrs)->str:
+    """
+    One <field> of a details response.
+    """
+    extra = "".join(' {}="{}"'.format(name, value) for name, value in attrs.items())
+    return '<field label="{}"{}>{}</field>'.format(label, extra, value)
+
+
+def dmv_details_page()->bytes:
+    """
+    Details response for a Texas vehicle with a lien holder.
+    """
+    labels = [m["label"] for m in DmvDetails.MAPPINGS["PUBLICDATA"]["TX"]]
+    fields = "".join(field(label, "1{}".format(i), formattedplate="P{}".format(i), formatteddate="2019070{}".format(i % 9))
+                     for i, label in enumerate(labels))
+    lien = (
+        '<dataset label="Lien Holders"><dataitem><textdata>{}{}</textdata>'
+        '<dataset label="Lien Holder Information"><dataitem><textdata>{}{}{}{}{}</textdata></dataitem></dataset>'
+        '</dataitem></dataset>').format(
+            field("Lien Holder Postion", "1"), field("Lien Date", "20130410"),
+            field("Lien Holder Name", "HYUNDAI MOTOR FINANCE"), field("Street", "PO BOX 105299"),
+            field("City", "ATLANTA"), field("State", "GA"), field("Zip Code", "30348-5299"))
+    return ('<pd type="details"><dataset><dataitem><textdata>{}</textdata>{}'
+            '</dataitem></dataset></pd>').format(fields, lien).encode()
+
+
+def rp_details_page(unmapped: int=0)->bytes:
+    """
+    Details response for a Texas appraisal district record: a field for every
+    mapped label, plus *unmapped* fields that no mapping asks for.
+    """
+    labels = [m["label"] for m in RealPropertyDetails.MAPPINGS["PUBLICDATA"]["TX"]]
+    labels += ["Unmapped Field {}".format(i) for i in range(unmapped)]
+    fields = "".join(field(label, "VALUE {}".format(i)) for i, label in enumerate(labels))
+    return '<pd type="details"><dataset><dataitem><textdata>{}</textdata></dataitem></dataset></pd>'.format(fields).encode()
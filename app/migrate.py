@@ -0,0 +1,78 @@
+"""
+migrate.py - One-shot data migrations for the DiscoveryBot database.
+
+Usage:
+    python migrate.py --rekey-cache
+    python migrate.py --recompress-cache
+    python migrate.py --move-case-items
+
+@author: Thomas J. Daley, J.D.
+@version: 0.0.1
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+import argparse
+
+from util.database import Database, get_database
+from util.publicdata import SOURCE as PUBLICDATA_SOURCE, canonical_query_key
+
+
+def rekey_cache(database: Database):
+    """
+    Re-key PublicData search_cache entries from full URLs (which contain per-login
+    credentials) to canonical, session-independent query keys.
+    """
+    count = database.rekey_cache(PUBLICDATA_SOURCE, canonical_query_key)
+    print("Re-keyed {} PublicData cache entries.".format(count))
+
+
+def recompress_cache(database: Database):
+    """
+    Rewrite pickled ElementTree search_cache entries as compressed raw XML.
+    """
+    count = database.recompress_cache()
+    print("Recompressed {} cache entries.".format(count))
+
+
+def move_case_items(database: Database):
+    """
+    Move items embedded in case documents into the case_items collection.
+    """
+    count = database.move_case_items()
+    print("Moved the items of {} cases.".format(count))
+
+
+def main(args):
+    database = get_database()
+    if not database.connect():
+        print("Unable to connect to database.")
+        return
+
+    if args.rekey_cache:
+        rekey_cache(database)
+
+    if args.recompress_cache:
+        recompress_cache(database)
+
+    if args.move_case_items:
+        move_case_items(database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data migrations for DiscoveryBot")
+    parser.add_argument(
+        "--rekey-cache",
+        help="Re-key PublicData search_cache entries to canonical query keys",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--recompress-cache",
+        help="Rewrite pickled XML search_cache entries as compressed raw XML",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--move-case-items",
+        help="Move items embedded in case documents into the case_items collection",
+        action="store_true"
+    )
+    args = parser.parse_args()
+    main(args)
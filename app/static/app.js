@@ -274,9 +274,9 @@ var controller = {
         let db = button.getAttribute("data-db");
         let ed = button.getAttribute("data-ed");
         let rec = button.getAttribute("data-rec");
-        let operation = button.getAttribute("data-op")
-        let category = button.getAttribute("data-category")
-        let description = button.getAttribute("data-description")
+        let operation = button.getAttribute("data-op");
+        let category = button.getAttribute("data-category");
+        let description = button.getAttribute("data-description");
         //let case_id = rivets_binding.data.case.id;
 
         let payload = {
@@ -298,12 +298,75 @@ var controller = {
         .done(function( msg ) 
         {
             console.log(msg);
-            if (msg.success)
+            if (msg.success && !controller.showCaseItemStatus(category, [payload], operation))
             {
                 document.location.reload(true);
             }
         });
     },
+
+    updateAllCaseItems: function (event, rivets_binding)
+    {
+        // Apply the clicked operation to every item on the page that still offers it.
+        let button = event.target;
+        let operation = button.getAttribute("data-op");
+        let category = button.getAttribute("data-category");
+        let selector = `button[data-op="${operation}"][data-category="${category}"][data-rec]:not([hidden])`;
+        let items = Array.from(document.querySelectorAll(selector)).map(function (item)
+        {
+            let db = item.getAttribute("data-db");
+            let ed = item.getAttribute("data-ed");
+            let rec = item.getAttribute("data-rec");
+            return {
+                db: db,
+                ed: ed,
+                rec: rec,
+                description: item.getAttribute("data-description"),
+                key: `PUBLICDATA:${db}.${ed}.${rec}`};
+        });
+
+        let payload = {
+            category: category,
+            op: operation,
+            items: JSON.stringify(items)};
+        console.log(payload);
+        $.ajax(
+        {
+            method: "POST",
+            url: "/case/update_items/bulk/",
+            data: payload
+        })
+        .done(function( msg ) 
+        {
+            console.log(msg);
+            if (msg.success)
+            {
+                controller.showCaseItemStatus(category, items, operation);
+            }
+        });
+    },
+
+    showCaseItemStatus: function (category, items, operation)
+    {
+        // Once *operation* has been applied to *items*, hide each item's button for it
+        // and show the one that undoes it. Returns how many items have that button.
+        let undo = operation == "add" ? "del" : "add";
+        let updated = 0;
+        items.forEach(function (item)
+        {
+            let selector = `button[data-category="${category}"][data-db="${item.db}"][data-ed="${item.ed}"][data-rec="${item.rec}"]`;
+            document.querySelectorAll(selector).forEach(function (button)
+            {
+                let op = button.getAttribute("data-op");
+                button.hidden = op == operation;
+                if (op == undo)
+                {
+                    updated += 1;
+                }
+            });
+        });
+        return updated;
+    },
 };
 
 var app = {
@@ -0,0 +1,24 @@
+"""
+conftest.py - Shared test setup.
+
+The modules under test import each other as "util.*", as they do when the app
+is run from the app directory, so that directory has to be on the path. The
+database module exits at import time if DB_URL is not set; no test connects.
+"""
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(APP_DIR, "tests", "fixtures")
+
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("DB_URL", "mongodb://localhost:27017/")
+
+
+def fixture(name: str) -> bytes:
+    """
+    Read a response from tests/fixtures. The responses are synthetic, written
+    to be shaped like what PublicData and Zillow send us, not captured from them.
+    """
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
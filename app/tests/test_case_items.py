@@ -0,0 +1,169 @@
+"""
+test_case_items.py - Concurrent changes to a case's items must not be lost.
+
+The tests run against the MongoDB server at MONGO_TEST_URL, in a scratch database
+that is dropped afterwards. Without one they run against mongomock, except the
+tests marked "races": mongomock serializes operations, so threads can't race in it.
+mongomock can't take the *sort* argument that pymongo 4.11 and later pass to bulk
+updates, so the tests are skipped with those versions. See requirements-test.txt.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import os
+import uuid
+
+import pytest
+
+from bson.objectid import ObjectId
+
+from util import database
+
+EMAIL = "lawyer@example.com"
+CATEGORY = "PROPERTY:VEHICLE"
+THREADS = 8
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+races = pytest.mark.skipif(not MONGO_TEST_URL, reason="Threads only race against a real server. Set MONGO_TEST_URL.")
+
+
+def mongomock_client():
+    mongomock = pytest.importorskip("mongomock")
+    if "sort" not in inspect.signature(mongomock.collection.BulkOperationBuilder.add_update).parameters:
+        import pymongo
+        if pymongo.version_tuple >= (4, 11):
+            pytest.skip("mongomock {} can't run bulk updates from pymongo {}. Set MONGO_TEST_URL or see requirements-test.txt."
+                        .format(mongomock.__version__, pymongo.version))
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    if MONGO_TEST_URL:
+        import pymongo
+        client = pymongo.MongoClient(MONGO_TEST_URL)
+        name = "pdws_test_{}".format(uuid.uuid4().hex[:8])
+        monkeypatch.setattr(database, "DB_NAME", name)
+    else:
+        client = mongomock_client()
+        name = None
+    monkeypatch.setattr(database, "get_client", lambda: client)
+    monkeypatch.setattr(database, "CASE_ITEMS_INDEXED", False)
+    monkeypatch.setattr(database, "USER_IDS", {})
+    yield database.Database()
+    if name:
+        client.drop_database(name)
+        client.close()
+
+
+@pytest.fixture
+def case_id(db):
+    user_id = db.dbconn[database.USER_TABLE].insert_one({"email": EMAIL}).inserted_id
+    return str(db.dbconn[database.CASE_TABLE].insert_one({"user_id": user_id, "cause_number": "123"}).inserted_id)
+
+
+def item(number: int) -> dict:
+    return {"plate": "ABC{}".format(number), "year_make_model": "2010 FORD F150"}
+
+
+@races
+def test_parallel_toggles_of_different_items(db, case_id):
+    # Each toggle includes one item; if any update overwrote another, items would be missing.
+    keys = ["PUBLICDATA:txdmv.1.{}".format(number) for number in range(200)]
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(
+            lambda pair: db.toggle_case_item(EMAIL, case_id, CATEGORY, pair[1], item(pair[0]), include=True),
+            enumerate(keys)))
+
+    assert all(results)
+    (included, excluded) = db.get_case_item_keys(EMAIL, case_id, CATEGORY)
+    assert included == set(keys)
+    assert excluded == set()
+    assert db.count_case_items(EMAIL, case_id) == {CATEGORY: len(keys)}
+
+
+@races
+def test_parallel_toggles_of_the_same_item(db, case_id):
+    # The item must end up in exactly one state, not both, and be stored once.
+    key = "PUBLICDATA:txdmv.1.1"
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(
+            lambda number: db.toggle_case_item(EMAIL, case_id, CATEGORY, key, item(number), include=number % 2 == 0),
+            range(100)))
+
+    assert all(results)
+    (included, excluded) = db.get_case_item_keys(EMAIL, case_id, CATEGORY)
+    assert len(included) + len(excluded) == 1
+    assert db.case_items().count_documents({"key": key}) == 1
+
+
+@races
+def test_parallel_bulk_toggles(db, case_id):
+    # Pages of results toggled at once, each page by its own thread, with every page excluded afterwards.
+    pages = [{"PUBLICDATA:txdmv.{}.{}".format(page, number): item(number) for number in range(25)} for page in range(THREADS)]
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        assert all(executor.map(lambda items: db.toggle_case_items(EMAIL, case_id, CATEGORY, items, include=True), pages))
+        assert all(executor.map(lambda items: db.toggle_case_items(EMAIL, case_id, CATEGORY, items, include=False), pages))
+
+    (included, excluded) = db.get_case_item_keys(EMAIL, case_id, CATEGORY)
+    assert included == set()
+    assert excluded == {key for items in pages for key in items}
+
+
+def test_other_users_case_is_not_changed(db, case_id):
+    other_id = db.dbconn[database.USER_TABLE].insert_one({"email": "other@example.com"}).inserted_id
+    other_case_id = str(db.dbconn[database.CASE_TABLE].insert_one({"user_id": other_id, "cause_number": "456"}).inserted_id)
+
+    assert db.toggle_case_item("other@example.com", other_case_id, CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+    assert db.get_case_item_keys(EMAIL, case_id, CATEGORY) == (set(), set())
+    assert db.get_case_item_keys(EMAIL, other_case_id, CATEGORY) == (set(), set())
+    assert db.case_items().count_documents({"case_id": ObjectId(other_case_id)}) == 1
+
+
+def test_mark_case_status(db, case_id):
+    from util.classes.dmvsummary import DmvSummary
+    from util.resultset import SearchResultSet
+
+    records = []
+    for number in range(3):
+        record = DmvSummary()
+        (record.source, record.db, record.ed, record.rec) = ("PUBLICDATA", "txdmv", "1", str(number))
+        records.append(record)
+    db.toggle_case_item(EMAIL, case_id, CATEGORY, records[0].key(), item(0), include=True)
+    db.toggle_case_item(EMAIL, case_id, CATEGORY, records[1].key(), item(1), include=False)
+
+    result_set = SearchResultSet.from_records(records, DmvSummary)
+    db.mark_case_status(records, EMAIL, case_id, CATEGORY)
+    db.mark_case_status(result_set, EMAIL, case_id, CATEGORY)
+
+    assert [record.case_status for record in records] == ["I", "X", "N"]
+    assert list(result_set.column("case_status")) == ["I", "X", "N"]
+
+
+def test_items_are_only_added_to_the_users_own_case(db, case_id):
+    other_id = db.dbconn[database.USER_TABLE].insert_one({"email": "other@example.com"}).inserted_id
+    other_case_id = str(db.dbconn[database.CASE_TABLE].insert_one({"user_id": other_id, "cause_number": "456"}).inserted_id)
+
+    for bad_case_id in ["not-an-id", str(ObjectId()), other_case_id]:
+        assert not db.toggle_case_item(EMAIL, bad_case_id, CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+        assert not db.add_to_case(EMAIL, bad_case_id, CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+    assert db.case_items().count_documents({}) == 0
+
+
+def test_items_are_only_removed_from_the_users_own_case(db, case_id):
+    other_id = db.dbconn[database.USER_TABLE].insert_one({"email": "other@example.com"}).inserted_id
+    other_case_id = str(db.dbconn[database.CASE_TABLE].insert_one({"user_id": other_id, "cause_number": "456"}).inserted_id)
+    assert db.toggle_case_item("other@example.com", other_case_id, CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+
+    assert not db.del_from_case(EMAIL, "not-an-id", CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+    db.del_from_case(EMAIL, other_case_id, CATEGORY, "PUBLICDATA:txdmv.1.1", item(1))
+    assert db.get_case_item_keys(EMAIL, other_case_id, CATEGORY) == (set(), set())
+    assert db.get_case_item_keys("other@example.com", other_case_id, CATEGORY) == ({"PUBLICDATA:txdmv.1.1"}, set())
+
+
+def test_deleting_a_case_deletes_its_items(db, case_id):
+    db.toggle_case_items(EMAIL, case_id, CATEGORY, {"PUBLICDATA:txdmv.1.{}".format(n): item(n) for n in range(5)})
+    assert db.case_items().count_documents({}) == 5
+
+    assert db.del_case({"email": EMAIL, "cause_number": "123"})
+    assert db.dbconn[database.CASE_TABLE].count_documents({}) == 0
+    assert db.case_items().count_documents({}) == 0
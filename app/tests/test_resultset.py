@@ -0,0 +1,40 @@
+"""
+Tests for util.resultset.
+"""
+from operator import itemgetter
+
+from util.classes.dmvsummary import DmvSummary
+from util.resultset import Deduplicator, SearchResultSet
+
+
+def test_empty_result_set():
+    result_set = SearchResultSet.from_records([], DmvSummary)
+
+    assert len(result_set) == 0
+    assert result_set.record_class is DmvSummary
+    assert set(result_set.columns) == set(DmvSummary.field_names())
+    assert result_set.to_records() == []
+    assert len(result_set.page(1, 25)) == 0
+    assert len(result_set.sort("owner_name")) == 0
+    assert len(result_set.dedup()) == 0
+    assert len(result_set.keys()) == 0
+    result_set.set_where_keys({"PUBLICDATA:txdmv.1.1"}, "case_status", "I")
+
+
+def test_deduplicator_with_key_keeps_first():
+    deduplicator = Deduplicator(key=itemgetter("owner", "street"))
+    parcels = [{"owner": "A", "street": "1 MAIN", "source": source} for source in ["X", "Y"]]
+    parcels.append({"owner": "B", "street": "1 MAIN", "source": "X"})
+
+    kept = [parcel for parcel in parcels if deduplicator.add(parcel)]
+
+    assert [parcel["source"] for parcel in kept] == ["X", "X"]
+    assert deduplicator.stats() == {"records": 3, "unique": 2, "duplicates": 1, "ratio": 0.3333}
+
+
+def test_deduplicator_counts_merged_records():
+    deduplicator = Deduplicator(key=itemgetter("owner"))
+    deduplicator.add({"owner": "A"})
+    deduplicator.count_merged(3)
+
+    assert deduplicator.stats() == {"records": 4, "unique": 1, "duplicates": 3, "ratio": 0.75}
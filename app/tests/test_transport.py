@@ -0,0 +1,79 @@
+"""
+test_transport.py - Billable requests must not be sent twice.
+"""
+from http.client import RemoteDisconnected
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from util import transport
+
+URL = "https://search.example.com/pdsearch.php?p1=daley"
+
+
+class FakeSession(object):
+    """
+    Stands in for requests.Session, raising each of *errors* in turn and then
+    returning a response.
+    """
+    def __init__(self, errors: list):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+def disconnected() -> requests.ConnectionError:
+    # What requests raises when the server drops the connection after the request was sent.
+    return requests.ConnectionError(ProtocolError("Connection aborted.", RemoteDisconnected("Remote end closed connection")))
+
+
+def refused() -> requests.ConnectionError:
+    # What requests raises when the connection can't be made.
+    return requests.ConnectionError(MaxRetryError(None, URL, NewConnectionError(None, "Connection refused")))
+
+
+@pytest.fixture
+def make_transport(monkeypatch):
+    def make(errors: list) -> (transport.Transport, FakeSession):
+        session = FakeSession(errors)
+        instance = transport.Transport(max_retries=2)
+        instance.session("https://search.example.com")  # Sets up the host's counters.
+        monkeypatch.setattr(instance, "session", lambda host: session)
+        monkeypatch.setattr(instance, "backoff", lambda attempt: 0)
+        return (instance, session)
+    return make
+
+
+def test_billable_request_is_not_retried_after_disconnect(make_transport):
+    (instance, session) = make_transport([disconnected()])
+    with pytest.raises(requests.ConnectionError):
+        instance.get(URL, billable=True)
+    assert session.calls == 1
+
+
+def test_billable_request_is_not_retried_after_read_timeout(make_transport):
+    (instance, session) = make_transport([requests.exceptions.ReadTimeout()])
+    with pytest.raises(requests.Timeout):
+        instance.get(URL, billable=True)
+    assert session.calls == 1
+
+
+@pytest.mark.parametrize("error", [refused, requests.exceptions.ConnectTimeout])
+def test_billable_request_is_retried_if_never_sent(make_transport, error):
+    (instance, session) = make_transport([error()])
+    assert instance.get(URL, billable=True).status_code == 200
+    assert session.calls == 2
+
+
+def test_other_requests_are_retried_after_disconnect(make_transport):
+    (instance, session) = make_transport([disconnected(), requests.exceptions.ReadTimeout()])
+    assert instance.get(URL).status_code == 200
+    assert session.calls == 3
@@ -0,0 +1,104 @@
+"""
+test_xmlbackend.py - Both XML backends must map responses to the same records.
+
+The responses in tests/fixtures are synthetic. Besides typical pages, they cover
+character and entity references, CDATA sections, empty fields and error envelopes.
+"""
+import importlib
+
+import pytest
+
+from conftest import fixture
+from util import xmlbackend
+from util.publicdata import dmv_details_from_tree, error_message, property_details_from_tree
+from util.resultparser import ResultParser
+from util.xmldocument import XmlDocument
+from util.zillow import search_result_fields
+from util.classes.dlsummary import DlSummary
+from util.classes.dmvsummary import DmvSummary
+from util.classes.rpsummary import RealPropertySummary
+
+BACKENDS = ["stdlib", pytest.param("lxml", marks=pytest.mark.skipif(xmlbackend.LXML_ET is None, reason="lxml is not installed"))]
+
+
+def summaries(record_class, name: str, state: str) -> list:
+    return [record.to_dict() for record in record_class.from_records(ResultParser().parse(fixture(name)), "PUBLICDATA", state)]
+
+
+def error_page(name: str) -> tuple:
+    parser = ResultParser()
+    records = list(parser.parse(fixture(name)))
+    return (len(records), parser.is_error, error_message(parser.root))
+
+
+CASES = {
+    "dmv_search": lambda: summaries(DmvSummary, "dmv_search.xml", "TX"),
+    "dmv_search_edge": lambda: summaries(DmvSummary, "dmv_search_edge.xml", "TX"),
+    "dl_search": lambda: summaries(DlSummary, "dl_search.xml", "FL"),
+    "rp_search": lambda: summaries(RealPropertySummary, "rp_search.xml", "TX"),
+    "dmv_details": lambda: dmv_details_from_tree(XmlDocument(fixture("dmv_details.xml")), "TX").to_dict(),
+    "rp_details": lambda: property_details_from_tree(XmlDocument(fixture("rp_details.xml")), "TX").to_dict(),
+    "zillow_search": lambda: search_result_fields(xmlbackend.fromstring(fixture("zillow_search.xml"))),
+    "error": lambda: error_message(xmlbackend.fromstring(fixture("error.xml"))),
+    "error_envelope": lambda: error_page("error_envelope.xml"),
+    "error_message": lambda: error_message(xmlbackend.fromstring(fixture("error_message.xml"))),
+}
+
+
+@pytest.fixture
+def backend(request):
+    xmlbackend.use(request.param)
+    yield request.param
+    xmlbackend.use(xmlbackend.BACKEND_SETTING)
+
+
+@pytest.fixture(scope="module")
+def expected():
+    # What the standard library produces is what every backend must produce.
+    xmlbackend.use("stdlib")
+    try:
+        return {case: function() for case, function in CASES.items()}
+    finally:
+        xmlbackend.use(xmlbackend.BACKEND_SETTING)
+
+
+def test_stdlib_is_default(monkeypatch):
+    # lxml is slower on the summary pages, so it has to be asked for.
+    monkeypatch.delenv("PDWS_XML_BACKEND", raising=False)
+    importlib.reload(xmlbackend)
+    assert xmlbackend.backend_name() == "stdlib"
+
+
+def test_invalid_setting():
+    with pytest.raises(ValueError):
+        xmlbackend.select_backend("expat")
+
+
+def test_fixtures_have_records(expected):
+    assert len(expected["dmv_search"]) == 5
+    assert expected["dmv_search"][0]["plate"] == "ABC0"
+    assert len(expected["dl_search"]) == 5
+    assert len(expected["rp_search"]) == 6
+    assert expected["dmv_details"]["lien_holders"]
+    assert expected["rp_details"]["property_county"] == "Collin"
+    assert expected["error"] == "Invalid login. <Try again>"
+
+
+def test_fixture_edge_cases(expected):
+    (entities, cdata, empty) = expected["dmv_search_edge"]
+    assert entities["owner_name"] == "O'BRIEN & SONS <TRUST>"
+    assert entities["year_make_model"] == "2012 CITRO\u00cbN C4"
+    assert entities["plate"] == "ABC100"
+    assert cdata["owner_name"] == "SMITH & JONES <LLC>"
+    assert cdata["year_make_model"] == "2015 FORD F150"
+    assert cdata["prev_plate"] is None
+    assert (empty["year_make_model"], empty["plate"]) == (None, None)
+    assert expected["error_envelope"] == (0, True, 'Search "DALEY" could not be completed & was not billed.')
+    assert expected["error_message"] == "Session expired. Please <login> again."
+
+
+@pytest.mark.parametrize("backend", BACKENDS, indirect=True)
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_backends_agree(backend, case, expected):
+    assert xmlbackend.backend_name() == backend
+    assert CASES[case]() == expected[case]
@@ -3,23 +3,75 @@ baserecord.py - Class that other data classes extend.
 
 Copyright (c) 2019 by Thomas J. Daley, J.D.
 """
+import hashlib
 import json
+from operator import attrgetter
+
+from util import xmlbackend
+
+# Compiled label mappings: id(mappings) -> (mappings, compiled). See compile_mappings().
+COMPILED_MAPPINGS = {}
+
+# Compiled path mappings: (XML backend, id(mappings)) -> (mappings, compiled). See compile_path_mappings().
+COMPILED_PATH_MAPPINGS = {}
+
+# Serialization schema of each record class: class -> (field names, attrgetter). See record_schema().
+SCHEMAS = {}
 
 
 class BaseRecord(object):
 
+    # Subclasses list their attributes in __slots__, so that instances do not each
+    # carry a __dict__. Subclasses that do not, e.g. Case, get one as usual.
+    __slots__ = ()
+
     MAPPINGS = []
+    MAPPINGS_VERSION = None
+
+    @classmethod
+    def field_names(cls)->tuple:
+        """
+        Get the names of the attributes declared in __slots__ by this class and
+        its ancestors.
+        """
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get("__slots__", ()):
+                if name not in names:
+                    names.append(name)
+        return tuple(names)
+
+    @classmethod
+    def serializable_fields(cls)->tuple:
+        """
+        Get the names of the attributes that to_dict() includes. Worked out once
+        per class: the attributes declared in __slots__, which list everything
+        __init__() and the MAPPINGS tables set.
+        """
+        schema = SCHEMAS.get(cls)
+        if schema is None:
+            schema = record_schema(cls)
+        return schema[0]
 
     def to_dict(self)->dict:
         """
-        Get dict representation of this instance.
+        Get dict representation of this instance. Lists of records, e.g. lien
+        holders, are converted too.
         """
-        result = {}
-        for attr in [x for x in dir(self) if x[:2] != "__"]:
-            value = getattr(self, attr)
-            if not callable(value):
-                result[attr] = value
+        schema = SCHEMAS.get(type(self)) or record_schema(type(self))
+        (fields, getter) = schema
 
+        if getter is None:
+            # No __slots__, so the attributes can vary from instance to instance.
+            result = dict(vars(self))
+        elif len(fields) == 1:
+            result = {fields[0]: getter(self)}
+        else:
+            result = dict(zip(fields, getter(self)))
+
+        for name, value in result.items():
+            if type(value) is list and value and isinstance(value[0], BaseRecord):
+                result[name] = [item.to_dict() for item in value]
         return result
 
     def to_json(self, indent: int=0)->str:
@@ -27,7 +79,72 @@ class BaseRecord(object):
         Get JSON-string representation of this instance
         """
         my_dict = self.to_dict()
-        return json.dumps(my_dict)
+        return json.dumps(my_dict, indent=indent or None)
+
+    def set_hash(self):
+        """
+        Compute the hash used to spot duplicate records. Subclasses that
+        are de-duplicated override this.
+        """
+        pass
+
+    def origins(self)->list:
+        """
+        List every record this one stands for. Summary records only.
+
+        Returns:
+            (list): [db, ed, rec] of this record followed by those of any
+                    duplicates merged into it.
+        """
+        return self.provenance or [[self.db, self.ed, self.rec]]
+
+    def merge(self, other):
+        """
+        Fold a duplicate of this record into it, keeping where the duplicate
+        came from. Summary records only.
+
+        Args:
+            other (BaseRecord): Record having the same hash as this one.
+        """
+        if self.provenance is None:
+            self.provenance = self.origins()
+        for origin in other.origins():
+            if origin not in self.provenance:
+                self.provenance.append(origin)
+
+    @classmethod
+    def from_results(cls, results, source: str, state: str)->list:
+        """
+        Parse every <record> in a <results> element.
+
+        Args:
+            results (ET): <results> element from a search response.
+            source (str): Source database, e.g. "PUBLICDATA"
+            state (str): U.S. State, e.g. "TX"
+
+        Returns:
+            (list): One instance per <record>, in order.
+        """
+        return list(cls.from_records(results.iterfind("record"), source, state))
+
+    @classmethod
+    def from_records(cls, elements, source: str, state: str):
+        """
+        Generator that parses <record> elements as they are produced, e.g. by a
+        ResultParser.
+
+        Args:
+            elements (iterable): <record> elements
+            source (str): Source database, e.g. "PUBLICDATA"
+            state (str): U.S. State, e.g. "TX"
+
+        Yields:
+            (object): One instance per <record>, in order.
+        """
+        for element in elements:
+            record = cls()
+            record.from_xml(element, source, state)
+            yield record
 
     def from_xml(self, root, source: str, state: str):
         """
@@ -45,30 +162,274 @@ class BaseRecord(object):
             raise ValueError("No {} mappings for this state: {}".format(source, state))
 
         mappings = self.MAPPINGS[source.upper()][state.upper()]
+        self.apply_mappings(root, mappings)
+
+    def apply_mappings(self, root, mappings: list):
+        """
+        Copy values from the <field> elements under *root* into this instance.
+
+        Each mapping names a field *label*. The first field with that label
+        supplies the value, which is taken from the field's *prop* attribute (if the
+        mapping has one) or its text, then passed through *transform*. If the
+        target attribute already has a value, the new one is appended to it by
+        concatenate(). Mappings are applied in the order they are listed.
+
+        The fields are walked once, no matter how many mappings there are.
+
+        Args:
+            root (ET): XML element to Process
+            mappings (list): List of label mappings for one source and state.
+        """
+        (labels, entries) = compile_mappings(mappings)
+
+        # Find the first field for each label we have a mapping for.
+        found = {}
+        for field in root.iter("field"):
+            label = field.get("label")
+            if label in labels and label not in found and field is not root:
+                found[label] = field
+                if len(found) == len(labels):
+                    break
+
+        for (label, prop, transform, attr) in entries:
+            elem = found.get(label)
+            if elem is None:
+                continue
+
+            value = elem.get(prop) if prop else elem.text
+            if value:
+                # See if we need to transform the data in any way.
+                if transform:
+                    value = transform(value)
+
+                # If the target attribute already has a value, append this value
+                # to the existing value.
+                existing_value = getattr(self, attr)
+                if existing_value:
+                    value = self.concatenate(existing_value, value)
+                setattr(self, attr, value)
+
+    def apply_paths(self, root, mappings: list, append: bool=False):
+        """
+        Copy values from the elements under *root* into this instance.
+
+        Each mapping names an element *path* relative to *root*. The first element
+        found supplies the value, which is taken from the element's *prop*
+        attribute (if the mapping has one) or its text, then passed through
+        *transform*, if any.
+
+        Args:
+            root (Element): XML element to Process
+            mappings (list): List of path mappings for one source and state.
+            append (bool): If the target attribute already has a value, append the
+                           new one to it by concatenate() instead of replacing it.
+        """
+        for (finder, prop, transform, attr) in compile_path_mappings(mappings):
+            elems = finder(root)
+            if not elems:
+                continue
+
+            value = elems[0].get(prop) if prop else elems[0].text
+            if value:
+                if transform:
+                    value = transform(value)
+                if append:
+                    existing_value = getattr(self, attr)
+                    if existing_value:
+                        value = self.concatenate(existing_value, value)
+                setattr(self, attr, value)
+
+    def concatenate(self, existing_value, value):
+        """
+        Combine two values mapped to the same attribute.
+        """
+        return existing_value + " / " + value
+
+
+def compile_mappings(mappings: list)->tuple:
+    """
+    Compile a list of label mappings, e.g. MAPPINGS["PUBLICDATA"]["TX"], into the
+    form apply_mappings() uses. Each list is compiled only once.
+
+    Args:
+        mappings (list): List of label mappings.
+
+    Returns:
+        (tuple): Set of labels mapped, and a (label, prop, transform, attr)
+                 tuple for each mapping, in order.
+    """
+    cached = COMPILED_MAPPINGS.get(id(mappings))
+    if cached and cached[0] is mappings:
+        return cached[1]
+
+    entries = tuple(
+        (mapping["label"], mapping.get("prop"), mapping.get("transform"), mapping["attr"])
+        for mapping in mappings)
+    compiled = (frozenset(entry[0] for entry in entries), entries)
+
+    # Keep a reference to *mappings* so its id() can't be reused by another list.
+    COMPILED_MAPPINGS[id(mappings)] = (mappings, compiled)
+    return compiled
+
+
+def compile_path_mappings(mappings: list)->tuple:
+    """
+    Compile a list of path mappings, e.g. MAPPINGS["PUBLICDATA"]["TX"], into the
+    form apply_paths() uses. Each list is compiled once for each XML backend,
+    so with lxml the paths are evaluated as compiled XPath expressions.
+
+    Args:
+        mappings (list): List of path mappings.
+
+    Returns:
+        (tuple): A (finder, prop, transform, attr) tuple for each mapping, in order.
+                 See xmlbackend.compile_path().
+    """
+    key = (xmlbackend.backend_name(), id(mappings))
+    cached = COMPILED_PATH_MAPPINGS.get(key)
+    if cached and cached[0] is mappings:
+        return cached[1]
+
+    compiled = tuple(
+        (xmlbackend.compile_path(mapping["path"]), mapping.get("prop"), mapping.get("transform"), mapping["attr"])
+        for mapping in mappings)
+
+    # Keep a reference to *mappings* so its id() can't be reused by another list.
+    COMPILED_PATH_MAPPINGS[key] = (mappings, compiled)
+    return compiled
+
+
+def record_schema(record_class)->tuple:
+    """
+    Work out which attributes of a record class are serialized and how to get
+    them all in one call. Results are remembered in SCHEMAS.
+
+    Args:
+        record_class (class): BaseRecord subclass
+
+    Returns:
+        (tuple): (field names, attrgetter for those fields). The attrgetter is None
+                 for classes without __slots__, whose fields vary by instance.
+    """
+    fields = record_class.field_names()
+    if "__dict__" in dir(record_class) or not fields:
+        schema = (fields, None)
+    else:
+        schema = (fields, attrgetter(*fields))
+    SCHEMAS[record_class] = schema
+    return schema
+
+
+def records_to_dicts(records: list)->list:
+    """
+    Convert a list of records to a list of dicts, e.g. for a template or the session.
+
+    Args:
+        records (list): BaseRecord instances
+
+    Returns:
+        (list): One dict per record, in order.
+    """
+    return [record.to_dict() for record in records]
+
+
+def records_to_json(records: list, indent: int=0)->str:
+    """
+    Convert a list of records to a JSON array.
+
+    Args:
+        records (list): BaseRecord instances
+        indent (int): JSON indentation. 0 for the most compact output.
+
+    Returns:
+        (str): JSON array with one object per record.
+    """
+    return json.dumps(records_to_dicts(records), indent=indent or None)
+
+
+def short_hash(text: str)->str:
+    """
+    Get a short digest of *text*, used to spot duplicate records.
+
+    Args:
+        text (str): Text to digest.
+
+    Returns:
+        (str): 16 hex digits.
+    """
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def mappings_version(mappings)->str:
+    """
+    Get a fingerprint of a MAPPINGS table, including the code of any transform
+    functions it refers to. The fingerprint changes whenever the table does, so
+    it can be made part of a cache key.
+
+    Args:
+        mappings (dict): MAPPINGS table
+
+    Returns:
+        (str): Short hex digest.
+    """
+    return hashlib.md5(describe(mappings).encode()).hexdigest()[:12]
+
+
+def describe(value)->str:
+    # Stable text description of a mapping table entry. Functions are described by
+    # name and bytecode because their repr() includes a memory address.
+    if isinstance(value, dict):
+        return "{" + ",".join("{!r}:{}".format(k, describe(value[k])) for k in sorted(value)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(describe(v) for v in value) + "]"
+    if callable(value) and hasattr(value, "__code__"):
+        return "{}.{}:{}".format(value.__module__, value.__qualname__, describe_code(value.__code__))
+    return repr(value)
+
+
+def describe_code(code)->str:
+    consts = [describe_code(c) if hasattr(c, "co_code") else repr(c) for c in code.co_consts]
+    return hashlib.md5(code.co_code + "|".join(consts).encode()).hexdigest()
+
+
+def pack_records(records: list)->dict:
+    """
+    Store a list of records in compact, JSON-serializable form: one list of field
+    names and one row of values per record.
+
+    Args:
+        records (list): Instances of one BaseRecord subclass.
+
+    Returns:
+        (dict): {"fields": [...], "rows": [[...], ...]}
+    """
+    if not records:
+        return {"fields": [], "rows": []}
+
+    fields = list(type(records[0]).field_names())
+    rows = [[getattr(record, name) for name in fields] for record in records]
+    return {"fields": fields, "rows": rows}
+
+
+def unpack_records(record_class, packed: dict)->list:
+    """
+    Rebuild a list of records saved by pack_records().
+
+    Args:
+        record_class (class): BaseRecord subclass the records were made from.
+        packed (dict): Result of pack_records()
 
-        # ET.dump(root)
-
-        for mapping in mappings:
-            path = ".//field[@label='{}']".format(mapping["label"])
-
-            elem = root.findall(path)
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
-
-                if value:
-                    # See if we need to transform the data in any way.
-                    if "transform" in mapping and mapping["transform"]:
-                        value = mapping["transform"](value)
-
-                    # If the target attribute already has a value, append this value
-                    # to the existing value.
-                    if getattr(self, mapping["attr"]):
-                        existing_value = getattr(self, mapping["attr"])
-                        value = existing_value + " / " + value
-                    setattr(self, mapping["attr"], value)
-            else:
-                # print("\tnot found")
-                pass
+    Returns:
+        (list): Instances of *record_class*
+    """
+    fields = packed["fields"]
+    compute_hash = "hash" not in fields  # Lists packed before the hash was kept
+    records = []
+    for row in packed["rows"]:
+        record = record_class()
+        for name, value in zip(fields, row):
+            setattr(record, name, value)
+        if compute_hash:
+            record.set_hash()
+        records.append(record)
+    return records
@@ -73,6 +73,12 @@ class DlDetails(BaseRecord):
     """
     Driver's License record.
     """
+    __slots__ = (
+        "first_name", "middle_name", "last_name", "suffix", "address", "linkable_address",
+        "city", "state", "zip_code", "race", "sex", "height", "dob", "license_number",
+        "license_type", "issue_date"
+    )
+
     MAPPINGS = {}
     MAPPINGS["PUBLICDATA"] = {}
     MAPPINGS["PUBLICDATA"]["TX"] = [
@@ -3,11 +3,10 @@ dlsummary.py - Standard representation of a Driver's License summary record.
 
 Copyright (c) 2019 by Thomas J. Daley, J.D.
 """
-import hashlib
 import re
 import xml.etree.ElementTree as ET
 
-from .baserecord import BaseRecord
+from .baserecord import BaseRecord, mappings_version, short_hash
 
 
 def clean_string(s):
@@ -90,6 +89,14 @@ class DlSummary(BaseRecord):
     """
     Driver's License record.
     """
+    __slots__ = (
+        "driver_name", "dob", "address", "dl_number", "data_source", "db", "ed", "rec",
+        "source", "state", "hash", "case_status", "provenance"
+    )
+
+    MAPPINGS = MAPPINGS
+    MAPPINGS_VERSION = mappings_version(MAPPINGS)
+
     def __init__(self):
         """
         Initialize an instance.
@@ -108,6 +115,7 @@ class DlSummary(BaseRecord):
         self.hash = None
 
         self.case_status = "N"  # (I)ncluded, e(X)cluded, or (N)either
+        self.provenance = None  # [db, ed, rec] of every duplicate merged into this record
 
     def __str__(self):
         return "Driver name: {} || DOB: {} || Source: {} || State: {}" \
@@ -139,18 +147,13 @@ class DlSummary(BaseRecord):
         self.source = source
         self.state = state
 
-        for mapping in mappings:
-            elem = root.findall(mapping["path"])
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
+        self.apply_paths(root, mappings)
 
-                if value:
-                    if mapping["transform"]:
-                        value = mapping["transform"](value)
-                    setattr(self, mapping["attr"], value)
+        self.set_hash()
 
+    def set_hash(self):
+        """
+        Compute the hash used to spot duplicate records.
+        """
         hash_input = "{}{}".format(self.driver_name, self.dob)
-        self.hash = hashlib.md5(hash_input.encode())
+        self.hash = short_hash(hash_input)
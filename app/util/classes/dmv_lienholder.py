@@ -47,6 +47,10 @@ class DmvLienHolder(BaseRecord):
     """
     DMV Lien Holder record.
     """
+    __slots__ = (
+        "position", "number", "date", "name", "street", "city_state_zip", "country"
+    )
+
     MAPPINGS = {}
     MAPPINGS["PUBLICDATA"] = {}
     MAPPINGS["PUBLICDATA"]["TX"] = [
@@ -99,30 +103,12 @@ class DmvLienHolder(BaseRecord):
 
         mappings = self.MAPPINGS[source.upper()][state.upper()]
 
-        # ET.dump(root)
-
-        for mapping in mappings:
-            path = mapping["path"]
-            #print("looking for", path)
-            elem = root.findall(path)
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
-
-                #print("\tfound:", value)
-                if value:
-                    # See if we need to transform the data in any way.
-                    if "transform" in mapping and mapping["transform"]:
-                        value  = mapping["transform"](value)
-
-                    # If the target attribute already has a value, append this value
-                    # to the existing value.
-                    if getattr(self, mapping["attr"]):
-                        existing_value = getattr(self, mapping["attr"])
-                        value = existing_value + " " + value
-                    setattr(self, mapping["attr"], value)
-            else:
-                #print("\tnot found")
-                pass
+        # If a value is found for an attribute that already has one, e.g. the
+        # city, state and ZIP code, it is appended to the existing value.
+        self.apply_paths(root, mappings, append=True)
+
+    def concatenate(self, existing_value, value):
+        """
+        Combine two values mapped to the same attribute, e.g. city, state and ZIP code.
+        """
+        return existing_value + " " + value
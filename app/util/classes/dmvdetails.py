@@ -89,6 +89,15 @@ class DmvDetails(BaseRecord):
     """
     Department of Motor Vehicles record.
     """
+    __slots__ = (
+        "owner_city", "owner_name", "owner_state", "owner_street", "owner_zip",
+        "prev_owner_city", "prev_owner_name", "prev_owner_state", "prev_owner_street",
+        "prev_owner_zip", "notice_city", "notice_name", "notice_state", "notice_street",
+        "notice_zip", "plate", "prev_plate", "vin", "title_date", "sold_date", "sold_price",
+        "year", "make", "model", "model_desc", "body_type", "class_code", "main_color",
+        "other_color", "lien_holders", "amortization_schedule", "amortization_message"
+    )
+
     def __init__(self):
         """
         Initialize an instance.
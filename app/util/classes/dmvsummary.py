@@ -3,11 +3,10 @@ dmvsummary.py - Standard representation of a DMV summary record.
 
 Copyright (c) 2019 by Thomas J. Daley, J.D.
 """
-import hashlib
 import re
 import xml.etree.ElementTree as ET
 
-from .baserecord import BaseRecord
+from .baserecord import BaseRecord, mappings_version, short_hash
 
 
 def clean_string(s):
@@ -75,6 +74,14 @@ class DmvSummary(BaseRecord):
     """
     Department of Motor Vehicles record.
     """
+    __slots__ = (
+        "owner_name", "vin", "year_make_model", "plate", "prev_plate", "data_source", "db",
+        "ed", "rec", "source", "state", "hash", "case_status", "provenance"
+    )
+
+    MAPPINGS = MAPPINGS
+    MAPPINGS_VERSION = mappings_version(MAPPINGS)
+
     def __init__(self):
         """
         Initialize an instance.
@@ -93,6 +100,7 @@ class DmvSummary(BaseRecord):
         self.hash = None
 
         self.case_status = "N"  # (I)ncluded, e(X)cluded, or (N)either
+        self.provenance = None  # [db, ed, rec] of every duplicate merged into this record
 
     def __str__(self):
         return "Owner name: {} || VIN: {} || Year/MakeModel: {} || Plate: {} || Prev Plate: {} || Data Source: {} || Source: {} || State: {}" \
@@ -124,18 +132,13 @@ class DmvSummary(BaseRecord):
         self.source = source
         self.state = state
 
-        for mapping in mappings:
-            elem = root.findall(mapping["path"])
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
+        self.apply_paths(root, mappings)
 
-                if value:
-                    if mapping["transform"]:
-                        value = mapping["transform"](value)
-                    setattr(self, mapping["attr"], value)
+        self.set_hash()
 
+    def set_hash(self):
+        """
+        Compute the hash used to spot duplicate records.
+        """
         hash_input = "{}{}{}{}".format(self.owner_name, self.year_make_model, self.plate, self.prev_plate)
-        self.hash = hashlib.md5(hash_input.encode())
+        self.hash = short_hash(hash_input)
@@ -88,6 +88,16 @@ class RealPropertyDetails(BaseRecord):
     """
     Department of Motor Vehicles record.
     """
+    __slots__ = (
+        "property_street", "property_city", "property_state", "property_county", "property_zip",
+        "property_id", "parcel_id", "owner_name", "owner_street", "owner_city", "owner_state",
+        "owner_zip", "legal_description", "deed_date", "deed_type", "deed_location",
+        "living_area", "year_built", "beds", "baths", "stories", "units", "pool", "acres",
+        "zoning", "cad_value_year", "cad_market_value", "cad_appraised_value", "zillow",
+        "street", "csz", "latitude", "longitude", "zestimate", "zbranding", "comps_link",
+        "source", "state"
+    )
+
     def __init__(self, county: str):
         """
         Initialize an instance.
@@ -135,6 +145,9 @@ class RealPropertyDetails(BaseRecord):
         self.zbranding = None
         self.comps_link = None
 
+        self.source = None
+        self.state = None
+
     def __str__(self):
         return "{} {} {} {} {}".format(
             self.owner_name, self.property_street, self.property_city, self.property_county, self.property_zip
@@ -165,26 +178,10 @@ class RealPropertyDetails(BaseRecord):
         self.source = source
         self.state = state
 
-        for mapping in mappings:
-            path = ".//field[@label='{}']".format(mapping["label"])
-            elem = root.findall(path)
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
-
-                if value:
-                    # See if we need to transform the data in any way.
-                    if "transform" in mapping and mapping["transform"]:
-                        value = mapping["transform"](value)
-
-                    # If the target attribute already has a value, append this value
-                    # to the existing value.
-                    if getattr(self, mapping["attr"]):
-                        existing_value = getattr(self, mapping["attr"])
-                        value = str(existing_value + " " + value).strip()
-                    setattr(self, mapping["attr"], value)
-            else:
-                # print("\tnot found")
-                pass
+        self.apply_mappings(root, mappings)
+
+    def concatenate(self, existing_value, value):
+        """
+        Combine two values mapped to the same attribute, e.g. the parts of a street address.
+        """
+        return str(existing_value + " " + value).strip()
@@ -3,11 +3,10 @@ rpsummary.py - Standard representation of a Real Property summary record.
 
 Copyright (c) 2019 by Thomas J. Daley, J.D.
 """
-import hashlib
 import re
 import xml.etree.ElementTree as ET
 
-from .baserecord import BaseRecord
+from .baserecord import BaseRecord, mappings_version, short_hash
 from util.all_states import StateNameToAbbreviation
 
 
@@ -30,6 +29,13 @@ def text_after_colon(s):
         return parts[1].strip()
     return s
 
+STATE_REGEX = re.compile(r"\(([A-Za-z\s]*)")
+COUNTY_REGEX = re.compile(r"^([A-Za-z\s]*)")
+MAX_ATTRIBUTIONS = 10000  # Most number of attributions parse_attribution() remembers
+
+# Attributions we've parsed: (source, attribution) -> (state, county, mappings)
+ATTRIBUTIONS = {}
+
 MAPPINGS = {}
 MAPPINGS["PUBLICDATA"] = {}
 MAPPINGS["PUBLICDATA"]["TX"] = {
@@ -70,6 +76,14 @@ class RealPropertySummary(BaseRecord):
     """
     Real Property record.
     """
+    __slots__ = (
+        "owner_name", "owner_address", "property_address", "property_id", "parcel_id", "county",
+        "zillow", "street", "csz", "latitude", "longitude", "zestimate", "zbranding",
+        "data_source", "db", "ed", "rec", "source", "state", "hash", "case_status", "provenance"
+    )
+
+    MAPPINGS_VERSION = mappings_version(MAPPINGS)
+
     def __init__(self):
         """
         Initialize an instance.
@@ -98,6 +112,7 @@ class RealPropertySummary(BaseRecord):
         self.hash = None
 
         self.case_status = "N"  # (I)ncluded, e(X)cluded, or (N)either
+        self.provenance = None  # [db, ed, rec] of every duplicate merged into this record
 
     def __str__(self):
         return "Driver name: {} || DOB: {} || Source: {} || State: {}" \
@@ -124,40 +139,91 @@ class RealPropertySummary(BaseRecord):
         # Property searches can be nation-wide, so we need to be able to discern the state
         # by looking at the data.
         attribution = root.findall("./source")[0].text  # Expecting, e.g. "Garland County (Arkansas) - blah blah"
-        state_regex = r"\(([A-Za-z\s]*)"
-        matches = re.findall(state_regex, attribution)
-        state = StateNameToAbbreviation[matches[0].upper()]
+        self.apply_attribution(root, source, parse_attribution(source, attribution))
+
+    @classmethod
+    def from_records(cls, elements, source: str, state: str):
+        """
+        Generator that parses <record> elements as they are produced.
+
+        Args:
+            elements (iterable): <record> elements
+            source (str): Source database, e.g. "PUBLICDATA"
+            state (str): Ignored. The state of each record is taken from its attribution.
+
+        Yields:
+            (RealPropertySummary): One instance per <record>, in order.
+        """
+        if source not in MAPPINGS:
+            raise ValueError("No mappings for this source: {}".format(source))
 
-        county_regex = r"^([A-Za-z\s]*)"
-        matches = re.findall(county_regex, attribution)
-        county = matches[0].replace(" County", "").strip()
+        for record in elements:
+            summary = cls()
+            summary.apply_attribution(record, source, parse_attribution(source, record.find("source").text))
+            yield summary
 
-        if state not in MAPPINGS[source]:
-            raise ValueError("No {} mappings for this state: {}".format(source, state))
+    def apply_attribution(self, root, source: str, parsed: tuple):
+        """
+        Copy values from a <record> into this instance.
 
-        # The mappings can vary county-by-county within a state. Kill me.
-        mappings = MAPPINGS[source][state]
-        if county.upper() in mappings:
-            mappings = mappings[county.upper()]
-        else:
-            mappings = mappings["*"]
+        Args:
+            root (ET): <record> element
+            source (str): Source database, e.g. "PUBLICDATA"
+            parsed (tuple): (state, county, mappings) from parse_attribution()
+        """
+        (state, county, mappings) = parsed
 
         self.source = source
         self.state = state
         self.county = county
+        self.apply_paths(root, mappings)
+        self.set_hash()
+
+    def set_hash(self):
+        """
+        Compute the hash used to spot duplicate records.
+        """
+        hash_input = "{}{}".format(self.owner_name, self.property_address)
+        self.hash = short_hash(hash_input)
+
 
-        for mapping in mappings:
-            elem = root.findall(mapping["path"])
-            if elem:
-                if "prop" in mapping:
-                    value = elem[0].get(mapping["prop"])
-                else:
-                    value = elem[0].text
+def parse_attribution(source: str, attribution: str)->tuple:
+    """
+    Work out the state, county and mappings for a record from its attribution.
+    Results are remembered, so records from a county we've seen before skip the
+    regular expressions.
 
-                if value:
-                    if mapping["transform"]:
-                        value = mapping["transform"](value)
-                    setattr(self, mapping["attr"], value)
+    Args:
+        source (str): Source database, e.g. "PUBLICDATA"
+        attribution (str): Text of the record's <source>, e.g. "Garland County (Arkansas) - blah blah"
+
+    Returns:
+        (tuple): (state, county, mappings)
+    """
+    parsed = ATTRIBUTIONS.get((source, attribution))
+    if parsed:
+        return parsed
+
+    matches = STATE_REGEX.findall(attribution)
+    state = StateNameToAbbreviation[matches[0].upper()]
+
+    matches = COUNTY_REGEX.findall(attribution)
+    county = matches[0].replace(" County", "").strip()
+
+    if state not in MAPPINGS[source]:
+        raise ValueError("No {} mappings for this state: {}".format(source, state))
+
+    # The mappings can vary county-by-county within a state. Kill me.
+    mappings = MAPPINGS[source][state]
+    if county.upper() in mappings:
+        mappings = mappings[county.upper()]
+    else:
+        mappings = mappings["*"]
+
+    parsed = (state, county, mappings)
+
+    if len(ATTRIBUTIONS) >= MAX_ATTRIBUTIONS:
+        ATTRIBUTIONS.clear()
+    ATTRIBUTIONS[(source, attribution)] = parsed
+    return parsed
 
-        hash_input = "{}{}".format(self.owner_name, self.property_address)
-        self.hash = hashlib.md5(hash_input.encode())
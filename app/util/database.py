@@ -4,10 +4,13 @@ database.py - Class for access our persistent data store for publicdataws.
 @author Thomas J. Daley, J.D.
 @version 0.0.2
 @Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
-TODO: With the 2 Sep 2019 code reorg/refactor, this needs to operate as a
-      singleton.
-      At this time, we have lots of individual database connections--one for
-      each time this class is imported.
+
+Every Database instance shares one MongoClient per process (see get_client()),
+so there is one connection pool, and one set of monitor threads, no matter how
+many modules create a Database. Use get_database() to get the process-wide
+instance. The client is created when it is first used, and created again in a
+process forked from one that had already used it, e.g. a gunicorn worker forked
+from a preloaded master.
 
 Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
 """
@@ -16,16 +19,21 @@ import json
 import os
 from operator import itemgetter
 import pickle
-import xml.etree.ElementTree as ET
+import threading
 import xml.dom.minidom as MD
 import time
+import zlib
 
-from pymongo import MongoClient, ReturnDocument
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 
 from .logger import Logger
+from .lrucache import LruCache
 from .texasbarsearch import TexasBarSearch
+from . import xmlbackend
+from .xmldocument import XmlDocument
 
 BARSEARCH = TexasBarSearch()
 
@@ -44,9 +52,203 @@ DB_NAME = 'discoverybot'
 CACHE_TABLE_NAME = 'search_cache'
 USER_TABLE = 'discoverybot_users'
 CASE_TABLE = 'cases'
+CASE_ITEMS_TABLE = 'case_items'
 DISCOVERY_TABLE = 'discovery_requests'
 OBJECTIONS_TABLE = 'objection_templates'
 RESPONSES_TABLE = 'response_templates'
+LOGIN_TABLE = 'publicdata_logins'
+CACHE_FORMAT_VERSION = 2  # 1 = pickled ElementTree; 2 = zlib-compressed raw XML
+KEY_DOT = "\uff0e"  # Stood in for "." in item keys embedded in case documents. See decode_item_key().
+KEY_DOLLAR = "\uff04"  # Stood in for "$" in embedded item keys.
+CASE_ITEMS_PAGE_SIZE = int(os.environ.get("CASE_ITEMS_PAGE_SIZE", 100))  # Items per page of /case/items/
+MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))  # Most connections per server
+MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))  # Connections kept open per server when idle
+WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0)) or None  # Longest wait for a connection
+
+# In-process tier in front of the search_cache collection. Shared by every
+# Database instance in this process.
+SEARCH_CACHE = LruCache(
+    max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    max_entries=int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 2000)))
+
+# Users' _ids by email, so that each change to a case's items does not look the user up again.
+# A user's _id never changes. See get_user_id_for_email().
+USER_IDS = {}
+MAX_USER_IDS = 10000  # Most number of user _ids remembered
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Encapsulates connection pool metrics: connections opened and in use, and
+    how long threads waited to check a connection out of the pool.
+    """
+    def __init__(self):
+        """
+        Instance initializer.
+        """
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting from zero, e.g. in a newly forked process.
+        """
+        with self.lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.checked_in = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.pools_cleared = 0
+
+    def stats(self) -> dict:
+        """
+        Report the metrics.
+
+        Returns:
+            (dict): Connection counts, checkouts and checkout wait times.
+        """
+        with self.lock:
+            checkouts = self.checked_out + self.checkout_failures
+            return {
+                "connections_open": self.connections_created - self.connections_closed,
+                "connections_created": self.connections_created,
+                "connections_in_use": self.checked_out - self.checked_in,
+                "checkouts": checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait_ms_avg": round(self.wait_seconds / checkouts * 1000, 3) if checkouts else 0.0,
+                "checkout_wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+                "pools_cleared": self.pools_cleared
+            }
+
+    def add_wait(self, event):
+        # Called with the lock held.
+        seconds = getattr(event, "duration", None) or 0.0
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def connection_created(self, event):
+        with self.lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.connections_closed += 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.checked_out += 1
+            self.add_wait(event)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            self.add_wait(event)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_in += 1
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.pools_cleared += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+POOL_MONITOR = PoolMonitor()
+
+# The process-wide client and Database, and the process they were created in.
+CLIENT = None
+CLIENT_PID = None
+DATABASE = None
+CLIENT_LOCK = threading.Lock()
+
+# Whether this process has made sure the case_items indexes exist.
+CASE_ITEMS_INDEXED = False
+
+
+def get_client() -> MongoClient:
+    """
+    Get this process's MongoClient, creating it the first time it is needed. A
+    client inherited from the process we were forked from is not used, because
+    its sockets and monitor threads belong to that process.
+
+    The client does not connect until its first operation, so it is safe to
+    call this at import time, before a server forks its workers.
+
+    Returns:
+        (MongoClient): Client shared by every Database in this process.
+    """
+    global CLIENT, CLIENT_PID
+    pid = os.getpid()
+    if CLIENT is not None and CLIENT_PID == pid:
+        return CLIENT
+
+    with CLIENT_LOCK:
+        if CLIENT is None or CLIENT_PID != pid:
+            if CLIENT is not None:
+                POOL_MONITOR.reset()
+            CLIENT = MongoClient(
+                DB_URL,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[POOL_MONITOR],
+                connect=False)
+            CLIENT_PID = pid
+        return CLIENT
+
+
+def get_database():
+    """
+    Get the process-wide Database instance.
+
+    Returns:
+        (Database): Connected instance.
+    """
+    global DATABASE
+    with CLIENT_LOCK:
+        if DATABASE is None:
+            DATABASE = Database()
+    DATABASE.connect()
+    return DATABASE
+
+
+def pool_stats() -> dict:
+    """
+    Report the size and use of this process's connection pool.
+
+    Returns:
+        (dict): Pool settings and the metrics gathered by POOL_MONITOR.
+    """
+    stats = {
+        "pid": CLIENT_PID,
+        "max_pool_size": MAX_POOL_SIZE,
+        "min_pool_size": MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": WAIT_QUEUE_TIMEOUT_MS
+    }
+    stats.update(POOL_MONITOR.stats())
+    return stats
 
 
 class MissingFieldException(Exception):
@@ -64,14 +266,27 @@ class Database(object):
         """
         Instance initializer.
         """
-        self.client = None
-        self.dbconn = None
         self.logger = Logger.get_logger(log_name="pdws.database")
         self.last_inserted_id = None
 
+    @property
+    def client(self) -> MongoClient:
+        """
+        The process-wide client. See get_client().
+        """
+        return get_client()
+
+    @property
+    def dbconn(self):
+        """
+        Our database on the process-wide client.
+        """
+        return get_client()[DB_NAME]
+
     def connect(self) -> bool:
         """
-        Connect to the underlying datastore.
+        Connect to the underlying datastore. The connection is shared with every
+        other Database instance in this process.
 
         Returns:
             (bool): True if successful, otherwise False.
@@ -79,16 +294,12 @@ class Database(object):
         success = False
 
         try:
-            # pep8: disable E501
-            self.logger.debug(
-                "Connecting to database %s at %s",
-                DB_NAME,
-                DB_URL)
-            client = MongoClient(DB_URL)
-            dbconn = client[DB_NAME]
-            self.client = client
-            self.dbconn = dbconn
-            self.logger.info("Connected to database.")
+            if CLIENT is None or CLIENT_PID != os.getpid():
+                self.logger.debug(
+                    "Connecting to database %s at %s",
+                    DB_NAME,
+                    DB_URL)
+            get_client()
             success = True
         except Exception as e:
             self.logger.error("Error connecting to database: %s", e)
@@ -138,11 +349,15 @@ class Database(object):
             "query": query,
             "result": serialized_result,
             "result_type": result_type,
+            "format_version": CACHE_FORMAT_VERSION,
             "ttl": ttl})
         filter_ = {"source": source, "query": query}
 
         mongo_result = self.dbconn[CACHE_TABLE_NAME].replace_one(filter_, record, upsert=True)
         self.logger.debug("mongo_result of replace_one: %s", mongo_result)
+
+        # Replace whatever the in-process tier had for this query with what we just saved.
+        remember_cache_entry(record)
         return True
 
     def check_cache(self, source: str, query: str) -> object:
@@ -152,6 +367,9 @@ class Database(object):
         *Recent answer* means a response to this exact *query* upon this same
         *source* for which the *ttl* is not in the past.
 
+        The in-process SEARCH_CACHE is consulted first; the database is only
+        queried when it misses.
+
         Args:
             source (str): Source to be queried
             query (str): The query to be submitted.
@@ -159,9 +377,13 @@ class Database(object):
         Returns:
             (NoneType): If no recent cache entry was found.
             (dict): If recent entry was found and should be reconstituted as JSON.
-            (xml.etree.ElementTree): If recent entry was found and sould be reconstituted as XML.
+            (XmlDocument): If recent entry was found and sould be reconstituted as XML.
             (str): If recent entry was found and should be reconstituted as STR.
         """
+        document = SEARCH_CACHE.get((source, query))
+        if document:
+            return self.reconstitute_cached_response(document)
+
         utc_now = datetime.utcnow()
         filter_ = {"source": source, "query": query, "ttl": {"$gt": utc_now}}
         document = self.dbconn[CACHE_TABLE_NAME].find_one(filter_)
@@ -169,6 +391,7 @@ class Database(object):
         if not document:
             return None
 
+        remember_cache_entry(document)
         return self.reconstitute_cached_response(document)
 
     def serialize_cache_entry(self, search_result: object) -> (str, str):
@@ -185,9 +408,12 @@ class Database(object):
         """
 
         try:
-            if isinstance(search_result, ET.ElementTree):
-                result_type = "XML"
-                serialized_result = pickle.dumps(search_result)
+            if xmlbackend.is_tree(search_result):
+                search_result = XmlDocument.from_tree(search_result)
+
+            if isinstance(search_result, XmlDocument):
+                result_type = "XMLZ"
+                serialized_result = search_result.compressed()
             elif isinstance(search_result, dict):
                 result_type = "JSON"
                 serialized_result = json.dumps(search_result)
@@ -212,7 +438,9 @@ class Database(object):
             document (): MongoDB document containing search result.
 
         Returns:
-            (object): Search result reconstituted to its original form.
+            (object): Search result reconstituted to its original form. XML
+                results are returned as an XmlDocument, which is not parsed
+                until its tree is needed.
         """
 
         result_type = "[result_type not in document]"
@@ -221,9 +449,11 @@ class Database(object):
             result_type = document["result_type"]
             serialized_result = document["result"]
 
-            if result_type == "XML":
-                # result = ET.fromstring(serialized_result)
-                result = pickle.loads(serialized_result)
+            if result_type == "XMLZ":
+                result = XmlDocument.from_compressed(serialized_result)
+            elif result_type == "XML":
+                # Format version 1: pickled ElementTree
+                result = XmlDocument.from_tree(pickle.loads(serialized_result))
             elif result_type == "JSON":
                 result = json.loads(serialized_result)
             elif result_type == "STR":
@@ -234,11 +464,157 @@ class Database(object):
                 result = serialized_result.copy()
 
             return result
-        except pickle.UnpicklingError as e:
+        except (pickle.UnpicklingError, zlib.error) as e:
             self.logger.error("Error deserializing from %s: %s", result_type, e)
 
         return None
 
+    def rekey_cache(self, source: str, key_function) -> int:
+        """
+        Rewrite the *query* of every cache entry for a source, e.g. when the way
+        we build cache keys changes. If two entries end up with the same key, the
+        one with the later *ttl* is kept.
+
+        Args:
+            source (str): Source whose entries are to be rewritten, e.g. "PUBLICDATA"
+            key_function (function): Maps an existing *query* to its new key. Must
+                return its input unchanged when given a key it produced.
+
+        Returns:
+            (int): Number of entries rewritten or removed.
+        """
+        collection = self.dbconn[CACHE_TABLE_NAME]
+        changed = 0
+
+        for document in collection.find({"source": source}, {"query": 1, "ttl": 1}):
+            old_key = document["query"]
+            new_key = key_function(old_key)
+            if new_key == old_key:
+                continue
+
+            # See if we already have an entry under the new key. Keep whichever is fresher.
+            existing = collection.find_one({"source": source, "query": new_key}, {"ttl": 1})
+            if existing:
+                if existing["ttl"] >= document["ttl"]:
+                    collection.delete_one({"_id": document["_id"]})
+                    changed += 1
+                    continue
+                collection.delete_one({"_id": existing["_id"]})
+
+            collection.update_one({"_id": document["_id"]}, {"$set": {"query": new_key}})
+            changed += 1
+
+        SEARCH_CACHE.clear()
+        self.logger.info("database.rekey_cache(): Rewrote %d '%s' cache entries.", changed, source)
+        return changed
+
+    def recompress_cache(self, batch_size: int = 500) -> int:
+        """
+        Rewrite cache entries that hold a pickled ElementTree (format version 1)
+        as zlib-compressed raw XML (format version 2).
+
+        Args:
+            batch_size (int): Number of documents to rewrite per bulk write.
+
+        Returns:
+            (int): Number of entries rewritten.
+        """
+        collection = self.dbconn[CACHE_TABLE_NAME]
+        changed = 0
+        batch = []
+
+        for document in collection.find({"result_type": "XML"}, {"result": 1, "result_type": 1}):
+            try:
+                result = self.reconstitute_cached_response(document)
+            except Exception as e:
+                self.logger.error("database.recompress_cache(): Unable to read %s: %s", document["_id"], e)
+                continue
+            if result is None:
+                continue
+
+            update = {
+                "$set": {
+                    "result": result.compressed(),
+                    "result_type": "XMLZ",
+                    "format_version": CACHE_FORMAT_VERSION
+                }
+            }
+            batch.append(UpdateOne({"_id": document["_id"]}, update))
+
+            if len(batch) >= batch_size:
+                changed += collection.bulk_write(batch, ordered=False).modified_count
+                batch = []
+
+        if batch:
+            changed += collection.bulk_write(batch, ordered=False).modified_count
+
+        SEARCH_CACHE.clear()
+        self.logger.info("database.recompress_cache(): Rewrote %d cache entries.", changed)
+        return changed
+
+    def get_login(self, username: str) -> dict:
+        """
+        Retrieve the day keys saved by the most recent login for this user, if
+        they have not expired.
+
+        Args:
+            username (str): The login_id the keys were issued to.
+
+        Returns:
+            (dict): Document with *keys* and *expires* (UTC) or None if not found.
+        """
+        filter_ = {"username": username, "expires": {"$gt": datetime.utcnow()}}
+        return self.dbconn[LOGIN_TABLE].find_one(filter_, {"keys": 1, "expires": 1})
+
+    def save_login(self, username: str, keys: dict, expires: datetime) -> bool:
+        """
+        Save day keys so that other processes can use them without logging in again.
+
+        Args:
+            username (str): The login_id the keys were issued to.
+            keys (dict): Keys returned by PublicData.login()
+            expires (datetime): UTC time after which the keys are no longer valid.
+
+        Returns:
+            (bool): True if successful, otherwise False
+        """
+        record = base_record()
+        record.update({"username": username, "keys": keys, "expires": expires})
+        filter_ = {"username": username}
+        mongo_result = self.dbconn[LOGIN_TABLE].update_one(
+            filter_,
+            {"$set": record, "$unset": {"refresh_lease": ""}},
+            upsert=True)
+        return mongo_result.acknowledged
+
+    def claim_login_refresh(self, username: str, lease_seconds: int) -> bool:
+        """
+        Claim the right to refresh this user's day keys, so that only one process
+        logs in again when they expire. The claim lapses after *lease_seconds*
+        in case the process that holds it dies.
+
+        Args:
+            username (str): The login_id whose keys are to be refreshed.
+            lease_seconds (int): How long the claim is good for.
+
+        Returns:
+            (bool): True if the caller should refresh the keys.
+        """
+        utc_now = datetime.utcnow()
+        filter_ = {
+            "username": username,
+            "$or": [
+                {"refresh_lease": {"$exists": False}},
+                {"refresh_lease": {"$lt": utc_now}}
+            ]
+        }
+        update = {"$set": {"refresh_lease": utc_now + timedelta(seconds=lease_seconds)}}
+        if self.dbconn[LOGIN_TABLE].find_one_and_update(filter_, update):
+            return True
+
+        # Nobody has saved keys for this user, so there is nothing to contend for.
+        return self.dbconn[LOGIN_TABLE].find_one({"username": username}, {"_id": 1}) is None
+
     def get_query_cache(self, limit: int = 50):
         """
         Retrieve the last _limit_ entries from the query cache.
@@ -268,8 +644,7 @@ class Database(object):
             return None
 
         result = self.reconstitute_cached_response(document)
-        rough_string = ET.tostring(result.getroot(), 'utf-8')
-        reparsed = MD.parseString(rough_string)
+        reparsed = MD.parseString(result.raw)
         return reparsed.toprettyxml(indent="   ")
 
     def get_user_id_for_email(self, email: str) -> ObjectId:
@@ -282,8 +657,16 @@ class Database(object):
         Returns:
             (ObjectId): ID of the user we found or None if not found.
         """
+        email = email.lower()
+        user_id = USER_IDS.get(email)
+        if user_id:
+            return user_id
+
         user_doc = self.get_user({"email": email})
         if user_doc:
+            if len(USER_IDS) >= MAX_USER_IDS:
+                USER_IDS.clear()
+            USER_IDS[email] = user_doc["_id"]
             return user_doc["_id"]
         return None
 
@@ -434,9 +817,39 @@ class Database(object):
             "user_id": user_id,
             "cause_number": fields["cause_number"].upper()}
 
-        # Delete the case, if we can find it.
-        mongo_result = self.dbconn[CASE_TABLE].remove(filter_, {"justOne": True})
-        return mongo_result["nRemoved"] == 1
+        # Delete the case, if we can find it, and then its items.
+        case_doc = self.dbconn[CASE_TABLE].find_one(filter_, {"_id": 1})
+        if not case_doc:
+            return False
+
+        mongo_result = self.dbconn[CASE_TABLE].delete_one({"_id": case_doc["_id"], "user_id": user_id})
+        self.case_items().delete_many({"case_id": case_doc["_id"], "user_id": user_id})
+        return mongo_result.deleted_count == 1
+
+    def case_items(self):
+        """
+        Get the case_items collection, making sure its indexes exist the first time
+        it is used in this process.
+
+        Each case item is one document:
+
+            {"case_id", "user_id", "category", "key", "status", "item", "time", "time_str"}
+
+        where *category* is e.g. "PROPERTY:VEHICLE", *status* is "I" (included) or
+        "X" (excluded) and *item* holds the item's property values.
+
+        Returns:
+            (Collection): The case_items collection.
+        """
+        global CASE_ITEMS_INDEXED
+        collection = self.dbconn[CASE_ITEMS_TABLE]
+        if not CASE_ITEMS_INDEXED:
+            collection.create_index(
+                [("case_id", ASCENDING), ("category", ASCENDING), ("key", ASCENDING)],
+                unique=True,
+                name="case_category_key")
+            CASE_ITEMS_INDEXED = True
+        return collection
 
     def add_to_case(self, email: str, case_id: str, category: str, key: str, fields: dict) -> bool:
         """
@@ -448,7 +861,8 @@ class Database(object):
             category (str): Category name. Can optionally contain a
                 subcategory delimited by a colon (":").
                 E.G. "PROPERTY:VEHICLE", "PROPERTY:REAL",
-                "PROPERTY:BANK_ACCOUNT"
+                "PROPERTY:BANK_ACCOUNT". Prefix with "X" to add the item
+                to the case's excluded items instead.
             key (str): Application-generated key for this item, e.g., for
                 Public Data it could take the form PUBLICDATA:<db>:<ed>:<rec>
             fields (dict): Property values for this item.
@@ -456,55 +870,8 @@ class Database(object):
         Returns:
             (bool): True if successful, otherwise False
         """
-
-        # Get user_id for the given email
-        user_id = self.get_user_id_for_email(email)
-        if not user_id:
-            self.logger.error("database.add_to_case(): Email not found: '%s'", email)
-            return False
-
-        # Get make sure this user owns the case.
-        my_case_id = ObjectId(case_id)
-        filter_ = {
-            "_id": my_case_id,
-            "user_id": user_id
-        }
-        case_doc = self.dbconn[CASE_TABLE].find_one(filter_)
-        if not case_doc:
-            self.logger.error("database.add_to_case(): Case '%s' not found for '%s'", case_id, email)
-            return False
-
-        # Make sure case has discovery items dictionary.
-        if "discovery" not in case_doc:
-            case_doc["discovery"] = {}
-
-        discovery = case_doc["discovery"]
-
-        # Create item collection to add to, if not already there.
-        (main_cat, sub_cat) = split_category(category)
-        if main_cat not in discovery:
-            discovery[main_cat] = {}
-
-        if sub_cat and sub_cat not in discovery[main_cat]:
-            discovery[main_cat][sub_cat] = {}
-
-        # Now insert or update the corresponding key into the case document.
-        subrecord = record_from_dict(fields)
-        if not sub_cat:
-            discovery[main_cat][key] = subrecord
-        else:
-            discovery[main_cat][sub_cat][key] = subrecord
-
-        # Finally, save the updated case document.
-        # Create local copy of fields
-        new_vals = {key: value for key, value in case_doc.items() if key not in ['_id', 'user_id']}
-
-        # Add update times
-        new_vals.update(base_record())
-
-        # Locate and update the matching record
-        mongo_result = self.dbconn[CASE_TABLE].update_one(filter_, {"$set": new_vals}, upsert=False)
-        return mongo_result.modified_count == 1
+        (category, status) = split_status(category)
+        return self.set_case_items(email, case_id, category, {key: fields}, status)
 
     def del_from_case(self, email: str, case_id: str, category: str, key: str, fields: dict) -> bool:
         """
@@ -515,6 +882,7 @@ class Database(object):
             case_id (str): String version of _id field of case to be added to.
             category (str): Category name. Can optionally contain a subcategory delimited by
                 a colon (":"). E.G. "PROPERTY:VEHICLE", "PROPERTY:REAL", "PROPERTY:BANK_ACCOUNT"
+                Prefix with "X" to delete it from the case's excluded items.
             key (str): Application-generated key for this item, e.g., for Public Data it could
                 take the form PUBLICDATA:<db>:<ed>:<rec>
             fields (dict): Property values for this item.
@@ -522,57 +890,90 @@ class Database(object):
         Returns:
             (bool): True if successful, otherwise False
         """
-
-        # Get user_id for the given email
-        user_id = self.get_user_id_for_email(email)
-        if not user_id:
-            self.logger.error("database.del_from_case(): Email not found: '%s'", email)
+        filter_ = self.case_items_filter(email, case_id, "del_from_case")
+        if filter_ is None:
             return False
 
-        # Get make sure this user owns the case.
-        my_case_id = ObjectId(case_id)
-        filter_ = {
-            "_id": my_case_id,
-            "user_id": user_id
-        }
-        case_doc = self.dbconn[CASE_TABLE].find_one(filter_)
-        if not case_doc:
-            self.logger.error("database.del_from_case(): Case '%s' not found for '%s'", case_id, email)
-            return False
+        # Removing an item that is not there is not an error.
+        (category, status) = split_status(category)
+        filter_.update({"category": category, "key": key, "status": status})
+        self.case_items().delete_one(filter_)
+        return True
 
-        # See if item collection exists. Return True if the collection does
-        # not exist because there is nothing to delete.
-        if "discovery" not in case_doc:
-            return True
+    def toggle_case_item(self, email: str, case_id: str, category: str, key: str, fields: dict,
+                         include: bool = True) -> bool:
+        """
+        Include an item in a case and remove it from the case's excluded items, or
+        the reverse, in one update. See toggle_case_items().
 
-        discovery = case_doc["discovery"]
+        Args:
+            email (str): Email address of person making the change
+            case_id (str): String version of _id field of case to be changed.
+            category (str): Category name, e.g. "PROPERTY:VEHICLE"
+            key (str): Application-generated key for this item.
+            fields (dict): Property values for this item.
+            include (bool): True to include the item, False to exclude it.
 
-        (main_cat, sub_cat) = split_category(category)
-        if main_cat not in discovery:
-            return True
+        Returns:
+            (bool): True if successful, otherwise False
+        """
+        return self.toggle_case_items(email, case_id, category, {key: fields}, include)
 
-        if sub_cat and sub_cat not in discovery[main_cat]:
-            return True
+    def toggle_case_items(self, email: str, case_id: str, category: str, items: dict,
+                          include: bool = True) -> bool:
+        """
+        Move items between a case's included and excluded items, e.g. every result
+        on a page of search results, in one round trip.
 
-        # Now remove the corresponding key into the case document.
-        try:
-            if not sub_cat:
-                del discovery[main_cat][key]
-            else:
-                del discovery[main_cat][sub_cat][key]
-        except KeyError:
-            return True  # It's already gone.
+        Args:
+            email (str): Email address of person making the change
+            case_id (str): String version of _id field of case to be changed.
+            category (str): Category name, e.g. "PROPERTY:VEHICLE"
+            items (dict): Application-generated key -> property values for each item.
+            include (bool): True to include the items, False to exclude them.
 
-        # Finally, save the updated case document.
-        # Create local copy of fields
-        new_vals = {key: value for key, value in case_doc.items() if key not in ['_id', 'user_id']}
+        Returns:
+            (bool): True if successful, otherwise False
+        """
+        return self.set_case_items(email, case_id, category, items, "I" if include else "X")
 
-        # Add update times
-        new_vals.update(base_record())
+    def set_case_items(self, email: str, case_id: str, category: str, items: dict, status: str) -> bool:
+        """
+        Add items to a case, or change their status, with one bulk write. Each
+        item's document is updated atomically.
 
-        # Locate and update the matching record
-        mongo_result = self.dbconn[CASE_TABLE].update_one(filter_, {"$set": new_vals}, upsert=False)
-        return mongo_result.modified_count == 1
+        Args:
+            email (str): Email address of person making the change
+            case_id (str): String version of _id field of case to be changed.
+            category (str): Category name without an "X" prefix, e.g. "PROPERTY:VEHICLE"
+            items (dict): Application-generated key -> property values for each item.
+            status (str): "I" (included) or "X" (excluded)
+
+        Returns:
+            (bool): True if successful, otherwise False, e.g. if the user does not own the case.
+        """
+        if not items:
+            return True
+
+        case_filter = self.case_items_filter(email, case_id, "set_case_items", check_owner=True)
+        if case_filter is None:
+            return False
+
+        requests = []
+        for key, fields in items.items():
+            filter_ = dict(case_filter, category=category, key=key)
+            new_vals = {"status": status, "item": record_from_dict(fields)}
+            new_vals.update(base_record())
+            requests.append(UpdateOne(filter_, {"$set": new_vals}, upsert=True))
+
+        try:
+            self.case_items().bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate key means an item of this case is stored under another user_id.
+            self.logger.error("database.set_case_items(): Case '%s' not updated for '%s': %s",
+                              case_id, email, e.details.get("writeErrors", [])[:1])
+            return False
+        return True
 
     def get_discovery_list(self, fields: dict) -> list:
         """
@@ -841,72 +1242,200 @@ class Database(object):
         )
         return True
 
-    def get_case_items(self, email: str, case_id: str, category: str = None) -> list:
+    def get_case_items(self, email: str, case_id: str, category: str = None,
+                       page: int = 1, page_size: int = CASE_ITEMS_PAGE_SIZE) -> list:
         """
-        Get a list of case items by category, e.g. "PROPERTY" or "PROPERTY:VEHICLE"
+        Get one page of a case's items, in order of category and key.
+
+        Args:
+            email (str): Email of person requesting access.
+            case_id (str): _id of record in cases collection.
+            category (str): Category name, e.g. "PROPERTY:VEHICLE", or None for every
+                category. Prefix with "X" to get excluded items. If None, only included
+                items are returned.
+            page (int): Page number, starting at 1.
+            page_size (int): Items per page. 0 = all of them.
+
+        Returns:
+            (list): For each item, its property values plus "category", "key" and "status".
+                Empty if nothing found.
+        """
+        filter_ = self.case_items_filter(email, case_id, "get_case_items")
+        if filter_ is None:
+            return []
+
+        (my_category, status) = split_status(category or "")
+        filter_["status"] = status
+        if my_category:
+            filter_["category"] = my_category
+
+        cursor = self.case_items().find(filter_).sort([("category", ASCENDING), ("key", ASCENDING)])
+        if page_size:
+            cursor = cursor.skip(max(page - 1, 0) * page_size).limit(page_size)
+
+        items = []
+        for document in cursor:
+            item = dict(document.get("item", {}))
+            item.update({"category": document["category"], "key": document["key"], "status": document["status"]})
+            items.append(item)
+        return items
+
+    def count_case_items(self, email: str, case_id: str) -> dict:
+        """
+        Count a case's items in each category.
 
         Args:
             email (str): Email of person requesting access.
             case_id (str): _id of record in cases collection.
-            category (str): Category name. Can optionally contain a subcategory delimited by
-                a colon (":"). E.G. "PROPERTY:VEHICLE", "PROPERTY:REAL", "PROPERTY:BANK_ACCOUNT"
 
         Returns:
-            (list): List of items found, or empty list if nothing found.
+            (dict): Category -> number of items, e.g. {"PROPERTY:VEHICLE": 12}. Excluded
+                items are counted under "X" + category.
+        """
+        filter_ = self.case_items_filter(email, case_id, "count_case_items")
+        if filter_ is None:
+            return {}
+
+        pipeline = [
+            {"$match": filter_},
+            {"$group": {"_id": {"category": "$category", "status": "$status"}, "count": {"$sum": 1}}}
+        ]
+        counts = {}
+        for group in self.case_items().aggregate(pipeline):
+            prefix = "X" if group["_id"]["status"] == "X" else ""
+            counts[prefix + group["_id"]["category"]] = group["count"]
+        return counts
+
+    def get_case_item_keys(self, email: str, case_id: str, category: str) -> (set, set):
+        """
+        Get the keys of a case's included and excluded items in a category, e.g.
+        to mark search results that are already in the case. Only the keys and
+        statuses are read.
+
+        Args:
+            email (str): Email of person requesting access.
+            case_id (str): _id of record in cases collection.
+            category (str): Category name, e.g. "PROPERTY:VEHICLE"
+
+        Returns:
+            (set, set): Keys of the included items and of the excluded items. Both
+                are empty if the case can't be found.
+        """
+        filter_ = self.case_items_filter(email, case_id, "get_case_item_keys")
+        if filter_ is None:
+            return (set(), set())
+
+        filter_["category"] = category
+        keys = {"I": set(), "X": set()}
+        for document in self.case_items().find(filter_, {"_id": 0, "key": 1, "status": 1}):
+            keys[document["status"]].add(document["key"])
+        return (keys["I"], keys["X"])
+
+    def mark_case_status(self, results, email: str, case_id: str, category: str):
+        """
+        Set the case_status of each search result that is already one of the
+        case's items: "I" if it is included, "X" if it is excluded.
+
+        Args:
+            results (list): Summary records found by a search, or a SearchResultSet.
+            email (str): Email of person requesting access.
+            case_id (str): _id of record in cases collection.
+            category (str): The category or category:sub_category of the items in *results*.
+
+        Returns:
+            None. *results* is modified in place.
+        """
+        (included, excluded) = self.get_case_item_keys(email, case_id, category)
+        if not included and not excluded:
+            return
+
+        if hasattr(results, "set_where_keys"):
+            results.set_where_keys(excluded, "case_status", "X")
+            results.set_where_keys(included, "case_status", "I")
+            return
+
+        for item in results:
+            key = item.key()
+            if key in included:
+                item.case_status = "I"
+            elif key in excluded:
+                item.case_status = "X"
+
+    def case_items_filter(self, email: str, case_id: str, caller: str, check_owner: bool = False) -> dict:
+        """
+        Create a filter for a user's items in a case.
+
+        Each item is stored with the user_id of the case's owner, so the filter
+        only matches the items of a case the user owns, without looking the case
+        up. Items can only be added to a case after that has been checked, which
+        *check_owner* does.
+
+        Args:
+            email (str): Email of person requesting access.
+            case_id (str): _id of record in cases collection.
+            caller (str): Name of the calling method, for logging.
+            check_owner (bool): Make sure the user owns the case, e.g. before adding items to it.
+
+        Returns:
+            (dict): Filter on case_id and user_id, or None if either is not valid
+                or, if *check_owner*, the case does not belong to the user.
         """
-        # Verify that case_id is a valid ObjectId.
         # An invalid ID probably means that the case_id is not set on the client-side, which is
-        # not really an error, but a normal state. We catch that state here so that we can focus
-        # the error handling where it is most easily caught.
+        # not really an error, but a normal state.
         try:
             my_case_id = ObjectId(case_id)
-        except InvalidId as e:
-            self.logger.debug("database.get_case_items(): Invalid case_id: '%s'", case_id)
-            return []
+        except (InvalidId, TypeError):
+            self.logger.debug("database.%s(): Invalid case_id: '%s'", caller, case_id)
+            return None
 
         # Get user_id for the given email
         user_id = self.get_user_id_for_email(email)
         if not user_id:
-            self.logger.error("database.get_case_items(): Email not found: '%s'", email)
-            return False
-
-        # Get make sure this user owns the case.
-        filter_ = {
-            "_id": my_case_id,
-            "user_id": user_id
-        }
-        case_doc = self.dbconn[CASE_TABLE].find_one(filter_)
-        if not case_doc:
-            self.logger.error("database.get_case_items(): Case '%s' not found for '%s'", case_id, email)
-            return False
-
-        # See if we have any discovery added to this case.
-        if "discovery" not in case_doc:
-            self.logger.info("database.get_case_items(): Case '%s' does not have any discovery.", case_id)
-            return []
-
-        discovery = case_doc["discovery"]
+            self.logger.error("database.%s(): Email not found: '%s'", caller, email)
+            return None
 
-        # If the caller did not specify a category, send all discovery back.
-        if not category:
-            return discovery
+        if check_owner and not self.dbconn[CASE_TABLE].find_one({"_id": my_case_id, "user_id": user_id}, {"_id": 1}):
+            self.logger.error("database.%s(): Case '%s' not found for '%s'", caller, case_id, email)
+            return None
 
-        # Split the category
-        (main_cat, sub_cat) = split_category(category)
+        return {"case_id": my_case_id, "user_id": user_id}
 
-        if main_cat not in discovery:
-            self.logger.info("database.get_case_items(): Case '%s' does not have category '%s'", case_id, main_cat)
-            return []
+    def move_case_items(self) -> int:
+        """
+        Move items embedded in case documents, under discovery[main_cat][sub_cat][key],
+        into the case_items collection.
 
-        if sub_cat and sub_cat not in discovery[main_cat]:
-            self.logger.info("database.get_case_items(): Case '%s' does not have sub-category '%s->%s'", case_id, main_cat, sub_cat)
-            return []
+        Items already in case_items are left as they are, so this can run while the
+        application is in use, and be run again. A case's discovery tree is only
+        removed if it has not changed since it was read.
 
-        # Return the requested items
-        if sub_cat:
-            return discovery[main_cat][sub_cat]
+        Returns:
+            (int): Number of cases whose items were moved.
+        """
+        collection = self.case_items()
+        moved = 0
+
+        for case_doc in self.dbconn[CASE_TABLE].find({"discovery": {"$exists": True}}, {"discovery": 1, "user_id": 1}):
+            requests = []
+            for (category, status, key, fields) in embedded_case_items(case_doc["discovery"]):
+                filter_ = {"case_id": case_doc["_id"], "category": category, "key": key}
+                new_vals = {"user_id": case_doc["user_id"], "status": status, "item": fields}
+                new_vals.update(base_record())
+                requests.append(UpdateOne(filter_, {"$setOnInsert": new_vals}, upsert=True))
+
+            if requests:
+                collection.bulk_write(requests, ordered=False)
+
+            mongo_result = self.dbconn[CASE_TABLE].update_one(
+                {"_id": case_doc["_id"], "discovery": case_doc["discovery"]},
+                {"$unset": {"discovery": ""}})
+            if mongo_result.modified_count == 1:
+                moved += 1
+            else:
+                self.logger.warning("database.move_case_items(): Case '%s' changed; run again.", case_doc["_id"])
 
-        return discovery[main_cat]
+        self.logger.info("database.move_case_items(): Moved the items of %d cases.", moved)
+        return moved
 
     #
     # Objection Templates
@@ -1216,6 +1745,24 @@ def base_record() -> dict:
     return {"time": time.time(), "time_str": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}
 
 
+def remember_cache_entry(document: dict):
+    """
+    Add a search_cache document to the in-process SEARCH_CACHE. The entry expires
+    when the document's *ttl* does. Only the fields needed to reconstitute the
+    result are kept.
+
+    Args:
+        document (dict): search_cache document
+    """
+    if not document.get("result_type"):
+        return
+
+    result = document["result"]
+    entry = {"result": result, "result_type": document["result_type"]}
+    size = len(result) if isinstance(result, (bytes, str)) else 1024
+    SEARCH_CACHE.put((document["source"], document["query"]), entry, size, document.get("ttl"))
+
+
 def record_from_dict(fields: dict, id_fields: list = []) -> dict:
     """
     Create a record from a dict.
@@ -1237,6 +1784,55 @@ def record_from_dict(fields: dict, id_fields: list = []) -> dict:
     return record
 
 
+def decode_item_key(key: str) -> str:
+    """
+    Decode an item key embedded in a case document. Keys were stored with "."
+    and "$" replaced by their full-width forms, so that they could be used as
+    field names. Keys stored before that come back unchanged.
+    """
+    return key.replace(KEY_DOT, ".").replace(KEY_DOLLAR, "$")
+
+
+def split_status(category: str) -> (str, str):
+    """
+    Split the "X" prefix, which marks excluded items, from a category.
+
+    Args:
+        category (str): Category name, e.g. "PROPERTY:VEHICLE" or "XPROPERTY:VEHICLE"
+
+    Returns:
+        (category, status) where status is "I" (included) or "X" (excluded)
+    """
+    if category.startswith("X"):
+        return (category[1:], "X")
+    return (category, "I")
+
+
+def embedded_case_items(discovery: dict):
+    """
+    Walk the items embedded in a case's discovery tree. Included items come
+    before excluded ones.
+
+    Args:
+        discovery (dict): The "discovery" field of a case document, e.g.
+            {"/PROPERTY": {"/VEHICLE": {key: fields}}, "/XPERSON": {key: fields}}
+
+    Yields:
+        (category, status, key, fields), e.g. ("PROPERTY:VEHICLE", "I", key, fields)
+    """
+    for wanted in ["I", "X"]:
+        for main_cat, items in discovery.items():
+            (category, status) = split_status(main_cat.lstrip("/"))
+            if status != wanted:
+                continue
+            for key, item in items.items():
+                if key.startswith("/"):
+                    for sub_key, sub_item in item.items():
+                        yield ("{}:{}".format(category, key.lstrip("/")), status, decode_item_key(sub_key), sub_item)
+                else:
+                    yield (category, status, decode_item_key(key), item)
+
+
 def split_category(category: str):
     """
     Split category string into category and sub-category. The category and sub-category
@@ -0,0 +1,189 @@
+"""
+depreciation.py - Depreciation schedules for many vehicles at once.
+
+WebService.amortization_schedule() works out one vehicle's sum-of-the-years-digits
+schedule in a Python loop. depreciation_schedules() does the same for every
+vehicle in a case in one pass with NumPy and gives the same results: the same
+values, in the same order of floating point operations, and the same messages.
+
+The schedules are kept in one 2-D array, one row per vehicle. Column 0 is the
+vehicle's starting value and column k is its value at the end of the k-th year
+of its schedule. Columns past the end of a vehicle's schedule are NaN.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from datetime import datetime
+
+import numpy as np
+
+NORMAL_USEFUL_LIFE = 15  # Years
+
+
+class DepreciationSchedules(object):
+    """
+    Encapsulates the depreciation schedules of a batch of vehicles.
+    """
+    def __init__(self, start_years: np.ndarray, lengths: np.ndarray, values: np.ndarray,
+                 depreciation: np.ndarray, fmv: np.ndarray, messages: list):
+        """
+        Instance initializer. See depreciation_schedules().
+
+        Args:
+            start_years (np.ndarray): First year of each vehicle's schedule.
+            lengths (np.ndarray): Number of years in each vehicle's schedule. 0 = no schedule.
+            values (np.ndarray): Value at the start of the schedule and at the end of each year.
+            depreciation (np.ndarray): Depreciation (negative) in each year of the schedule.
+            fmv (np.ndarray): Value at the end of the current year, or NaN.
+            messages (list): Message explaining each vehicle's outcome.
+        """
+        self.start_years = start_years
+        self.lengths = lengths
+        self.values = values
+        self.depreciation = depreciation
+        self.fmv = fmv
+        self.messages = messages
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def schedule(self, index: int) -> list:
+        """
+        Get one vehicle's schedule in the form returned by WebService.amortization_schedule().
+
+        Args:
+            index (int): Position of the vehicle in the batch.
+
+        Returns:
+            (list): List of dicts containing the depreciation record for 1 yr.
+        """
+        start_year = int(self.start_years[index])
+        values = self.values[index].tolist()
+        depreciation = self.depreciation[index].tolist()
+        return [
+            {
+                "year": str(start_year + k),
+                "begin_value": values[k],
+                "depreciation": depreciation[k],
+                "end_value": values[k + 1]
+            }
+            for k in range(int(self.lengths[index]))
+        ]
+
+    def results(self) -> list:
+        """
+        Get every vehicle's (schedule, message), in order.
+        """
+        return [(self.schedule(index), message) for index, message in enumerate(self.messages)]
+
+
+def depreciation_schedules(
+    model_years: list,
+    sold_prices: list,
+    title_dates: list,
+    sold_dates: list = None,
+    normal_useful_life: int = NORMAL_USEFUL_LIFE,
+    this_year: int = None
+) -> DepreciationSchedules:
+    """
+    Compute sum-of-the-years-digits depreciation schedules and current fair market
+    values for a batch of vehicles. See WebService.amortization_schedule().
+
+    Where amortization_schedule() would raise an exception, e.g. for a price of
+    None, the vehicle gets no schedule and a message saying why.
+
+    Args:
+        model_years (list): Model year of each vehicle (YYYY).
+        sold_prices (list): Price each vehicle was sold for.
+        title_dates (list): Date each vehicle was first titled to the current owner (YYYYMMDD).
+        sold_dates (list): Date each vehicle was sold to the current owner (YYYYMMDD).
+            Only used in messages. Defaults to *title_dates*.
+        normal_useful_life (int): Number of years of normal useful life
+            (not remaining useful life.)
+        this_year (int): Year whose ending value is the current fair market value. Defaults to this year.
+
+    Returns:
+        (DepreciationSchedules): Schedules and messages, in the order given.
+    """
+    count = len(model_years)
+    if sold_dates is None:
+        sold_dates = title_dates
+    if this_year is None:
+        this_year = int(datetime.now().strftime("%Y"))
+    life = normal_useful_life
+
+    # Reading the inputs is per-vehicle string handling, so it stays a loop.
+    years = np.zeros(count, dtype=np.int64)
+    prices = np.zeros(count, dtype=np.int64)
+    purchased = np.zeros(count, dtype=np.int64)
+    valid = np.zeros(count, dtype=bool)
+    messages = [""] * count
+    for index, (year, price, title_date) in enumerate(zip(model_years, sold_prices, title_dates)):
+        try:
+            years[index] = int(year)
+        except (ValueError, TypeError) as e:
+            messages[index] = "Invalid year: {}".format(str(e))
+            continue
+
+        try:
+            prices[index] = int(price)
+        except (ValueError, TypeError):
+            messages[index] = "Cannot depreciate an asset with no purchase price."
+            continue
+
+        if prices[index] == 0:
+            messages[index] = "Cannot depreciate an asset having no initial value."
+            continue
+
+        try:
+            purchased[index] = int(title_date[:4])
+        except Exception:
+            purchased[index] = years[index]
+            messages[index] = "Unable to parse purchase date of '{}'. Used '{}' instead".format(sold_dates[index], year)
+        valid[index] = True
+
+    # If the purchase year is before the model year, use it as the base year.
+    purchased = np.where(purchased == 0, years, purchased)
+    years = np.minimum(years, purchased)
+
+    expired = valid & ((purchased > years + life) | (this_year > years + life))
+    used = valid & ~expired & (purchased > years)
+    active = valid & ~expired
+
+    # A vehicle bought used has that much less useful life left.
+    lengths = np.where(used, life - (purchased - years), life)
+    lengths[~active] = 0
+    start_years = np.where(used, purchased, years)
+    sum_of_years = lengths * (lengths + 1) // 2
+
+    # Year k of a schedule depreciates by (length - k) / sum_of_years of the price.
+    k = np.arange(life)
+    in_schedule = k[None, :] < lengths[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractions = (lengths[:, None] - k[None, :]) / sum_of_years[:, None]
+        depreciation = fractions * prices[:, None].astype(float) * -1
+
+    # Each year's value is the previous year's plus its depreciation, added in
+    # the same order as amortization_schedule() does.
+    steps = np.empty((count, life + 1))
+    steps[:, 0] = prices
+    steps[:, 1:] = np.where(in_schedule, depreciation, 0.0)
+    values = np.add.accumulate(steps, axis=1)
+    values[:, 1:][~in_schedule] = np.nan
+    depreciation[~in_schedule] = np.nan
+    values[lengths == 0, 0] = np.nan
+
+    # The current fair market value is the value at the end of this year.
+    current = this_year - start_years
+    has_fmv = active & (current >= 0) & (current < lengths)
+    fmv = np.full(count, np.nan)
+    fmv[has_fmv] = values[has_fmv, current[has_fmv] + 1]
+
+    for index in np.flatnonzero(expired):
+        messages[index] = "Asset has no significant remaining value due to its age."
+    template = "Normal useful life of {} years reduced to remaining useful life of {} years."
+    for index in np.flatnonzero(used):
+        messages[index] = template.format(life, lengths[index])
+    for index in np.flatnonzero(has_fmv):
+        messages[index] = (messages[index] + " Current FMV = $%9.2f." % fmv[index]).strip()
+
+    return DepreciationSchedules(start_years, lengths, values, depreciation, fmv, messages)
@@ -10,10 +10,10 @@ Copyright (c) 2019 by Thomas J. Daley. All Rights Reserved.
 """
 from decimal import Decimal
 import json
-import requests
 import os
 
-from logger import Logger
+from .logger import Logger
+from .transport import TRANSPORT
 
 BASEURL = {}
 BASEURL["SERIES_SEARCH"] = "https://api.stlouisfed.org/fred/series/search?"
@@ -62,7 +62,7 @@ class Fred(object):
         """
         Retrieve data from FRED servers.
         """
-        response = requests.get(self.make_url(url_name, **params))
+        response = TRANSPORT.get(self.make_url(url_name, **params))
         result = response.content.decode()
         return result
 
@@ -0,0 +1,132 @@
+"""
+lrucache.py - Bounded, thread-safe, in-process least-recently-used cache.
+
+Entries are evicted when the cache holds more than *max_entries* entries or
+more than *max_bytes* bytes (as reported by the caller when an entry is added),
+and are ignored once their expiration time has passed.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import threading
+
+
+class LruCache(object):
+    """
+    Encapsulates a size-bounded LRU cache with per-entry expiration.
+    """
+    def __init__(self, max_bytes: int, max_entries: int):
+        """
+        Instance initializer.
+
+        Args:
+            max_bytes (int): Most number of bytes to hold.
+            max_entries (int): Most number of entries to hold.
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (value, size, expires)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key) -> object:
+        """
+        Retrieve an entry and mark it as most recently used.
+
+        Args:
+            key (object): Key the entry was stored under.
+
+        Returns:
+            (object): The cached value or None if not found or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            (value, size, expires) = entry
+            if expires is not None and expires <= datetime.utcnow():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: object, size: int, expires: datetime = None):
+        """
+        Add or replace an entry, evicting least recently used entries as needed.
+
+        Args:
+            key (object): Key to store the entry under.
+            value (object): Value to store.
+            size (int): Approximate size of *value* in bytes.
+            expires (datetime): UTC time after which the entry is no longer valid.
+        """
+        if size > self.max_bytes:
+            self.invalidate(key)
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires)
+            self.size += size
+
+            while self.size > self.max_bytes or len(self.entries) > self.max_entries:
+                (oldest_key, _) = next(iter(self.entries.items()))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove an entry, if present.
+
+        Args:
+            key (object): Key of entry to remove.
+        """
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove all entries. Counters are not reset.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+        Report cache effectiveness.
+
+        Returns:
+            (dict): Entry count, bytes held, and hit, miss, eviction and expiration counters.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def _remove(self, key):
+        # Caller must hold self.lock
+        (value, size, expires) = self.entries.pop(key)
+        self.size -= size
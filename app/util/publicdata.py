@@ -6,17 +6,26 @@ Based on documentation available at: http://www.publicdata.com/pdapidocs/index.p
 Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
 """
 import base64
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
 import os
 import re
-import requests
-import xml.etree.ElementTree as ET
-import xml
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
-from .database import Database
+from .database import get_database
 from .logger import Logger
+from . import parsepool
+from .resultparser import CHUNK_SIZE, ResultParser
+from .resultset import Deduplicator, SearchResults, SearchResultSet, dedup_ratio
+from .singleflight import SingleFlight
+from .transport import TRANSPORT
+from .xmldocument import XmlDocument
+from . import xmlbackend
 from .all_states import StateAbbreviations
 
+from .classes.baserecord import pack_records, unpack_records
 from .classes.dmvdetails import DmvDetails
 from .classes.dmv_lienholder import DmvLienHolder
 from .classes.dmvsummary import DmvSummary
@@ -27,7 +36,50 @@ from .classes.rpsummary import RealPropertySummary
 
 LOGIN_URL = "https://login.publicdata.com/pdmain.php/logon/checkAccess?disp=XML&login_id={}&password={}"
 SOURCE = "PUBLICDATA"
+SUMMARY_SOURCE = "PUBLICDATA_SUMMARIES"  # Cache source for parsed summary records
+CACHE_SUMMARIES = os.environ.get("PUBLICDATA_CACHE_SUMMARIES", "true").lower() == "true"
 MAX_PAGES = 10  # Most number of pages that we'll pull before telling user the request was too broad
+CREDENTIAL_PARAMS = ["dlnumber", "id"]  # Per-login URL parameters that must not be part of a cache key
+INFLIGHT_TIMEOUT = 180  # Seconds to wait on an identical request that another thread has in flight
+LOGIN_REFRESH_AHEAD = 15 * 60  # Seconds before day keys expire that a search starts replacing them
+LOGIN_REFRESH_LEASE = 60  # Seconds one process has to refresh day keys before another may try
+DMV_STATES = ['co', 'fl', 'ms', 'tx', 'wv', 'wi']  # States we can search for vehicles
+DL_STATES = ['tx', 'fl']  # States we can search for driver's licenses
+DMV_EXEMPTIONS = {
+    'co': "tacDMV=DPPA-01",
+    'fl': "tacDMV=DPPAFL-03",
+    'ms': "tacDMV=DPPA-01",
+    'tx': "tacDMV=DPPATX-01",
+    'wv': "tacDMV=DPPA-01",
+    'wi': "tacDMV=DPPA-01"
+}  # Default exemption code for DMV and driver's license searches, by state
+MAX_FANOUT_WORKERS = 4  # Most number of states we'll search at once in a multi-state search
+FANOUT_TIMEOUT = 300  # Seconds to wait for all states in a multi-state search
+BATCH_CONCURRENCY = 4  # Most number of uncached detail records we'll retrieve at once in batch_details()
+
+# Identical PublicData requests in flight at the same time, across all PublicData instances.
+INFLIGHT = SingleFlight()
+
+# Logins in flight, keyed by username.
+LOGINS = SingleFlight()
+
+# In-process tier in front of the shared login store: username -> (keys, UTC expiration)
+DAYKEYS = {}
+
+# Usernames whose day keys are being refreshed by this process.
+REFRESHING = set()
+REFRESH_LOCK = threading.Lock()
+
+# Duplicate records merged by collect_search() since this process started.
+DEDUP_TOTALS = {"searches": 0, "records": 0, "duplicates": 0}
+DEDUP_LOCK = threading.Lock()
+
+
+class PublicDataSearchError(Exception):
+    """
+    Raised by PublicData.iter_search() when a page of results cannot be retrieved.
+    """
+    pass
 
 
 class PublicData(object):
@@ -39,7 +91,6 @@ class PublicData(object):
         Class Initializer.
         """
         self.logger = Logger.get_logger(log_name="pdws.api")
-        self.daykey_cache = {}
         self.login_date = None
         self.hierarchy = []
 
@@ -59,7 +110,7 @@ class PublicData(object):
 
         # If we've never connected, connect now.
         if self.database is None:
-            database = Database()
+            database = get_database()
             success = database.connect()
             if success:
                 self.database = database
@@ -72,12 +123,20 @@ class PublicData(object):
         except Exception as e:
             self.logger.error("Error testing database connection: %s", e)
             self.database = None
-            database = Database()
+            database = get_database()
             success = database.connect()
 
         return success
 
-    def load_xml(self, url: str, refresh=False, filename: str=None)->(bool, str, object):
+    def load_xml(
+        self,
+        url: str,
+        refresh=False,
+        filename: str=None,
+        cache_key: str=None,
+        record_class=None,
+        record_state: str=None
+    )->(bool, str, object):
         """
         Load XML either from a cached file or a URL. If the cache file exists, we'll load from there.
         If the cache file does not exist, we'll load from the URL.
@@ -87,69 +146,138 @@ class PublicData(object):
             refresh (bool): True to by-pass cached results and force a query to the server.
             filename (str): Name of the cache file to try to load. If omitted (as it normally should be),
                             cacheing is done through the database.
+            cache_key (str): Key to cache the result under. Defaults to *url*. See canonical_query_key().
+            record_class (class): Summary class to map <record> elements to as they arrive. See fetch_xml().
+            record_state (str): U.S. state passed to the record parser, e.g. "TX"
 
         Returns:
             (bool, str, object): The *bool* indicates success or failure.
                                  The *str* provides a diagnostic message.
-                                 The *object* is an ET tree, if successful otherwise NoneType.
+                                 The *object* is an XmlDocument (or ET tree, if loaded from *filename*)
+                                 if successful otherwise NoneType.
         """
         # See if the cache file exists. If so, it is not necessary
         # to query the URL - we will just parse the contents of the file.
         try:
             if filename and os.path.exists(filename) and not refresh:
                 self.logger.debug("Loading from file: %s", filename)
-                tree = ET.parse(filename)
+                tree = xmlbackend.parse(filename)
                 return (True, "OK", tree)
 
+            cache_key = cache_key or url
             if self.database and not refresh:
-                response = self.database.check_cache(SOURCE, url)
+                response = self.database.check_cache(SOURCE, cache_key)
                 if response:
                     self.logger.debug("Loading from cache.")
                     return (True, "OK", response)
 
-            self.logger.debug("Loading from URL: %s", url)
+            # Only one thread fetches a given query at a time. Others asking for the
+            # same query meanwhile wait for that fetch and share its result.
+            if filename:
+                return self.fetch_xml(url, filename, cache_key)
+            return INFLIGHT.do(
+                cache_key,
+                lambda: self.fetch_xml(url, filename, cache_key, record_class, record_state),
+                timeout=INFLIGHT_TIMEOUT)
+        except Exception as e:
+            self.logger.error("Error reading cache or loading from URL: %s", e)
+            self.logger.error("Failed URL: %s", url)
+            self.logger.exception(e)
+            return (False, str(e), None)
 
-            # Retrieve response from server
-            response = requests.get(url, allow_redirects=False)
+        return (False, "Programmer Error", None)
 
-            # Convert response from stream of bytes to string
-            content = response.content.decode()
+    def fetch_xml(
+        self,
+        url: str,
+        filename: str,
+        cache_key: str,
+        record_class=None,
+        record_state: str=None
+    )->(bool, str, object):
+        """
+        Load XML from a URL and cache it. Called by load_xml() after checking the caches.
 
-            # Deserialize response to XML element tree
-            tree = ET.ElementTree(ET.fromstring(content))
+        If a *record_class* is given, each <record> is mapped to it as soon as the
+        bytes that complete it arrive. The records are kept on the XmlDocument
+        (see XmlDocument.take_records()), so that they are not parsed again.
 
-            # See if we got an error response.
-            root = tree.getroot()
-            if root.get("type").lower() == "error":
-                message = error_message(root)
-                return (False, message, tree)
+        Args:
+            url (str): URL to load from.
+            filename (str): Name of file to cache the result in. If None, cacheing is done through the database.
+            cache_key (str): Key to cache the result under.
+            record_class (class): Summary class to map <record> elements to, e.g. DmvSummary. None to only check the XML.
+            record_state (str): U.S. state passed to the record parser, e.g. "TX"
 
-            # All looks ok from a 30,000-foot level.
-            # Cache the response and return it to our caller.
-            if filename:
-                open(filename, "w").write(content)
-            elif self.database:
-                self.database.insert_cache(source=SOURCE, query=url, result=tree)
+        Returns:
+            (bool, str, object): The *bool* indicates success or failure.
+                                 The *str* provides a diagnostic message.
+                                 The *object* is an XmlDocument, if successful otherwise NoneType.
+        """
+        self.logger.debug("Loading from URL: %s", url)
+
+        # Retrieve response from server. Records are parsed, and mapped if we were
+        # given a record class, as they arrive. No tree is built for the whole page.
+        response = TRANSPORT.get(url, allow_redirects=False, stream=True, billable=True)
+        parser = ResultParser()
+        chunks = []
+        records = []
+
+        def map_records(elements):
+            if record_class is None:
+                for element in elements:
+                    pass
             else:
-                self.logger.warn("Unable to cache search result. Is the database down?")
+                records.extend(record_class.from_records(elements, SOURCE, record_state))
 
-            return (True, "OK", tree)
-        except xml.etree.ElementTree.ParseError as e:
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                map_records(parser.feed(chunk))
+            map_records(parser.close())
+        except xmlbackend.PARSE_ERRORS as e:
             self.logger.error("Error parsing XML: %s", e)
-            self.logger.error("Failed XML: %s", content)
-            return (False, str(e), None)
-        except Exception as e:
-            self.logger.error("Error reading cache or loading from URL: %s", e)
-            self.logger.error("Failed URL: %s", url)
-            self.logger.exception(e)
+            self.logger.error("Failed XML: %s", b"".join(chunks))
             return (False, str(e), None)
+        finally:
+            response.close()
+
+        # Keep the raw bytes. If the response had no records, e.g. a details page, the
+        # parser's tree is complete and can be used as is. Otherwise the tree is built
+        # (once) if getroot() is ever called.
+        content = b"".join(chunks)
+        tree = XmlDocument(content, parser.root if parser.record_count == 0 else None)
+
+        # See if we got an error response.
+        if parser.is_error:
+            message = error_message(parser.root)
+            return (False, message, tree)
+
+        if record_class is not None:
+            tree.keep_records(record_class, record_state, records)
+
+        # All looks ok from a 30,000-foot level.
+        # Cache the response and return it to our caller.
+        if filename:
+            open(filename, "wb").write(content)
+        elif self.database:
+            self.database.insert_cache(source=SOURCE, query=cache_key, result=tree)
+        else:
+            self.logger.warn("Unable to cache search result. Is the database down?")
 
-        return (False, "Programmer Error", None)
+        return (True, "OK", tree)
 
     def login(self, username: str, password: str)->(bool, str, dict):
         """
         Attempt to login to the PublicData servers.
 
+        Day keys are shared by every process through the database, so normally
+        only one process logs in per user per day. When saved keys are within
+        LOGIN_REFRESH_AHEAD seconds of expiring, they are returned and replaced
+        in the background (see start_login_refresh()), so that the user's first
+        search of the new day does not have to wait on a login. Users who are
+        not searching are not refreshed.
+
         Args:
             username (str): The login_id to be used.
             password (str): The password to be used.
@@ -159,66 +287,176 @@ class PublicData(object):
                          a diagnostic message; and dict is the data we need for this user.
         """
         try:
-            # Generate name of today's login response.
-            xml_file_name = "{}-{}-login.xml".format(today_yyyymmdd(), username)
+            # Return saved keys if anyone has already logged in as this user today.
+            keys = self.saved_login(username)
+            if keys:
+                if keys_expiring(username):
+                    self.start_login_refresh(username, password)
+                return (True, "OK", keys)
+
+            # Only one thread in this process logs in as a given user at a time.
+            return LOGINS.do(
+                username,
+                lambda: self.remote_login(username, password),
+                timeout=INFLIGHT_TIMEOUT)
+        except Exception as e:
+            self.logger.error("Error connecting to %s: %s", LOGIN_URL, e)
+            self.logger.exception(e)
+            message = str(e)
 
-            # Return cached result if we've already logged in today.
-            if xml_file_name in self.daykey_cache:
-                return (True, "OK", self.daykey_cache[xml_file_name])
+        return (False, message, {})
 
-            #####
-            # First time this user has logged in, so connect to the server and try to login.
-            #####
+    def saved_login(self, username: str)->dict:
+        """
+        Look for unexpired day keys, first in this process and then in the database.
 
-            # Format URL
-            url = LOGIN_URL.format(username, password)
-            # Load XML tree from file or URL
-            (success, message, tree) = self.load_xml(url, filename=xml_file_name)
+        Args:
+            username (str): The login_id the keys were issued to.
+
+        Returns:
+            (dict): Keys returned by a previous login or None if there are none.
+        """
+        entry = DAYKEYS.get(username)
+        if entry and entry[1] > datetime.utcnow():
+            return entry[0]
+
+        if not self.database:
+            return None
 
+        try:
+            document = self.database.get_login(username)
+        except Exception as e:
+            self.logger.error("Error reading saved login for %s: %s", username, e)
+            return None
+
+        if not document:
+            return None
+
+        DAYKEYS[username] = (document["keys"], document["expires"])
+        return document["keys"]
+
+    def remote_login(self, username: str, password: str)->(bool, str, dict):
+        """
+        Login to the PublicData servers and save the day keys we get back.
+        The response is not cached: its URL contains the user's password.
+
+        Args:
+            username (str): The login_id to be used.
+            password (str): The password to be used.
+
+        Returns:
+            (bool, str, dict): Same as login().
+        """
+        self.logger.debug("Logging in to PublicData as %s", username)
+
+        # Retrieve response from server
+        url = LOGIN_URL.format(username, password)
+        response = TRANSPORT.get(url, allow_redirects=False)
+        root = XmlDocument(response.content).getroot()
+
+        if (root.get("type") or "").lower() == "error":
+            return (False, error_message(root), {})
+
+        # We have our XML tree, now process it.
+        self.login_date = today_yyyymmdd()
+
+        child = root.find("user")
+        sid = child.find("id").text
+
+        # If we get a NoneType *id*, the login failed.
+        if not sid:
+            child = root.find("pdheaders")
+            message = child.find("pdheader1").text
+            return (False, message, {})
+
+        # Successful login . . . keep going.
+        session_id = child.find("sessionid").text
+        login_id = child.find("dlnumber").text
+
+        child = root.find("servers")
+        search_server = child.find("searchserver").text
+        login_server = child.find("loginserver").text
+        main_server = child.find("mainserver").text
+
+        # Update Day Key Cache
+        keys = {
+            "session_id": session_id,
+            "login_id": login_id,
+            "search_server": search_server,
+            "login_server": login_server,
+            "main_server": main_server,
+            "id": sid
+            }
+        # Keys issued just before midnight are the ones we'll use tomorrow.
+        expires = next_day_boundary(datetime.now() + timedelta(seconds=LOGIN_REFRESH_AHEAD))
+        DAYKEYS[username] = (keys, expires)
+
+        if self.database:
+            try:
+                self.database.save_login(username, keys, expires)
+            except Exception as e:
+                self.logger.error("Error saving login for %s: %s", username, e)
+        else:
+            self.logger.warn("Unable to share login. Is the database down?")
+
+        # TODO: Check our remaining searches and post a warning if low and a panic message is depleted.
+
+        return (True, "OK", keys)
+
+    def start_login_refresh(self, username: str, password: str):
+        """
+        Replace this user's day keys on a background thread, unless this process
+        is already doing so. Called by login() from a search, so the password
+        is only held until this one login attempt finishes. If the attempt fails,
+        the user's next search starts another.
+
+        Args:
+            username (str): The login_id to be used.
+            password (str): The password to be used.
+        """
+        with REFRESH_LOCK:
+            if username in REFRESHING:
+                return
+            REFRESHING.add(username)
+
+        thread = threading.Thread(target=self.refresh_login, args=(username, password), daemon=True)
+        thread.start()
+
+    def refresh_login(self, username: str, password: str):
+        """
+        Replace day keys that are about to expire. Runs on a thread started by
+        start_login_refresh(). If another process has already replaced the keys
+        we use its keys. If another process has claimed the refresh, we keep
+        using the old keys until it saves new ones.
+
+        Args:
+            username (str): The login_id to be used.
+            password (str): The password to be used.
+        """
+        try:
+            # Another process may already have saved new keys.
+            document = self.database.get_login(username) if self.database else None
+            if document and document["expires"] > DAYKEYS.get(username, (None, datetime.min))[1]:
+                DAYKEYS[username] = (document["keys"], document["expires"])
+                if not keys_expiring(username):
+                    return
+
+            if self.database and not self.database.claim_login_refresh(username, LOGIN_REFRESH_LEASE):
+                self.logger.debug("Login for %s is being refreshed by another process.", username)
+                return
+
+            (success, message, keys) = LOGINS.do(
+                username,
+                lambda: self.remote_login(username, password),
+                timeout=INFLIGHT_TIMEOUT)
             if not success:
-                return (success, message, {})
-
-            # We have our XML tree, now process it.
-            root = tree.getroot()
-            self.login_date = today_yyyymmdd()
-
-            child = root.find("user")
-            sid = child.find("id").text
-
-            # If we get a NoneType *id*, the login failed.
-            if not sid:
-                child = root.find("pdheaders")
-                message = child.find("pdheader1").text
-                return (False, message, {})
-
-            # Successful login . . . keep going.
-            session_id = child.find("sessionid").text
-            login_id = child.find("dlnumber").text
-
-            child = root.find("servers")
-            search_server = child.find("searchserver").text
-            login_server = child.find("loginserver").text
-            main_server = child.find("mainserver").text
-
-            # Update Day Key Cache
-            keys = {
-                "session_id": session_id,
-                "login_id": login_id,
-                "search_server": search_server,
-                "login_server": login_server,
-                "main_server": main_server,
-                "id": sid
-                }
-            self.daykey_cache[xml_file_name] = keys
-            # TODO: Check our remaining searches and post a warning if low and a panic message is depleted.
-
-            return (True, "OK", keys)
+                self.logger.error("Unable to refresh login for %s: %s", username, message)
         except Exception as e:
-            self.logger.error("Error connecting to %s: %s", LOGIN_URL, e)
+            self.logger.error("Error refreshing login for %s: %s", username, e)
             self.logger.exception(e)
-            message = str(e)
-
-        return (False, message)
+        finally:
+            with REFRESH_LOCK:
+                REFRESHING.discard(username)
 
     def tax_records(self, credentials: dict, search_terms: str, match_type: str="all", match_scope: str="name", us_state: str="tx", refresh: bool=False)->(bool, str, object):
         """
@@ -256,7 +494,9 @@ class PublicData(object):
         match_type: str="all",
         match_scope: str="main",
         us_state: str="tx",
-        refresh: bool=False
+        refresh: bool=False,
+        result_set: bool=False,
+        cancel: threading.Event=None
     )->(bool, str, list):
         """
         Search Driver's License records.
@@ -268,16 +508,19 @@ class PublicData(object):
             match_scope (str): Type of search ("main", "name", "dob", "dlnum")
             us_state (str): U.S. state to search. "tx" and "fl" is the only legal values
             refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            result_set (bool): Return a SearchResultSet instead of a list.
             exemption (str): Exemption code to use for this search. Illegal to search without an exemption
+            cancel (Event): If set while the search is running, no more pages are retrieved. See iter_search().
 
         Returns:
             (
                 (bool): Success?
                 (str): Message explaining any error that's reported.
-                (list): List of DmvSummary instances
+                (list): List of DmvSummary instances,
+                        or a SearchResultSet if *result_set* is True.
             )
         """
-        valid_states = ['tx', 'fl']
+        valid_states = DL_STATES
         if us_state.lower() not in valid_states:
             message = "Cannot search for driver's license in {}. Can only search {}.".format(us_state, ", ".join(valid_states))
             return (False, message, [])
@@ -299,63 +542,67 @@ class PublicData(object):
             exemption = exemption or "tacDMV=DPPAFL-03"
 
         db_name = "{}dl{}|{}".format(us_state, db_ending, match_scope)
-        summaries = []
-
-        # Loop through paged results.
-        more_pages = True
-        searchmoreid = None
-        max_pages = MAX_PAGES  # Not going to pull more than this many pages, no matter how many there are.
-        while more_pages and max_pages > 0:
-            (success, message, tree) = self.search(credentials,
-                                                   db_name=db_name,
-                                                   search_terms=search_terms,
-                                                   match_scope=match_scope,
-                                                   exemption=exemption,
-                                                   searchmoreid=searchmoreid)
-
-            # If we encoutered a problem, return whatever we already accumluated, if anything
-            if not success:
-                return (False, message, summaries)
-
-            # Successful search (meaning no errors)
-            # Append results to our list of summaries are accumulating
-            max_pages -= 1
-            root = tree.getroot()
-            drivers = root.findall("./results/record")
-            for driver in drivers:
-                dl_summary = DlSummary()
-                dl_summary.from_xml(driver, SOURCE, us_state.upper())
-                summaries.append(dl_summary)
-
-            # See if there are other pages of results to process.
-            try:
-                more_pages = (root.findall("./results")[0].get("ismore")).lower() == "true"
-            except IndexError:
-                more_pages = False
+        return self.collect_search(credentials,
+                                   record_class=DlSummary,
+                                   db_name=db_name,
+                                   search_terms=search_terms,
+                                   match_type=match_type,
+                                   match_scope=match_scope,
+                                   us_state=us_state,
+                                   exemption=exemption,
+                                   refresh=refresh,
+                                   result_set=result_set,
+                                   cancel=cancel)
+
+    def drivers_license_multi_state(
+        self,
+        credentials: dict,
+        search_terms: str,
+        us_states: list=None,
+        match_type: str="all",
+        match_scope: str="main",
+        refresh: bool=False,
+        max_workers: int=MAX_FANOUT_WORKERS,
+        timeout: float=FANOUT_TIMEOUT
+    )->(bool, str, list, dict):
+        """
+        Search Driver's License records in several states at once. See fan_out().
 
-            # If there are more, get reference to the next page id.
-            if more_pages:
-                searchmoreid = root.findall("./results")[0].get("searchmoreid")
+        Args:
+            credentials (dict): username and password for Public Data service.
+            search_terms (str): The text being searched (DOB is YYYYMMDD)
+            us_states (list): U.S. states to search. Defaults to every state in DL_STATES.
+                              States we have no DlSummary mappings for are skipped.
+            match_type (str): "all" or "any" depending on how to want to search for each word in search_terms
+            match_scope (str): Type of search ("main", "name", "dob", "dlnum")
+            refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            max_workers (int): Most number of states to search at the same time.
+            timeout (float): Seconds to wait for all the states to finish.
 
-        return (success, message, summaries)
+        Returns:
+            (
+                (bool): True if at least one state was searched successfully.
+                (str): Message explaining any errors that were reported.
+                (list): De-duplicated list of DlSummary instances from every state.
+                (dict): Per-state report. See fan_out().
+            )
+        """
+        return self.fan_out(self.drivers_license,
+                            mapped_states(DlSummary, us_states or DL_STATES),
+                            max_workers,
+                            timeout,
+                            credentials=credentials,
+                            search_terms=search_terms,
+                            match_type=match_type,
+                            match_scope=match_scope,
+                            refresh=refresh)
 
     def driver_details(self, credentials, db, ed, rec, us_state, exemption: str=None, refresh: bool=False)->(bool, str, object):
-        exemption = exemption or {
-            'co': "tacDMV=DPPA-01",
-            'fl': "tacDMV=DPPAFL-03",
-            'ms': "tacDMV=DPPA-01",
-            'tx': "tacDMV=DPPATX-01",
-            'wv': "tacDMV=DPPA-01",
-            'wi': "tacDMV=DPPA-01"
-            }[us_state.lower()]
+        exemption = exemption or DMV_EXEMPTIONS[us_state.lower()]
         (success, message, tree) = self.details(credentials, db, rec, ed, exemption, refresh)
         details = None
         if success:
-            root = tree.getroot()
-            fields = root.findall("./dataset/dataitem/textdata")
-            details = DlDetails()
-            details.from_xml(fields[0], SOURCE, us_state)
-            details.state = us_state
+            details = driver_details_from_tree(tree, us_state)
 
         return (success, message, details)
 
@@ -367,7 +614,9 @@ class PublicData(object):
         match_type: str="all",
         match_scope: str="name",
         us_state: str="tx",
-        refresh: bool=False
+        refresh: bool=False,
+        result_set: bool=False,
+        cancel: threading.Event=None
     )->(bool, str, list):
         """
         Search DMV records.
@@ -379,16 +628,19 @@ class PublicData(object):
             match_scope (str): Type of search: "main", "name", "plate", "vin"
             us_state (str): U.S. state to search. "tx" is the only useful value
             refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            result_set (bool): Return a SearchResultSet instead of a list.
             exemption (str): Exemption code to use for this search. Illegal to search without an exemption
+            cancel (Event): If set while the search is running, no more pages are retrieved. See iter_search().
 
         Returns:
             (
                 (bool): Success?
                 (str): Message explaining any error that's reported.
-                (list): List of DmvSummary instances
+                (list): List of DmvSummary instances,
+                        or a SearchResultSet if *result_set* is True.
             )
         """
-        valid_states = ['co', 'fl', 'ms', 'tx', 'wv', 'wi']
+        valid_states = DMV_STATES
         if us_state.lower() not in valid_states:
             message = "Cannot search for driver's license in {}. Can only search {}.".format(us_state, ", ".join(valid_states))
             return (False, message, [])
@@ -401,82 +653,169 @@ class PublicData(object):
             message = "Invalid match scope: {}. Must be one of: {}".format(match_scope, ", ".join(valid_scopes))
             return (False, message, [])
 
-        exemption = exemption or {
-            'co': "tacDMV=DPPA-01",
-            'fl': "tacDMV=DPPAFL-03",
-            'ms': "tacDMV=DPPA-01",
-            'tx': "tacDMV=DPPATX-01",
-            'wv': "tacDMV=DPPA-01",
-            'wi': "tacDMV=DPPA-01"
-            }[us_state.lower()]
+        exemption = exemption or DMV_EXEMPTIONS[us_state.lower()]
 
         # Slight variation in database name, depending on which state
         if us_state == "wi":
             db_name = "grp_dmv_wi_advanced_main"
         else:
             db_name = "{}dmv|{}".format(us_state, match_scope)
-        summaries = []
+        return self.collect_search(credentials,
+                                   record_class=DmvSummary,
+                                   db_name=db_name,
+                                   search_terms=search_terms,
+                                   match_type=match_type,
+                                   match_scope=match_scope,
+                                   us_state=us_state,
+                                   exemption=exemption,
+                                   refresh=refresh,
+                                   result_set=result_set,
+                                   cancel=cancel)
+
+    def dmv_multi_state(
+        self,
+        credentials: dict,
+        search_terms: str,
+        us_states: list=None,
+        match_type: str="all",
+        match_scope: str="name",
+        refresh: bool=False,
+        max_workers: int=MAX_FANOUT_WORKERS,
+        timeout: float=FANOUT_TIMEOUT
+    )->(bool, str, list, dict):
+        """
+        Search DMV records in several states at once. See fan_out().
 
-        # Loop through paged results.
-        more_pages = True
-        searchmoreid = None
-        max_pages = MAX_PAGES  # Not going to pull more than this many pages, no matter how many there are.
-        while more_pages and max_pages > 0:
-            (success, message, tree) = self.search(credentials,
-                                                   db_name=db_name,
-                                                   search_terms=search_terms,
-                                                   match_scope=match_scope,
-                                                   exemption=exemption,
-                                                   searchmoreid=searchmoreid)
-
-            # If we encoutered a problem, return whatever we already accumluated, if anything
-            if not success:
-                return (False, message, summaries)
-
-            # Successful search (meaning no errors)
-            # Append results to our list of summaries are accumulating
-            max_pages -= 1
-            root = tree.getroot()
-            cars = root.findall("./results/record")
-            for car in cars:
-                dmv_summary = DmvSummary()
-                dmv_summary.from_xml(car, SOURCE, us_state.upper())
-                summaries.append(dmv_summary)
-
-            # See if there are other pages of results to process.
-            # print("IS MORE?",(root.findall("./results")[0].get("ismore")).lower())
-            try:
-                more_pages = (root.findall("./results")[0].get("ismore")).lower() == "true"
-            except IndexError:
-                more_pages = False
+        Args:
+            credentials (dict): username and password for Public Data service.
+            search_terms (str): The text being searched
+            us_states (list): U.S. states to search. Defaults to every state in DMV_STATES.
+                              States we have no DmvSummary mappings for are skipped.
+            match_type (str): "all" or "any" depending on how to want to search for each word in search_terms
+            match_scope (str): Type of search: "main", "name", "plate", "vin"
+            refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            max_workers (int): Most number of states to search at the same time.
+            timeout (float): Seconds to wait for all the states to finish.
+
+        Returns:
+            (
+                (bool): True if at least one state was searched successfully.
+                (str): Message explaining any errors that were reported.
+                (list): De-duplicated list of DmvSummary instances from every state.
+                (dict): Per-state report. See fan_out().
+            )
+        """
+        return self.fan_out(self.dmv,
+                            mapped_states(DmvSummary, us_states or DMV_STATES),
+                            max_workers,
+                            timeout,
+                            credentials=credentials,
+                            search_terms=search_terms,
+                            match_type=match_type,
+                            match_scope=match_scope,
+                            refresh=refresh)
+
+    def fan_out(self, search_function, us_states: list, max_workers: int, timeout: float, **kwargs)->(bool, str, list, dict):
+        """
+        Run a single-state search function for several states on a bounded pool of
+        worker threads, then merge the results. Results from states that succeed
+        are returned even if other states fail or time out.
+
+        When *timeout* expires, states that have not started are cancelled and
+        those still running are told to stop before requesting another page.
+        We then wait for the page each has in flight, so that no worker is left
+        running, and spending queries, after we return.
 
-            # If there are more, get reference to the next page id.
-            if more_pages:
-                searchmoreid = root.findall("./results")[0].get("searchmoreid")
+        Summaries are de-duplicated by their hash, keeping the first one found in
+        *us_states* order and merging the provenance of the others into it. The
+        returned list's *dedup_stats* counts the duplicates merged within each
+        state as well as across states.
 
-        return (success, message, summaries)
+        Args:
+            search_function (function): E.g. self.dmv or self.drivers_license. Must take a *cancel* argument.
+            us_states (list): U.S. states to search.
+            max_workers (int): Most number of states to search at the same time.
+            timeout (float): Seconds to wait for the states to finish before cancelling the rest.
+            kwargs: Other arguments to pass to *search_function*. Must include *credentials*.
+
+        Returns:
+            (
+                (bool): True if at least one state was searched successfully.
+                (str): "OK" or a message listing the states that failed.
+                (list): De-duplicated SearchResults of summaries from every state.
+                (dict): Keyed by state: {"success", "message", "count", "seconds", "dedup"}
+            )
+        """
+        if not us_states:
+            return (False, "None of the requested states can be searched.", [], {})
+
+        # Log in once up front so the workers don't all race to do it.
+        credentials = kwargs["credentials"]
+        (success, message, keys) = self.login(username=credentials["username"], password=credentials["password"])
+        if not success:
+            return (False, message, [], {})
+
+        cancel = threading.Event()
+
+        def timed_search(us_state):
+            start = time.perf_counter()
+            result = search_function(us_state=us_state, cancel=cancel, **kwargs)
+            return result + (time.perf_counter() - start,)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(us_states)))) as executor:
+            futures = {us_state: executor.submit(timed_search, us_state) for us_state in us_states}
+            (done, timed_out) = wait(futures.values(), timeout=timeout)
+            if timed_out:
+                cancel.set()
+                for future in timed_out:
+                    future.cancel()
+
+        report = {}
+        summaries = []
+        deduplicator = Deduplicator()
+        for us_state in us_states:
+            future = futures[us_state]
+            if future.cancelled():
+                report[us_state] = {"success": False, "message": "Timed out", "count": 0, "seconds": None}
+                continue
+
+            try:
+                (success, message, state_summaries, seconds) = future.result()
+            except Exception as e:
+                self.logger.exception(e)
+                report[us_state] = {"success": False, "message": str(e), "count": 0, "seconds": None}
+                continue
+
+            # Keep the pages a timed-out state had already retrieved.
+            if future in timed_out:
+                (success, message) = (False, "Timed out")
+
+            state_stats = getattr(state_summaries, "dedup_stats", None)
+            report[us_state] = {
+                "success": success,
+                "message": message,
+                "count": len(state_summaries),
+                "seconds": round(seconds, 3),
+                "dedup": state_stats
+            }
+            if state_stats:
+                deduplicator.count_merged(state_stats["duplicates"])
+            for summary in state_summaries:
+                if deduplicator.add(summary):
+                    summaries.append(summary)
+
+        failures = ["{} ({})".format(us_state, item["message"]) for us_state, item in report.items() if not item["success"]]
+        success = len(failures) < len(us_states)
+        message = "Search failed for: {}".format("; ".join(failures)) if failures else "OK"
+        self.logger.debug("Multi-state search report: %s", report)
+        return (success, message, SearchResults(summaries, deduplicator.stats()), report)
 
     def dmv_details(self, credentials, db, ed, rec, us_state, exemption: str=None, refresh: bool=False)->(bool, str, DmvDetails):
-        exemption = exemption or {
-            'co': "tacDMV=DPPA-01",
-            'fl': "tacDMV=DPPAFL-03",
-            'ms': "tacDMV=DPPA-01",
-            'tx': "tacDMV=DPPATX-01",
-            'wv': "tacDMV=DPPA-01",
-            'wi': "tacDMV=DPPA-01"
-            }[us_state.lower()]
+        exemption = exemption or DMV_EXEMPTIONS[us_state.lower()]
         (success, message, tree) = self.details(credentials, db, rec, ed, exemption, refresh)
         details = None
         if success:
-            root = tree.getroot()
-            fields = root.findall("./dataset/dataitem/textdata")
-            details = DmvDetails()
-            details.from_xml(fields[0], SOURCE, us_state)
-            lien_holders = root.findall("./dataset/dataitem/dataset[@label='Lien Holders']")
-            for lien in lien_holders:
-                lien_holder = DmvLienHolder()
-                lien_holder.from_xml(lien, SOURCE, us_state)
-                details.lien_holders.append(lien_holder)
+            details = dmv_details_from_tree(tree, us_state)
 
         return (success, message, details)
 
@@ -487,7 +826,8 @@ class PublicData(object):
         match_type: str="all",
         match_scope: str="name",
         us_state: str="tx",
-        refresh: bool=False
+        refresh: bool=False,
+        result_set: bool=False
     )->(bool, str, list):
         """
         Search Real Property records.
@@ -499,12 +839,14 @@ class PublicData(object):
             match_scope (str): Type of search: "main", "name"
             us_state (str): U.S. state to search, "*" = search all states
             refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            result_set (bool): Return a SearchResultSet instead of a list.
 
         Returns:
             (
                 (bool): Success?
                 (str): Message explaining any error that's reported.
-                (list): List of RealPropertySummary instances
+                (list): List of RealPropertySummary instances,
+                        or a SearchResultSet if *result_set* is True.
             )
         """
         valid_states = StateAbbreviations
@@ -525,72 +867,438 @@ class PublicData(object):
             db_name = f"grp_cad_advanced_{match_scope.lower()}"
         else:
             db_name = f"grp_cad_{us_state.lower()}_advanced_{match_scope.lower()}"
+        return self.collect_search(credentials,
+                                   record_class=RealPropertySummary,
+                                   db_name=db_name,
+                                   search_terms=search_terms,
+                                   match_type=match_type,
+                                   match_scope=match_scope,
+                                   us_state=us_state,
+                                   refresh=refresh,
+                                   result_set=result_set)
+
+    def property_details(self, credentials: dict, db: str, ed: str, rec: str, us_state: str):
+        (success, message, tree) = self.details(credentials, db, rec, ed, None, False)
+        details = None
+        if success:
+            details = property_details_from_tree(tree, us_state)
+
+        return (success, message, details)
+
+    def iter_search(
+        self,
+        credentials: dict,
+        record_class,
+        db_name: str,
+        search_terms: str,
+        match_type: str="all",
+        match_scope: str="name",
+        us_state: str="tx",
+        exemption: str=None,
+        refresh: bool=False,
+        max_pages: int=MAX_PAGES,
+        deduplicator: Deduplicator=None,
+        cancel: threading.Event=None
+    ):
+        """
+        Generator that yields summary records one page at a time.
+
+        While the records from page N are being yielded, page N+1 is already
+        being retrieved on a background thread. Records on a page retrieved from
+        PublicData are mapped by fetch_xml() as the bytes arrive, and are not
+        parsed again here. Cached pages are parsed incrementally (see
+        ResultParser), so no page is ever held as a whole tree. If the parse pool
+        is turned on, cached pages with at least parsepool.PARSE_POOL_THRESHOLD
+        records are parsed in a worker process instead. That takes longer, but
+        this thread does not hold the GIL while they are.
+
+        If a *deduplicator* is given, a record having the same hash as one already
+        yielded, from this page or an earlier one, is not yielded. Instead, its
+        provenance is merged into the record that was.
+
+        If *cancel* is set, no further page is requested and PublicDataSearchError
+        is raised once the page in flight has been yielded.
+
+        Args:
+            credentials (dict): username and password for Public Data service.
+            record_class (class): Summary class used to parse each <record>, e.g. DmvSummary
+            db_name (str): Name of database to search
+            search_terms (str): The text being searched
+            match_type (str): "all" or "any" depending on how to want to search for each word in search_terms
+            match_scope (str): Type of search, e.g. "main", "name"
+            us_state (str): U.S. state passed to the record parser
+            exemption (str): Exemption code when searching otherwise protected information.
+            refresh (bool): True to force a load from the remote URL; False to use recently cached result
+            max_pages (int): Most number of pages to retrieve.
+            deduplicator (Deduplicator): Drops and merges duplicate records. None to keep them all.
+            cancel (Event): Set by another thread to stop the search.
+
+        Yields:
+            (object): Instances of *record_class*
+
+        Raises:
+            PublicDataSearchError: If a page could not be retrieved. Records from
+                earlier pages will already have been yielded.
+        """
+        def fetch(searchmoreid):
+            return self.search(credentials,
+                               db_name=db_name,
+                               search_terms=search_terms,
+                               match_type=match_type,
+                               match_scope=match_scope,
+                               us_state=us_state,
+                               exemption=exemption,
+                               refresh=refresh,
+                               searchmoreid=searchmoreid,
+                               record_class=record_class)
+
+        def cancelled():
+            return cancel is not None and cancel.is_set()
+
+        def start_next(page):
+            nonlocal pending
+            if page.ismore and pages_left > 0 and not cancelled():
+                pending = executor.submit(fetch, page.searchmoreid)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(fetch, None)
+            pages_left = max_pages
+
+            while pending:
+                (success, message, tree) = pending.result()
+                pending = None
+
+                # If we encoutered a problem, stop. Our caller already has whatever we yielded.
+                if not success:
+                    raise PublicDataSearchError(message)
+
+                pages_left -= 1
+
+                # The next page is requested as soon as the parser reaches <results>
+                # and we know there is one. If fetch_xml() mapped this page's records
+                # as it received them, the parser only reads that far.
+                if not isinstance(tree, XmlDocument):
+                    tree = XmlDocument.from_tree(tree)
+                parser = ResultParser(on_results=start_next)
+                mode = None
+                start = time.perf_counter()
+                try:
+                    summaries = tree.take_records(record_class, us_state.upper())
+                    if summaries is not None:
+                        parser.read_head(tree.raw)
+                        record_count = len(summaries)
+                    else:
+                        record_count = parsepool.count_records(tree.raw)
+                        if parsepool.use_pool(record_count):
+                            mode = "pool"
+                            summaries = self.parse_in_pool(parser, record_class, tree.raw, us_state)
+                        else:
+                            mode = "inline"
+                            summaries = record_class.from_records(parser.parse(tree.raw), SOURCE, us_state.upper())
+                    for summary in summaries:
+                        if deduplicator is None or deduplicator.add(summary):
+                            yield summary
+                except xmlbackend.PARSE_ERRORS as e:
+                    raise PublicDataSearchError("Error parsing XML: {}".format(e))
+
+                if parser.is_error:
+                    raise PublicDataSearchError(error_message(parser.root))
+
+                if mode:
+                    seconds = time.perf_counter() - start
+                    parsepool.PARSE_STATS.add(mode, record_count, seconds)
+                    self.logger.debug("Parsed %d records %s in %.3f seconds.", record_count, mode, seconds)
+
+                # Done with this page.
+                del tree, parser
+
+                if cancelled():
+                    raise PublicDataSearchError("Search cancelled")
+
+    def parse_in_pool(self, parser: ResultParser, record_class, raw: bytes, us_state: str)->list:
+        """
+        Parse a page of search results in a worker process. See parsepool.
+
+        Args:
+            parser (ResultParser): Reads just the head of the page here, so that its
+                                   *on_results* callback can request the next page.
+            record_class (class): Summary class used to parse each <record>, e.g. DmvSummary
+            raw (bytes): The page.
+            us_state (str): U.S. state passed to the record parser
+
+        Returns:
+            (list): Instances of *record_class*
+
+        Raises:
+            PublicDataSearchError: If the page could not be parsed or is an error response.
+        """
+        future = parsepool.submit(record_class, raw, SOURCE, us_state.upper())
+        parser.read_head(raw)
+        page = future.result()
+
+        if page["error"]:
+            raise PublicDataSearchError(page["error"])
+        if page["is_error"]:
+            raise PublicDataSearchError(error_message(xmlbackend.fromstring(raw)))
+        return parsepool.unpack_page(record_class, page)
+
+    def collect_search(
+        self,
+        credentials: dict,
+        record_class,
+        cache_summaries: bool=CACHE_SUMMARIES,
+        result_set: bool=False,
+        dedup: bool=True,
+        cancel: threading.Event=None,
+        **kwargs
+    )->(bool, str, list):
+        """
+        Run iter_search() to completion and collect the records into a list.
+
+        If *dedup* is True, records repeated on later pages are merged into the
+        first one found (see Deduplicator) and the returned list's *dedup_stats*
+        reports how many were merged.
+
+        If *cache_summaries* is True, the finished list is cached in compact form,
+        so that repeating the search does not parse any XML. The cache key includes
+        the version of *record_class*'s MAPPINGS, so changing them invalidates it.
+
+        Args:
+            credentials (dict): username and password for Public Data service.
+            record_class (class): Summary class used to parse each <record>, e.g. DmvSummary
+            cache_summaries (bool): Whether to cache the parsed records.
+            result_set (bool): Return a SearchResultSet instead of a list.
+            dedup (bool): Merge duplicate records.
+            cancel (Event): Passed to iter_search(). A cancelled search is returned as a failure.
+            kwargs: Other arguments to pass to iter_search()
+
+        Returns:
+            (
+                (bool): Success?
+                (str): Message explaining any error that's reported.
+                (list): SearchResults of *record_class* instances, including those accumulated before any error.
+                        A SearchResultSet if *result_set* is True.
+            )
+        """
+        # Cached lists are de-duplicated, so they are only used when that's what we want.
+        cache_key = None
+        if cache_summaries and dedup and self.database:
+            cache_key = self.summary_cache_key(credentials, record_class, **kwargs)
+
+        if cache_key and not kwargs.get("refresh"):
+            try:
+                packed = self.database.check_cache(SUMMARY_SOURCE, cache_key)
+                if packed:
+                    self.logger.debug("Loading summaries from cache.")
+                    dedup_stats = packed.get("dedup_stats")
+                    if result_set:
+                        results = SearchResultSet.from_packed(record_class, packed)
+                        results.dedup_stats = dedup_stats
+                        return (True, "OK", results)
+                    return (True, "OK", SearchResults(unpack_records(record_class, packed), dedup_stats))
+            except Exception as e:
+                self.logger.error("Error reading cached summaries: %s", e)
+
+        deduplicator = Deduplicator() if dedup else None
         summaries = []
+        try:
+            for summary in self.iter_search(credentials, record_class, deduplicator=deduplicator, cancel=cancel, **kwargs):
+                summaries.append(summary)
+        except PublicDataSearchError as e:
+            dedup_stats = self.dedup_report(deduplicator)
+            return (False, str(e), as_results(summaries, record_class, result_set, dedup_stats))
 
-        # Loop through paged results.
-        more_pages = True
-        searchmoreid = None
-        max_pages = MAX_PAGES  # Not going to pull more than this many pages, no matter how many there are.
-        while more_pages and max_pages > 0:
-            (success, message, tree) = self.search(credentials,
-                                                   db_name=db_name,
-                                                   search_terms=search_terms,
-                                                   match_scope=match_scope,
-                                                   searchmoreid=searchmoreid)
-
-            # If we encoutered a problem, return whatever we already accumluated, if anything
-            if not success:
-                return (False, message, summaries)
-
-            # Successful search (meaning no errors)
-            # Append results to our list of summaries are accumulating
-            max_pages -= 1
-            root = tree.getroot()
-            properties = root.findall("./results/record")
-            for item in properties:
-                rp_summary = RealPropertySummary()
-                rp_summary.from_xml(item, SOURCE, us_state.upper())
-                summaries.append(rp_summary)
-
-            # See if there are other pages of results to process.
-            # print("IS MORE?",(root.findall("./results")[0].get("ismore")).lower())
+        dedup_stats = self.dedup_report(deduplicator)
+
+        # Only complete lists are cached.
+        if cache_key:
             try:
-                more_pages = (root.findall("./results")[0].get("ismore")).lower() == "true"
-            except IndexError:
-                more_pages = False
+                packed = pack_records(summaries)
+                packed["dedup_stats"] = dedup_stats
+                self.database.insert_cache(source=SUMMARY_SOURCE, query=cache_key, result=packed)
+            except Exception as e:
+                self.logger.error("Error caching summaries: %s", e)
 
-            # If there are more, get reference to the next page id.
-            if more_pages:
-                searchmoreid = root.findall("./results")[0].get("searchmoreid")
+        return (True, "OK", as_results(summaries, record_class, result_set, dedup_stats))
 
-        return (success, message, summaries)
+    def dedup_report(self, deduplicator: Deduplicator)->dict:
+        """
+        Log how many duplicates a search merged and add them to DEDUP_TOTALS.
 
-    def property_details(self, credentials: dict, db: str, ed: str, rec: str, us_state: str):
-        (success, message, tree) = self.details(credentials, db, rec, ed, None, False)
-        details = None
-        if success:
-            root = tree.getroot()
+        Args:
+            deduplicator (Deduplicator): The one the search used, or None.
+
+        Returns:
+            (dict): See Deduplicator.stats(). None if the search did not de-duplicate.
+        """
+        if deduplicator is None:
+            return None
+
+        stats = deduplicator.stats()
+        with DEDUP_LOCK:
+            DEDUP_TOTALS["searches"] += 1
+            DEDUP_TOTALS["records"] += stats["records"]
+            DEDUP_TOTALS["duplicates"] += stats["duplicates"]
+        self.logger.debug("Merged %d of %d records as duplicates (%.1f%%).",
+                          stats["duplicates"], stats["records"], stats["ratio"] * 100)
+        return stats
+
+    def summary_cache_key(
+        self,
+        credentials: dict,
+        record_class,
+        db_name: str,
+        search_terms: str,
+        match_type: str="all",
+        match_scope: str="name",
+        us_state: str="tx",
+        exemption: str=None,
+        refresh: bool=False,
+        max_pages: int=MAX_PAGES
+    )->str:
+        """
+        Build the key that collect_search() caches parsed records under. Takes the
+        same arguments as iter_search(). Does not login: canonical_query_key()
+        drops the server and day keys from the URL, so placeholders are used.
 
-            # Extract county name from source attribution.
-            # Example: <dataset label="Collin County (Texas) - Central Appraisal District" rec="52513587">
-            attribution = root.findall("./dataset")[0].get("label")
-            county_regex = r"^([A-Za-z\s]*)"
-            matches = re.findall(county_regex, attribution)
-            county = matches[0].replace(" County", "").strip()
+        Returns:
+            (str): Cache key
+        """
+        keys = {"search_server": "", "login_id": "", "id": ""}
+        url = self.search_url(keys, db_name, search_terms, match_type, match_scope, exemption=exemption)
+        return "{}|{}|{}|{}|{}".format(
+            record_class.__name__,
+            record_class.MAPPINGS_VERSION,
+            us_state.upper(),
+            max_pages,
+            canonical_query_key(url))
+
+    def batch_details(
+        self,
+        credentials: dict,
+        items: list,
+        detail_type: str="dmv",
+        max_concurrency: int=BATCH_CONCURRENCY
+    )->list:
+        """
+        Retrieve details for a list of search results, e.g. to build a case inventory.
 
-            fields = root.findall("./dataset/dataitem/textdata")
-            details = RealPropertyDetails(county=county)
-            details.from_xml(fields[0], SOURCE, us_state)
+        Records that are already cached are mapped right away, straight from the
+        cache entry. The rest are retrieved on a pool of at most *max_concurrency*
+        threads.
 
-        return (success, message, details)
+        Args:
+            credentials (dict): username and password for Public Data service.
+            items (list): List of (db, ed, rec, us_state) tuples
+            detail_type (str): "dmv", "driver", or "property"
+            max_concurrency (int): Most number of records to retrieve from PublicData at once.
+
+        Returns:
+            (list): One (success, message, details) tuple per item, in the same order as *items*.
+        """
+        detail_functions = {
+            "dmv": (self.dmv_details, dmv_details_from_tree),
+            "driver": (self.driver_details, driver_details_from_tree),
+            "property": (self.property_details, property_details_from_tree)
+        }
+        if detail_type not in detail_functions:
+            raise ValueError("Invalid detail type: {}. Must be one of: {}".format(detail_type, ", ".join(detail_functions)))
+        (detail_function, detail_mapper) = detail_functions[detail_type]
+
+        (success, message, keys) = self.login(username=credentials["username"], password=credentials["password"])
+        if not success:
+            return [(False, message, None) for item in items]
+
+        def get_details(item):
+            (db, ed, rec, us_state) = item
+            try:
+                return detail_function(credentials, db, ed, rec, us_state)
+            except Exception as e:
+                self.logger.error("Error retrieving details for %s: %s", item, e)
+                self.logger.exception(e)
+                return (False, str(e), None)
+
+        # Serve what we can from the cache and make a list of what we have to go get.
+        results = [None] * len(items)
+        misses = []
+        for (index, item) in enumerate(items):
+            (db, ed, rec, us_state) = item
+            exemption = None if detail_type == "property" else DMV_EXEMPTIONS.get(us_state.lower())
+            cache_key = canonical_query_key(self.details_url(keys, db, rec, ed, exemption))
+            tree = self.database.check_cache(SOURCE, cache_key) if self.database else None
+            if not tree:
+                misses.append(index)
+                continue
+
+            try:
+                results[index] = (True, "OK", detail_mapper(tree, us_state))
+            except Exception as e:
+                self.logger.error("Error mapping cached details for %s: %s", item, e)
+                self.logger.exception(e)
+                results[index] = (False, str(e), None)
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(misses)))) as executor:
+                futures = [(index, executor.submit(get_details, items[index])) for index in misses]
+                for (index, future) in futures:
+                    results[index] = future.result()
+
+        return results
 
     def details(self, credentials, db_name: str, record_id: str, edition: str, exemption: str=None, refresh: bool=False)->(bool, str, object):
         (success, msg, keys) = self.login(username=credentials["username"], password=credentials["password"])
+        url = self.details_url(keys, db_name, record_id, edition, exemption)
+        return self.load_xml(url, refresh=refresh, cache_key=canonical_query_key(url))
+
+    def details_url(self, keys: dict, db_name: str, record_id: str, edition: str, exemption: str=None)->str:
+        """
+        Build the URL for retrieving one detail record.
+
+        Args:
+            keys (dict): Login keys returned by login()
+            db_name (str): Database name
+            record_id (str): Record ID
+            edition (str): Database edition
+            exemption (str): Exemption code when retrieving otherwise protected information.
+
+        Returns:
+            (str): URL
+        """
         url = "https://{}/pddetails.php?db={}&rec={}&ed={}&dlnumber={}&id={}&disp=XML" \
               .format(keys["search_server"], db_name, record_id, edition, keys["login_id"], keys["id"])
         if exemption:
             url += "&{}".format(exemption)
-        return self.load_xml(url, refresh=refresh)
+        return url
+
+    def search_url(
+        self,
+        keys: dict,
+        db_name: str,
+        search_terms: str,
+        match_type: str="all",
+        match_scope: str="name",
+        search_type: str="advanced",
+        exemption: str=None,
+        searchmoreid: str=None
+    )->str:
+        """
+        Build the URL for one page of search results. See search() for a description
+        of the arguments.
+
+        Args:
+            keys (dict): Login keys returned by login()
+
+        Returns:
+            (str): URL
+        """
+        normalized_terms = normalize_search_terms(search_terms)
+        url = "https://{}/pdsearch.php?p1={}&matchany={}&input={}&dlnumber={}&id={}&type={}&asinname={}&disp=XML" \
+              .format(keys["search_server"], normalized_terms, match_type, db_name, keys["login_id"], keys["id"], search_type, match_scope)
+        if exemption:
+            url = url + "&" + exemption
+        if searchmoreid:
+            url = url + "&searchmoreid=" + searchmoreid
+        return url
 
     def search(
         self,
@@ -603,7 +1311,8 @@ class PublicData(object):
         refresh: bool=False,
         search_type: str="advanced",
         exemption: str=None,
-        searchmoreid: str=None
+        searchmoreid: str=None,
+        record_class=None
     )->(bool, str, object):
         """
         Search for records. Results are cached for one day (until midnight, not necessarily 24 hours).
@@ -623,6 +1332,7 @@ class PublicData(object):
                                etc. Documented at http://www.publicdata.com/pdapidocs/pdsearchtypesdocs.php
             exemption (str): Exemption code when searching otherwise protected information.
             searchmoreid (str): Used in paging through results that have more than one page.
+            record_class (class): Summary class to map records to as they are received. See fetch_xml().
 
         Returns:
             (bool, str, object): The *bool* indicates success or failure.
@@ -630,19 +1340,17 @@ class PublicData(object):
                                  The *object* is an ET tree, if successful otherwise NoneType.
         """
         try:
-            normalized_terms = normalize_search_terms(search_terms)
             (success, msg, keys) = self.login(username=credentials["username"], password=credentials["password"])
-            url = "https://{}/pdsearch.php?p1={}&matchany={}&input={}&dlnumber={}&id={}&type={}&asinname={}&disp=XML" \
-                  .format(keys["search_server"], normalized_terms, match_type, db_name, keys["login_id"], keys["id"], search_type, match_scope)
-            if exemption:
-                url = url + "&" + exemption
-            if searchmoreid:
-                url = url + "&searchmoreid=" + searchmoreid
+            url = self.search_url(keys, db_name, search_terms, match_type, match_scope, search_type, exemption, searchmoreid)
 
             self.logger.debug("URL: %s", url)
 
             # Load XML tree from file or URL
-            return self.load_xml(url, refresh=refresh)
+            return self.load_xml(url,
+                                 refresh=refresh,
+                                 cache_key=canonical_query_key(url),
+                                 record_class=record_class,
+                                 record_state=us_state.upper())
         except Exception as e:
             self.logger.error("Error retrieving from %s: %s", url, str(e))
             self.logger.exception(e)
@@ -651,6 +1359,123 @@ class PublicData(object):
         return (False, message, None)
 
 
+def dmv_details_from_tree(tree, us_state: str)->DmvDetails:
+    """
+    Map a DMV details page, including its lien holders.
+
+    Args:
+        tree (XmlDocument): Details page, from PublicData or the cache
+        us_state (str): U.S. state passed to the record parser
+
+    Returns:
+        (DmvDetails): The vehicle's details
+    """
+    root = tree.getroot()
+    fields = root.findall("./dataset/dataitem/textdata")
+    details = DmvDetails()
+    details.from_xml(fields[0], SOURCE, us_state)
+    lien_holders = root.findall("./dataset/dataitem/dataset[@label='Lien Holders']")
+    for lien in lien_holders:
+        lien_holder = DmvLienHolder()
+        lien_holder.from_xml(lien, SOURCE, us_state)
+        details.lien_holders.append(lien_holder)
+    return details
+
+
+def driver_details_from_tree(tree, us_state: str)->DlDetails:
+    """
+    Map a driver's license details page.
+
+    Args:
+        tree (XmlDocument): Details page, from PublicData or the cache
+        us_state (str): U.S. state passed to the record parser
+
+    Returns:
+        (DlDetails): The driver's details
+    """
+    root = tree.getroot()
+    fields = root.findall("./dataset/dataitem/textdata")
+    details = DlDetails()
+    details.from_xml(fields[0], SOURCE, us_state)
+    details.state = us_state
+    return details
+
+
+def property_details_from_tree(tree, us_state: str)->RealPropertyDetails:
+    """
+    Map a real property details page.
+
+    Args:
+        tree (XmlDocument): Details page, from PublicData or the cache
+        us_state (str): U.S. state passed to the record parser
+
+    Returns:
+        (RealPropertyDetails): The property's details
+    """
+    root = tree.getroot()
+
+    # Extract county name from source attribution.
+    # Example: <dataset label="Collin County (Texas) - Central Appraisal District" rec="52513587">
+    attribution = root.findall("./dataset")[0].get("label")
+    county_regex = r"^([A-Za-z\s]*)"
+    matches = re.findall(county_regex, attribution)
+    county = matches[0].replace(" County", "").strip()
+
+    fields = root.findall("./dataset/dataitem/textdata")
+    details = RealPropertyDetails(county=county)
+    details.from_xml(fields[0], SOURCE, us_state)
+    return details
+
+
+def mapped_states(record_class, us_states: list)->list:
+    """
+    Drop the states that *record_class* has no PublicData mappings for. Searching
+    them would be paid for, but every record would fail to parse.
+
+    Args:
+        record_class (class): Summary class, e.g. DmvSummary
+        us_states (list): Two-letter state abbreviations, in any case
+
+    Returns:
+        (list): The states in *us_states* that can be parsed, in the same order.
+    """
+    mappings = record_class.MAPPINGS.get(SOURCE, {})
+    return [us_state for us_state in us_states if us_state.upper() in mappings]
+
+
+def as_results(summaries: list, record_class, result_set: bool, dedup_stats: dict=None):
+    """
+    Return search results in the form our caller asked for.
+
+    Args:
+        summaries (list): Instances of *record_class*
+        record_class (class): Summary class, e.g. DmvSummary
+        result_set (bool): True to get a SearchResultSet, otherwise a SearchResults list.
+        dedup_stats (dict): See Deduplicator.stats()
+
+    Returns:
+        (SearchResults or SearchResultSet)
+    """
+    if result_set:
+        results = SearchResultSet.from_records(summaries, record_class)
+        results.dedup_stats = dedup_stats
+        return results
+    return SearchResults(summaries, dedup_stats)
+
+
+def dedup_totals()->dict:
+    """
+    Report the duplicates merged by every search since this process started.
+
+    Returns:
+        (dict): {"searches", "records", "duplicates", "ratio"}
+    """
+    with DEDUP_LOCK:
+        totals = dict(DEDUP_TOTALS)
+    totals["ratio"] = dedup_ratio(totals["duplicates"], totals["records"])
+    return totals
+
+
 def error_message(root)->str:
     """
     Find an error message in XML that has indicated an error.
@@ -659,7 +1484,7 @@ def error_message(root)->str:
     them until we find a message or run out of places to look.
 
     Args:
-        root (xml.etree.ElementTree): Root node of an element tree
+        root (Element): Root node of an element tree
 
     Returns:
         (str): Error message
@@ -683,6 +1508,40 @@ def error_message(root)->str:
     return message
 
 
+def canonical_query_key(url: str)->str:
+    """
+    Create a cache key for a PublicData search or details URL that does not depend
+    on who is logged in or on which day.
+
+    The URL is reduced to its endpoint (e.g. "pdsearch.php") and its query parameters:
+    db name, normalized search terms, match type and scope, exemption, searchmoreid, etc.
+    The per-login *dlnumber* and *id* parameters and the server name are dropped, and the
+    remaining parameters are sorted so that equivalent URLs produce the same key.
+
+    Applying this function to a key it produced returns the same key, so it can also be
+    used to migrate existing cache entries. See Database.rekey_cache().
+
+    Args:
+        url (str): URL as built by PublicData.search() or PublicData.details()
+
+    Returns:
+        (str): Canonical query key, e.g. "pdsearch.php?asinname=name&disp=XML&input=txdmv%7Cname&..."
+    """
+    parts = urlsplit(url)
+    endpoint = parts.path.rsplit("/", 1)[-1]
+
+    params = []
+    for (name, value) in parse_qsl(parts.query, keep_blank_values=True):
+        if name.lower() in CREDENTIAL_PARAMS:
+            continue
+        if name == "p1":
+            value = normalize_search_terms(value)
+        params.append((name, value))
+    params.sort()
+
+    return "{}?{}".format(endpoint, urlencode(params))
+
+
 def today_yyyymmdd()->str:
     """
     Get the current date in YYYYMMDD format.
@@ -696,6 +1555,38 @@ def today_yyyymmdd()->str:
     return datetime.now().strftime("%Y%m%d")
 
 
+def keys_expiring(username: str)->bool:
+    """
+    See whether this process's day keys for a user expire within LOGIN_REFRESH_AHEAD seconds.
+
+    Args:
+        username (str): The login_id the keys were issued to.
+
+    Returns:
+        (bool): True if the keys should be refreshed. False if they are not about to expire or we have none.
+    """
+    entry = DAYKEYS.get(username)
+    if not entry:
+        return False
+    return (entry[1] - datetime.utcnow()).total_seconds() < LOGIN_REFRESH_AHEAD
+
+
+def next_day_boundary(now: datetime=None)->datetime:
+    """
+    Get the time at which today's day keys expire, which is the coming local
+    midnight, i.e. when today_yyyymmdd() changes.
+
+    Args:
+        now (datetime): Local time to find the next midnight after. Defaults to now.
+
+    Returns:
+        (datetime): Next local midnight, in UTC.
+    """
+    today = (now or datetime.now()).date()
+    midnight = datetime.combine(today + timedelta(days=1), datetime.min.time())
+    return datetime.utcfromtimestamp(midnight.timestamp())
+
+
 def normalize_search_terms(search_terms: str)->str:
     """
     Normalize the search terms so that searching for "A b c" is the same as searching for
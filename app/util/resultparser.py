@@ -0,0 +1,142 @@
+"""
+resultparser.py - Incremental parser for pages of PublicData search results.
+
+A page of nationwide results can hold hundreds of <record> elements. Rather than
+build a tree for the whole page, ResultParser is fed the raw bytes a chunk at a
+time and hands back each <record> as soon as it is complete. The record is
+detached from the tree when it is handed back and cleared once the caller asks
+for the next one, so only one record is held in memory at a time.
+
+Everything other than the records (the root element, <results> and any error
+message elements) is kept, so the page's *ismore* and *searchmoreid* attributes
+and any error can be inspected along the way.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from . import xmlbackend
+
+CHUNK_SIZE = 64 * 1024  # Bytes fed to the parser at a time
+HEAD_SIZE = 4 * 1024  # Bytes fed to the parser at a time by read_head()
+
+# Depth of the elements we are interested in. The root element is at depth 1.
+RESULTS_DEPTH = 2
+RECORD_DEPTH = 3
+
+
+class ResultParser(object):
+    """
+    Encapsulates the incremental parsing of one page of search results.
+    """
+    def __init__(self, on_results=None):
+        """
+        Instance initializer.
+
+        Args:
+            on_results (function): Called with this parser as soon as the <results>
+                start tag has been read, i.e. once *ismore* and *searchmoreid* are
+                known and before any records have been handed back.
+        """
+        self.parser = xmlbackend.pull_parser(events=("start", "end"))
+        self.on_results = on_results
+        self.root = None
+        self.results = None
+        self.ismore = False
+        self.searchmoreid = None
+        self.record_count = 0
+        self.depth = 0
+
+    @property
+    def is_error(self) -> bool:
+        """
+        Did the server say that this page is an error response?
+        """
+        return self.root is not None and (self.root.get("type") or "").lower() == "error"
+
+    def parse(self, raw: bytes, chunk_size: int = CHUNK_SIZE):
+        """
+        Parse a complete page that is already in memory.
+
+        Args:
+            raw (bytes): The XML document.
+            chunk_size (int): Bytes fed to the parser at a time.
+
+        Yields:
+            (Element): Each <record> element.
+
+        Raises:
+            One of xmlbackend.PARSE_ERRORS if the XML is not well-formed.
+        """
+        # Slices of *raw* itself, since lxml's parser won't take a memoryview.
+        for offset in range(0, len(raw), chunk_size):
+            yield from self.feed(raw[offset:offset + chunk_size])
+        yield from self.close()
+
+    def read_head(self, raw: bytes, chunk_size: int = HEAD_SIZE):
+        """
+        Parse just enough of a page to reach <results>, e.g. to learn *ismore* and
+        *searchmoreid* while the records are parsed somewhere else. Any records
+        read along the way are discarded.
+
+        Args:
+            raw (bytes): The XML document.
+            chunk_size (int): Bytes fed to the parser at a time.
+
+        Raises:
+            One of xmlbackend.PARSE_ERRORS if the XML is not well-formed.
+        """
+        for offset in range(0, len(raw), chunk_size):
+            for record in self.feed(raw[offset:offset + chunk_size]):
+                pass
+            if self.results is not None:
+                break
+
+    def feed(self, data: bytes):
+        """
+        Parse the next chunk of the document.
+
+        Args:
+            data (bytes): Next chunk of the XML document.
+
+        Yields:
+            (Element): Each <record> element completed by this chunk.
+
+        Raises:
+            One of xmlbackend.PARSE_ERRORS if the XML is not well-formed.
+        """
+        self.parser.feed(data)
+        yield from self.read_events()
+
+    def close(self):
+        """
+        Signal the end of the document.
+
+        Yields:
+            (Element): Any <record> elements not yet handed back.
+
+        Raises:
+            One of xmlbackend.PARSE_ERRORS if the document is incomplete.
+        """
+        self.parser.close()
+        yield from self.read_events()
+
+    def read_events(self):
+        # Hand back records as they are completed and note the page attributes.
+        for (event, element) in self.parser.read_events():
+            if event == "start":
+                self.depth += 1
+                if self.depth == 1:
+                    self.root = element
+                elif self.depth == RESULTS_DEPTH and element.tag == "results" and self.results is None:
+                    self.results = element
+                    self.ismore = (element.get("ismore") or "").lower() == "true"
+                    self.searchmoreid = element.get("searchmoreid")
+                    if self.on_results:
+                        self.on_results(self)
+                continue
+
+            if self.depth == RECORD_DEPTH and element.tag == "record" and self.results is not None:
+                self.results.remove(element)
+                self.record_count += 1
+                yield element
+                element.clear()
+            self.depth -= 1
@@ -0,0 +1,356 @@
+"""
+resultset.py - Column-wise container for large lists of search results.
+
+A multi-page search can return thousands of summary records. A SearchResultSet
+holds one NumPy array per attribute rather than one object per record, so that
+sorting, filtering by case item keys, de-duplicating and paging are done with
+array operations. Record objects are only built for the rows actually used,
+e.g. the page being displayed.
+
+Deduplicator merges duplicate records as they come off the paged search loops,
+and SearchResults is the plain list those loops return, with a note of how many
+duplicates were merged.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+from operator import attrgetter
+
+import numpy as np
+
+from .classes.baserecord import unpack_records
+
+
+class SearchResultSet(object):
+    """
+    Encapsulates a list of summary records stored column-wise.
+    """
+    def __init__(self, record_class, columns: dict, keys: np.ndarray = None):
+        """
+        Instance initializer. Use from_records() or from_packed() to create an instance.
+
+        Args:
+            record_class (class): BaseRecord subclass the rows represent, e.g. DmvSummary
+            columns (dict): Attribute name -> np.ndarray (dtype=object). All the same length.
+            keys (np.ndarray): Each row's key(), if already known.
+        """
+        self.record_class = record_class
+        self.columns = columns
+        self.length = len(next(iter(columns.values()))) if columns else 0
+        self._keys = keys
+        self.dedup_stats = None  # See Deduplicator.stats()
+
+    @classmethod
+    def from_records(cls, records: list, record_class):
+        """
+        Create an instance from a list of records.
+
+        Args:
+            records (list): Instances of *record_class*. May be empty.
+            record_class (class): BaseRecord subclass the records were made from.
+
+        Returns:
+            (SearchResultSet): New instance.
+        """
+        fields = record_class.field_names()
+        getter = attrgetter(*fields)
+
+        if records:
+            values = zip(*[getter(record) for record in records])
+        else:
+            values = [[] for name in fields]
+        columns = {name: object_array(column) for name, column in zip(fields, values)}
+        return cls(record_class, columns)
+
+    @classmethod
+    def from_packed(cls, record_class, packed: dict):
+        """
+        Create an instance from records saved by pack_records(), without building
+        the records.
+
+        Args:
+            record_class (class): BaseRecord subclass the records were made from.
+            packed (dict): Result of pack_records()
+
+        Returns:
+            (SearchResultSet): New instance.
+        """
+        fields = record_class.field_names()
+        if "hash" not in packed["fields"]:
+            # Saved before the hash was packed, so it has to be computed from a record.
+            return cls.from_records(unpack_records(record_class, packed), record_class)
+
+        rows = packed["rows"]
+        positions = {name: position for position, name in enumerate(packed["fields"])}
+        columns = {}
+        for name in fields:
+            position = positions.get(name)
+            if position is None:
+                columns[name] = object_array([None] * len(rows))
+            else:
+                columns[name] = object_array([row[position] for row in rows])
+        return cls(record_class, columns)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.record(index)
+
+    def __getitem__(self, index):
+        """
+        Get one record or, given a slice, a new SearchResultSet, e.g. for pagination.
+        """
+        if isinstance(index, slice):
+            return self.take(index)
+        return self.record(index)
+
+    def record(self, index: int):
+        """
+        Build the record at a given position.
+
+        Args:
+            index (int): Position in this set.
+
+        Returns:
+            (object): Instance of *record_class*
+        """
+        record = self.record_class.__new__(self.record_class)
+        for name, values in self.columns.items():
+            setattr(record, name, values[index])
+        return record
+
+    def to_records(self) -> list:
+        """
+        Build a record for every row.
+
+        Returns:
+            (list): Instances of *record_class*, in order.
+        """
+        return list(self)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Get the values of one attribute for every row.
+        """
+        return self.columns[name]
+
+    def keys(self) -> np.ndarray:
+        """
+        Get the key() of every row, e.g. "PUBLICDATA:txdmv.1.1234". Worked out the
+        first time it is needed.
+        """
+        if self._keys is None:
+            self._keys = object_array([
+                "{}:{}.{}.{}".format(source, db, ed, rec)
+                for (source, db, ed, rec) in zip(
+                    self.columns["source"], self.columns["db"], self.columns["ed"], self.columns["rec"])
+            ])
+        return self._keys
+
+    def take(self, index):
+        """
+        Select rows.
+
+        Args:
+            index (object): Slice, boolean mask or array of positions.
+
+        Returns:
+            (SearchResultSet): New instance holding the selected rows.
+        """
+        keys = self._keys[index] if self._keys is not None else None
+        return SearchResultSet(self.record_class, {name: values[index] for name, values in self.columns.items()}, keys)
+
+    def page(self, number: int, size: int):
+        """
+        Get one page of rows.
+
+        Args:
+            number (int): Page number, starting at 1.
+            size (int): Rows per page.
+
+        Returns:
+            (SearchResultSet): New instance holding the page's rows.
+        """
+        start = max(number - 1, 0) * size
+        return self.take(slice(start, start + size))
+
+    def sort(self, *fields, descending: bool = False):
+        """
+        Sort by one or more attributes. None sorts before any other value.
+
+        Args:
+            fields (str): Attribute names, most significant first.
+            descending (bool): Reverse the order.
+
+        Returns:
+            (SearchResultSet): New instance, sorted.
+        """
+        if not fields or self.length == 0:
+            return self
+
+        # np.lexsort() treats its last key as the most significant.
+        keys = [sort_key(self.columns[name]) for name in reversed(fields)]
+        order = np.lexsort(keys)
+        if descending:
+            order = order[::-1]
+        return self.take(order)
+
+    def key_mask(self, keys) -> np.ndarray:
+        """
+        Find the rows whose key() is in a set of keys, e.g. case items.
+
+        Args:
+            keys (set): Keys to look for.
+
+        Returns:
+            (np.ndarray): Boolean mask, one element per row.
+        """
+        if not keys or self.length == 0:
+            return np.zeros(self.length, dtype=bool)
+        if not isinstance(keys, (set, frozenset, dict)):
+            keys = set(keys)
+        return np.fromiter((key in keys for key in self.keys()), dtype=bool, count=self.length)
+
+    def filter_keys(self, keys, exclude: bool = False):
+        """
+        Keep only the rows whose key() is (or, if *exclude*, is not) in *keys*.
+
+        Returns:
+            (SearchResultSet): New instance holding the matching rows.
+        """
+        mask = self.key_mask(keys)
+        return self.take(~mask if exclude else mask)
+
+    def set_where_keys(self, keys, name: str, value):
+        """
+        Set an attribute of every row whose key() is in *keys*, e.g. to mark
+        the rows that are case items. Changes this instance.
+
+        Args:
+            keys (set): Keys to look for.
+            name (str): Attribute to set, e.g. "case_status"
+            value (object): Value to set it to.
+        """
+        self.columns[name][self.key_mask(keys)] = value
+
+    def dedup(self, name: str = "hash"):
+        """
+        Remove rows having the same value of an attribute as an earlier row.
+
+        Args:
+            name (str): Attribute to compare. Defaults to the record's hash.
+
+        Returns:
+            (SearchResultSet): New instance, in the original order, without duplicates.
+        """
+        if self.length == 0:
+            return self
+        (values, first) = np.unique(sort_key(self.columns[name]), return_index=True)
+        return self.take(np.sort(first))
+
+
+class SearchResults(list):
+    """
+    A list of summary records that also reports how many duplicates were merged
+    while it was collected. Used wherever a plain list is.
+    """
+    def __init__(self, records=(), dedup_stats: dict = None):
+        """
+        Instance initializer.
+
+        Args:
+            records (list): Summary records.
+            dedup_stats (dict): See Deduplicator.stats()
+        """
+        super().__init__(records)
+        self.dedup_stats = dedup_stats
+
+
+class Deduplicator(object):
+    """
+    Encapsulates the records kept so far by a search, keyed by their hash.
+    """
+    def __init__(self, key=None):
+        """
+        Instance initializer.
+
+        Args:
+            key (function): Gets the value that identifies duplicates from a record.
+                            Defaults to the record's hash, in which case duplicates
+                            are merged into the record kept. With any other key,
+                            e.g. for records that are dicts, duplicates are dropped.
+        """
+        self.records = {}
+        self.total = 0
+        self.key = key
+
+    def add(self, record) -> bool:
+        """
+        Keep a record unless it is a duplicate of one already kept, in which
+        case its provenance is merged into the one kept.
+
+        Args:
+            record (BaseRecord): Summary record with its hash set.
+
+        Returns:
+            (bool): True if the record is new and should be kept.
+        """
+        self.total += 1
+        key = record.hash if self.key is None else self.key(record)
+        kept = self.records.get(key)
+        if kept is None:
+            self.records[key] = record
+            return True
+        if self.key is None:
+            kept.merge(record)
+        return False
+
+    def count_merged(self, duplicates: int):
+        """
+        Count duplicates that were merged before their records reached this
+        instance, e.g. by the search of each state in a multi-state search.
+
+        Args:
+            duplicates (int): Number of records merged.
+        """
+        self.total += duplicates
+
+    def stats(self) -> dict:
+        """
+        Report how many records were seen and how many were duplicates.
+
+        Returns:
+            (dict): {"records", "unique", "duplicates", "ratio"} where ratio is the
+                    fraction of records that were duplicates.
+        """
+        unique = len(self.records)
+        duplicates = self.total - unique
+        return {
+            "records": self.total,
+            "unique": unique,
+            "duplicates": duplicates,
+            "ratio": dedup_ratio(duplicates, self.total)
+        }
+
+
+def dedup_ratio(duplicates: int, records: int) -> float:
+    """
+    Get the fraction of *records* that were duplicates, 0.0 if there were none.
+    """
+    return round(duplicates / records, 4) if records else 0.0
+
+
+def object_array(values) -> np.ndarray:
+    # Build a 1-D object array without NumPy trying to make lists of lists 2-D.
+    values = list(values)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def sort_key(values: np.ndarray) -> np.ndarray:
+    # Values of an object column as strings that sort the way we want, with None first.
+    values = values.copy()
+    values[np.equal(values, None)] = ""
+    return values.astype(str)
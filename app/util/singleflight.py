@@ -0,0 +1,96 @@
+"""
+singleflight.py - Coalesce identical concurrent calls into one.
+
+When several threads ask for the same key at the same time, only the first
+(the "leader") runs the function. The others wait for the leader to finish and
+then receive the same result, or the same exception. Once the leader is done,
+the key is forgotten, so later calls run the function again.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+import threading
+
+
+class InFlightCall(object):
+    """
+    One in-progress call and the outcome it eventually produces.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Encapsulates a table of in-progress calls, keyed by the caller.
+    """
+    def __init__(self):
+        """
+        Instance initializer.
+        """
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def do(self, key, function, timeout: float = None) -> object:
+        """
+        Call *function* unless an identical call is already in flight, in which
+        case wait for that call and return its result.
+
+        Args:
+            key (object): Identifies calls that are interchangeable.
+            function (function): Called with no arguments to produce the result.
+            timeout (float): Seconds a follower will wait for the leader. None = forever.
+
+        Returns:
+            (object): Whatever *function* returned.
+
+        Raises:
+            Whatever *function* raised, in the leader and in every follower.
+            TimeoutError: If a follower gave up waiting for the leader.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = InFlightCall()
+                self.calls[key] = call
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if is_leader:
+            try:
+                call.result = function()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise TimeoutError("Timed out after {} seconds waiting for identical request in flight".format(timeout))
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Report how many calls were coalesced.
+
+        Returns:
+            (dict): Calls in flight now, and counts of leaders, followers and timeouts.
+        """
+        with self.lock:
+            return {
+                "in_flight": len(self.calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "timeouts": self.timeouts
+            }
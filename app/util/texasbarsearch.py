@@ -7,7 +7,8 @@ texasarsearch.py - Google an attorney by bar number
 """
 import json
 import re
-import requests
+
+from .transport import TRANSPORT
 
 BEGINNING_TAG = '<div class="BNeawe vvjwJb AP7Wnd">'
 ENDING_TAG = '</div></div></div></div></div></div></div></div>'
@@ -37,7 +38,7 @@ class TexasBarSearch(object):
 
         result = None
         url = BASE_URL.format(bar_number)
-        page = requests.get(url).content.decode('latin1')
+        page = TRANSPORT.get(url).content.decode('latin1')
         start = page.find(BEGINNING_TAG)
         end = page.find(ENDING_TAG, start)
         excerpt = page[start:end+len(ENDING_TAG)]
@@ -0,0 +1,222 @@
+"""
+transport.py - Shared, pooled HTTP transport for our outbound clients.
+
+Every outbound client (PublicData, Zillow, FRED, Texas Bar search) sends its
+requests through the TRANSPORT instance defined here rather than calling
+requests.get() directly. That gives us:
+
+    * One keep-alive connection pool per host, so paging through search
+      results does not pay a new TCP+TLS handshake on every request.
+    * Connect and read timeouts on every request.
+    * A bounded number of retries, with jittered exponential backoff, for
+      connection failures and transient server errors. Billable requests,
+      e.g. PublicData searches, are only retried when the connection could
+      not be made, so that we are never charged twice for the same query.
+    * Per-host statistics so we can see how much connection reuse we get.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, NewConnectionError
+
+from .logger import Logger
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5.0))  # Seconds
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 60.0))  # Seconds
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 2))  # Retries after the first attempt
+BACKOFF_BASE = 0.5  # Seconds. Doubled on each retry, then jittered.
+BACKOFF_MAX = 8.0  # Seconds. Longest we will sleep between retries.
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))  # Connections kept alive per host
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+
+class Transport(object):
+    """
+    Encapsulates a set of per-host keep-alive connection pools.
+    """
+    def __init__(
+        self,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        pool_size: int = POOL_SIZE
+    ):
+        """
+        Instance initializer.
+
+        Args:
+            connect_timeout (float): Seconds to wait for a connection to be established.
+            read_timeout (float): Seconds to wait between bytes received from the server.
+            max_retries (int): Number of times to retry a failed request.
+            pool_size (int): Number of connections to keep alive for each host.
+        """
+        self.logger = Logger.get_logger(log_name="pdws.transport")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+
+        self.sessions = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def session(self, host: str) -> requests.Session:
+        """
+        Get the session (and therefore the connection pool) for a host, creating
+        it the first time the host is seen.
+
+        Args:
+            host (str): Scheme and host name, e.g. "https://www.zillow.com"
+
+        Returns:
+            (requests.Session): Session to send requests through.
+        """
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+                self.stats[host] = {"requests": 0, "retries": 0, "failures": 0}
+            return session
+
+    def get(self, url: str, timeout: tuple = None, billable: bool = False, **kwargs) -> requests.Response:
+        """
+        Send a GET request through the pool for the URL's host.
+
+        Connection errors, timeouts and responses having a status code in
+        RETRY_STATUS_CODES are retried up to *max_retries* times. A *billable*
+        request is only retried if it was never sent (see not_sent()): once it
+        has been sent, the server may have run, and charged for, it before the
+        connection dropped. The last exception is re-raised if every attempt fails.
+
+        Args:
+            url (str): URL to retrieve.
+            timeout (tuple): (connect, read) timeouts in seconds. Defaults to
+                the instance's timeouts.
+            billable (bool): True if the server charges us for each request.
+            kwargs: Other arguments to pass to requests, e.g. allow_redirects.
+
+        Returns:
+            (requests.Response): The server's response.
+        """
+        parts = urlsplit(url)
+        host = "{}://{}".format(parts.scheme, parts.netloc)
+        session = self.session(host)
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+
+        attempt = 0
+        while True:
+            self.count(host, "requests")
+            try:
+                response = session.get(url, timeout=timeout, **kwargs)
+                if billable or response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                self.logger.warning("HTTP %s from %s (attempt %d)", response.status_code, host, attempt + 1)
+                self.discard(response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or (billable and not not_sent(e)):
+                    self.count(host, "failures")
+                    raise
+                self.logger.warning("Error contacting %s (attempt %d): %s", host, attempt + 1, e)
+
+            attempt += 1
+            self.count(host, "retries")
+            time.sleep(self.backoff(attempt))
+
+    def discard(self, response: requests.Response):
+        """
+        Read and throw away a response that we are not going to return, then
+        close it. Reading a streamed response to the end lets its connection
+        go back to the pool instead of being dropped.
+
+        Args:
+            response (requests.Response): Response to discard.
+        """
+        try:
+            for chunk in response.iter_content(64 * 1024):
+                pass
+        except requests.RequestException:
+            pass
+        finally:
+            response.close()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Compute how long to wait before retrying, using exponential backoff
+        with "full jitter" so that workers retrying at once do not stay in lockstep.
+
+        Args:
+            attempt (int): Retry number, starting at 1.
+
+        Returns:
+            (float): Seconds to sleep.
+        """
+        ceiling = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def count(self, host: str, counter: str):
+        """
+        Increment one of the per-host counters.
+        """
+        with self.lock:
+            self.stats[host][counter] += 1
+
+    def pool_stats(self) -> dict:
+        """
+        Report connection reuse for each host we have talked to.
+
+        Returns:
+            (dict): Keyed by host. Each value has the number of requests sent,
+                retries, failures, connections opened, and the share of
+                requests that reused an existing connection.
+        """
+        result = {}
+        with self.lock:
+            for host, session in self.sessions.items():
+                stats = dict(self.stats[host])
+                connections = 0
+                adapter = session.get_adapter(host)
+                for pool_key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(pool_key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                stats["connections"] = connections
+                if stats["requests"]:
+                    stats["reuse_ratio"] = round(1 - connections / stats["requests"], 3)
+                else:
+                    stats["reuse_ratio"] = 0.0
+                result[host] = stats
+        return result
+
+
+def not_sent(error: requests.RequestException) -> bool:
+    """
+    Did a request fail before it was sent, i.e. while connecting? A request
+    that failed afterwards, e.g. because the server dropped the connection
+    while we waited for its response, may have been run by the server.
+
+    Args:
+        error (requests.RequestException): Exception raised by requests.
+
+    Returns:
+        (bool): True if the server never received the request.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+TRANSPORT = Transport()
@@ -0,0 +1,238 @@
+"""
+xmlbackend.py - The XML library used to parse PublicData and Zillow responses.
+
+The standard library's ElementTree is used unless lxml is asked for. On the hot
+path, mapping pages of summary records, ElementTree is faster: its findall() on a
+bare tag runs in C, while each lxml XPath call pays more overhead than it saves.
+lxml can still be worth trying for large details pages. Either way, callers get
+elements with the same find()/findall()/iter()/get()/text interface and the same
+results, so nothing else needs to know which is in use. tests/test_xmlbackend.py
+checks that.
+
+Set the environment variable PDWS_XML_BACKEND to "lxml" to use lxml, or to
+"auto" to use it only if it can be imported. The default is "stdlib".
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+import os
+import re
+import threading
+import xml.etree.ElementTree as STDLIB_ET
+
+try:
+    from lxml import etree as LXML_ET
+except ImportError:
+    LXML_ET = None
+
+BACKEND_SETTING = os.environ.get("PDWS_XML_BACKEND", "stdlib").lower()  # "stdlib", "lxml" or "auto"
+
+# Exceptions raised for XML that is not well-formed, by whichever library parsed it.
+if LXML_ET is None:
+    PARSE_ERRORS = (STDLIB_ET.ParseError,)
+else:
+    PARSE_ERRORS = (STDLIB_ET.ParseError, LXML_ET.ParseError)
+
+# Compiled paths: (backend name, path) -> function(element) -> list of elements
+COMPILED_PATHS = {}
+
+# A path to a child element, e.g. "./disp_fld1"
+CHILD_PATH = re.compile(r"^\./([A-Za-z_][\w-]*)$")
+
+
+class StdlibBackend(object):
+    """
+    Encapsulates parsing with xml.etree.ElementTree.
+    """
+    name = "stdlib"
+
+    def fromstring(self, raw: bytes):
+        return STDLIB_ET.fromstring(raw)
+
+    def parse(self, filename: str):
+        return STDLIB_ET.parse(filename)
+
+    def pull_parser(self, events: tuple):
+        return STDLIB_ET.XMLPullParser(events=events)
+
+    def compile_path(self, path: str):
+        # A bare tag is matched in C. Anything else goes through ElementPath,
+        # which caches the selectors it compiles for each path.
+        match = CHILD_PATH.match(path)
+        query = match.group(1) if match else path
+
+        def finder(element):
+            return element.findall(query)
+        return finder
+
+
+class LxmlBackend(object):
+    """
+    Encapsulates parsing with lxml. Comments and processing instructions are
+    dropped, and entities are not resolved, as with the standard library.
+    """
+    name = "lxml"
+    PARSER_OPTIONS = {"remove_comments": True, "remove_pis": True, "resolve_entities": False, "no_network": True}
+
+    def __init__(self):
+        # lxml parsers must not be used by two threads at once.
+        self.local = threading.local()
+
+    def parser(self):
+        parser = getattr(self.local, "parser", None)
+        if parser is None:
+            parser = LXML_ET.XMLParser(**self.PARSER_OPTIONS)
+            self.local.parser = parser
+        return parser
+
+    def fromstring(self, raw: bytes):
+        return LXML_ET.fromstring(raw, self.parser())
+
+    def parse(self, filename: str):
+        return LXML_ET.parse(filename, self.parser())
+
+    def pull_parser(self, events: tuple):
+        return LXML_ET.XMLPullParser(events=events, **self.PARSER_OPTIONS)
+
+    def compile_path(self, path: str):
+        # The mapping paths are ElementPath expressions, which are also valid XPath.
+        # Trees parsed before we switched, e.g. from old cache entries, may still
+        # hold standard library elements, which XPath can't search.
+        xpath = LXML_ET.XPath(path)
+        stdlib = STDLIB_BACKEND.compile_path(path)
+        element_class = LXML_ET._Element
+
+        def finder(element):
+            if isinstance(element, element_class):
+                return xpath(element)
+            return stdlib(element)
+        return finder
+
+
+STDLIB_BACKEND = StdlibBackend()
+
+
+def select_backend(setting: str):
+    """
+    Choose the backend for a PDWS_XML_BACKEND setting.
+
+    Args:
+        setting (str): "auto", "lxml" or "stdlib"
+
+    Returns:
+        (object): LxmlBackend or StdlibBackend instance.
+
+    Raises:
+        ValueError: If *setting* is not recognized.
+        ImportError: If *setting* is "lxml" and lxml is not installed.
+    """
+    if setting not in ["auto", "lxml", "stdlib"]:
+        raise ValueError("Invalid XML backend: {}. Must be one of: auto, lxml, stdlib".format(setting))
+    if setting == "lxml" and LXML_ET is None:
+        raise ImportError("PDWS_XML_BACKEND is lxml but lxml is not installed.")
+    if setting != "stdlib" and LXML_ET is not None:
+        return LxmlBackend()
+    return STDLIB_BACKEND
+
+
+BACKEND = select_backend(BACKEND_SETTING)
+
+
+def use(setting: str):
+    """
+    Switch backends, e.g. to compare them. Only affects documents parsed afterwards.
+
+    Args:
+        setting (str): "auto", "lxml" or "stdlib"
+    """
+    global BACKEND
+    BACKEND = select_backend(setting)
+
+
+def backend_name()->str:
+    """
+    Get the name of the backend in use: "lxml" or "stdlib"
+    """
+    return BACKEND.name
+
+
+def fromstring(raw: bytes):
+    """
+    Parse an XML document.
+
+    Args:
+        raw (bytes): The XML document.
+
+    Returns:
+        (Element): Root element.
+
+    Raises:
+        One of PARSE_ERRORS if the XML is not well-formed.
+    """
+    return BACKEND.fromstring(raw)
+
+
+def parse(filename: str):
+    """
+    Parse an XML file.
+
+    Args:
+        filename (str): Path to the file.
+
+    Returns:
+        (ElementTree): Tree whose getroot() is the root element.
+    """
+    return BACKEND.parse(filename)
+
+
+def pull_parser(events: tuple):
+    """
+    Create a parser that is fed a document a chunk at a time. See ResultParser.
+
+    Args:
+        events (tuple): Events to report, e.g. ("start", "end")
+
+    Returns:
+        (XMLPullParser): New parser.
+    """
+    return BACKEND.pull_parser(events)
+
+
+def compile_path(path: str):
+    """
+    Compile a path, e.g. "./disp_fld1", once per backend.
+
+    Args:
+        path (str): ElementPath expression, relative to the element it is applied to.
+
+    Returns:
+        (function): Called with an element, returns the list of matching elements.
+    """
+    key = (BACKEND.name, path)
+    finder = COMPILED_PATHS.get(key)
+    if finder is None:
+        if path == ".":
+            # The element itself, e.g. for the db, ed and rec attributes of a <record>.
+            def finder(element):
+                return [element]
+        else:
+            finder = BACKEND.compile_path(path)
+        COMPILED_PATHS[key] = finder
+    return finder
+
+
+def tostring(element)->bytes:
+    """
+    Serialize an element from either library as UTF-8.
+    """
+    if LXML_ET is not None and isinstance(element, LXML_ET._Element):
+        return LXML_ET.tostring(element, encoding="utf-8", xml_declaration=True)
+    return STDLIB_ET.tostring(element, encoding="utf-8")
+
+
+def is_tree(obj)->bool:
+    """
+    Is *obj* an element tree from either library?
+    """
+    if LXML_ET is not None and isinstance(obj, LXML_ET._ElementTree):
+        return True
+    return isinstance(obj, STDLIB_ET.ElementTree)
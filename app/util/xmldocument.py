@@ -0,0 +1,134 @@
+"""
+xmldocument.py - Raw XML response that is only parsed when someone asks for its tree.
+
+We receive XML from PublicData and Zillow as bytes. An XmlDocument holds on to
+those bytes and builds an element tree, with whichever library xmlbackend is
+using, the first time getroot() is called. It can
+be used anywhere we previously passed an ET.ElementTree around, because callers
+only ever call getroot() on those.
+
+For caching, the raw bytes are compressed with zlib, which is far smaller and
+faster to reconstitute than a pickled ElementTree and does not depend on the
+version of Python that wrote it.
+
+Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
+"""
+import threading
+import zlib
+
+from . import xmlbackend
+
+COMPRESSION_LEVEL = 6
+
+
+class XmlDocument(object):
+    """
+    Raw XML bytes plus a lazily built element tree.
+    """
+    def __init__(self, raw: bytes, root=None):
+        """
+        Instance initializer.
+
+        Args:
+            raw (bytes): The XML document exactly as received.
+            root (Element): Root element, if the caller has already parsed *raw*.
+        """
+        self.raw = raw
+        self._root = root
+        self._lock = threading.Lock()
+        self._records = None
+
+    @classmethod
+    def from_tree(cls, tree):
+        """
+        Create an instance from an existing element tree.
+
+        Args:
+            tree (ElementTree): Tree to wrap, from either XML library.
+
+        Returns:
+            (XmlDocument): New instance.
+        """
+        root = tree.getroot()
+        return cls(xmlbackend.tostring(root), root)
+
+    @classmethod
+    def from_compressed(cls, compressed: bytes):
+        """
+        Create an instance from bytes produced by compressed().
+
+        Args:
+            compressed (bytes): zlib-compressed XML
+
+        Returns:
+            (XmlDocument): New instance. The XML is not parsed until it is needed.
+        """
+        return cls(zlib.decompress(compressed))
+
+    def compressed(self) -> bytes:
+        """
+        Get the raw XML compressed for storage.
+
+        Returns:
+            (bytes): zlib-compressed XML
+        """
+        return zlib.compress(self.raw, COMPRESSION_LEVEL)
+
+    @property
+    def text(self) -> str:
+        """
+        Get the raw XML as a string.
+        """
+        return self.raw.decode()
+
+    def is_parsed(self) -> bool:
+        """
+        Has the element tree been built yet?
+        """
+        return self._root is not None
+
+    def keep_records(self, record_class, state: str, records: list):
+        """
+        Hold on to the records that were mapped from this document while it
+        was being received, so that they do not have to be parsed again.
+
+        Args:
+            record_class (class): Summary class the records were mapped to, e.g. DmvSummary
+            state (str): U.S. State they were mapped for, e.g. "TX"
+            records (list): Instances of *record_class*
+        """
+        self._records = (record_class, state, records)
+
+    def take_records(self, record_class, state: str) -> list:
+        """
+        Hand over the records kept by keep_records(), if they were mapped the
+        way the caller wants. They are handed over once, because callers modify
+        them, e.g. when merging duplicates. Later callers parse *raw* instead.
+
+        Args:
+            record_class (class): Summary class wanted, e.g. DmvSummary
+            state (str): U.S. State wanted, e.g. "TX"
+
+        Returns:
+            (list): Instances of *record_class* or None if there are none to hand over.
+        """
+        with self._lock:
+            kept = self._records
+            if kept is None or kept[0] is not record_class or kept[1] != state:
+                return None
+            self._records = None
+        return kept[2]
+
+    def getroot(self):
+        """
+        Get the root element, parsing the raw XML the first time we are called.
+        Throws one of xmlbackend.PARSE_ERRORS if the XML is not well-formed.
+
+        Returns:
+            (Element): Root element of the document.
+        """
+        if self._root is None:
+            with self._lock:
+                if self._root is None:
+                    self._root = xmlbackend.fromstring(self.raw)
+        return self._root
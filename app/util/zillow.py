@@ -9,16 +9,29 @@ Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
 """
 from datetime import datetime
 import os
-import requests
-import xml.etree.ElementTree as ET
-import xml
 
-from .database import Database
+from .database import get_database
 from .logger import Logger
+from .transport import TRANSPORT
+from .xmldocument import XmlDocument
+from . import xmlbackend
 
 SEARCH_URL = "https://www.zillow.com/webservice/GetSearchResults.htm?zws-id={}&address={}&citystatezip={}"
 SOURCE = "ZILLOW"
 
+# Where to find each value we use in a GetSearchResults response.
+RESULT_PATHS = {
+    "street": "./response/results/result/address/street",
+    "city": "./response/results/result/address/city",
+    "state": "./response/results/result/address/state",
+    "zipcode": "./response/results/result/address/zipcode",
+    "latitude": "./response/results/result/address/latitude",
+    "longitude": "./response/results/result/address/longitude",
+    "zestimate": "./response/results/result/zestimate/amount",
+    "homedetails": "./response/results/result/links/homedetails",
+    "comparables": "./response/results/result/links/comparables"
+}
+
 
 class Zillow(object):
     """
@@ -47,7 +60,7 @@ class Zillow(object):
 
         # If we've never connected, connect now.
         if self.database is None:
-            database = Database()
+            database = get_database()
             success = database.connect()
             if success:
                 self.database = database
@@ -60,7 +73,7 @@ class Zillow(object):
         except Exception as e:
             self.logger.error("Error testing database connection: %s", e)
             self.database = None
-            database = Database()
+            database = get_database()
             success = database.connect()
 
         return success
@@ -79,14 +92,15 @@ class Zillow(object):
         Returns:
             (bool, str, object): The *bool* indicates success or failure.
                                  The *str* provides a diagnostic message.
-                                 The *object* is an ET tree, if successful otherwise NoneType.
+                                 The *object* is an XmlDocument (or ET tree, if loaded from *filename*)
+                                 if successful otherwise NoneType.
         """
         # See if the cache file exists. If so, it is not necessary
         # to query the URL - we will just parse the contents of the file.
         try:
             if filename and os.path.exists(filename) and not refresh:
                 self.logger.debug("Loading from file: %s", filename)
-                tree = ET.parse(filename)
+                tree = xmlbackend.parse(filename)
                 return (True, "OK", tree)
 
             if self.database and not refresh:
@@ -98,13 +112,11 @@ class Zillow(object):
             self.logger.debug("Loading from URL. %s", url)
 
             # Retrieve response from server
-            response = requests.get(url, allow_redirects=False)
-
-            # Convert response from stream of bytes to string
-            content = response.content.decode()
+            response = TRANSPORT.get(url, allow_redirects=False)
 
-            # Deserialize response to XML element tree
-            tree = ET.ElementTree(ET.fromstring(content))
+            # Keep the raw bytes. They are parsed (once) when getroot() is first called.
+            content = response.content
+            tree = XmlDocument(content)
 
             # See if we got an error response.
             root = tree.getroot()
@@ -116,14 +128,14 @@ class Zillow(object):
             # All looks ok from a 30,000-foot level.
             # Cache the response and return it to our caller.
             if filename:
-                open(filename, "w").write(content)
+                open(filename, "wb").write(content)
             elif self.database:
                 self.database.insert_cache(source=SOURCE, query=url, result=tree)
             else:
                 self.logger.warn("Unable to cache search result. Is the database down?")
 
             return (True, "OK", tree)
-        except xml.etree.ElementTree.ParseError as e:
+        except xmlbackend.PARSE_ERRORS as e:
             self.logger.error("Error parsing XML: %s", e)
             self.logger.error("Failed XML: %s", content)
             return (False, str(e), None)
@@ -161,3 +173,20 @@ class Zillow(object):
             message = str(e)
 
         return (False, message, None)
+
+
+def search_result_fields(root)->dict:
+    """
+    Get the values we use from a GetSearchResults response.
+
+    Args:
+        root (Element): Root element of the response.
+
+    Returns:
+        (dict): Keyed as RESULT_PATHS. The value is None if the response doesn't have it.
+    """
+    fields = {}
+    for name, path in RESULT_PATHS.items():
+        elems = xmlbackend.compile_path(path)(root)
+        fields[name] = elems[0].text if elems else None
+    return fields
@@ -5,16 +5,19 @@ This module provides the views for the following routes:
 
 /query
 /queries
+/stats
 
 Copyright (c) 2019 by Thomas J. Daley. All Rights Reserved.
 """
-from flask import Blueprint, render_template
+from flask import Blueprint, jsonify, render_template
 
 from views.decorators import is_logged_in, is_admin_user
 
-from util.database import Database
-DATABASE = Database()
-DATABASE.connect()
+from util.database import get_database, pool_stats, SEARCH_CACHE
+from util.parsepool import PARSE_STATS
+from util.publicdata import INFLIGHT, dedup_totals
+from util.transport import TRANSPORT
+DATABASE = get_database()
 
 admin_routes = Blueprint("admin_routes", __name__, template_folder="templates")
 
@@ -33,3 +36,18 @@ def list_query_cache():
 def show_query(id):
     result = DATABASE.get_query_cache_item_result(id)
     return render_template("query_result.html", result=result)
+
+
+@admin_routes.route("/stats", methods=['GET'])
+@is_logged_in
+@is_admin_user
+def show_stats():
+    stats = {
+        "transport": TRANSPORT.pool_stats(),
+        "search_cache": SEARCH_CACHE.stats(),
+        "publicdata_in_flight": INFLIGHT.stats(),
+        "publicdata_dedup": dedup_totals(),
+        "publicdata_parsing": PARSE_STATS.stats(),
+        "mongo": pool_stats(),
+    }
+    return jsonify(stats)
@@ -6,6 +6,7 @@ This module provides the views for the following routes:
 /case/add
 /case/items
 /case/update_items
+/case/update_items/bulk
 /case/<string:id>
 /cases
 /clearcaseid
@@ -14,6 +15,9 @@ This module provides the views for the following routes:
 Copyright (c) 2019 by Thomas J. Daley. All Rights Reserved.
 """
 
+import json
+import math
+
 from flask import Blueprint, render_template, redirect, request, session, flash, url_for, jsonify
 import random
 from passlib.hash import sha256_crypt
@@ -22,9 +26,8 @@ from views.decorators import is_logged_in, is_case_set
 
 from .forms.AddCaseForm import AddCaseForm
 
-from util.database import Database
-DATABASE = Database()
-DATABASE.connect()
+from util.database import get_database, CASE_ITEMS_PAGE_SIZE
+DATABASE = get_database()
 
 case_routes = Blueprint("case_routes", __name__, template_folder="templates")
 
@@ -34,8 +37,13 @@ case_routes = Blueprint("case_routes", __name__, template_folder="templates")
 @is_case_set
 def get_case_items():
     case_id = session['case']['_id']
-    case_items = DATABASE.get_case_items(session['email'], case_id=case_id)
-    return render_template("case_discovery_list.html", discovery=case_items, case_id=case_id)
+    page = max(request.args.get('page', 1, type=int), 1)
+    counts = DATABASE.count_case_items(session['email'], case_id)
+    case_items = DATABASE.get_case_items(session['email'], case_id, page=page, page_size=CASE_ITEMS_PAGE_SIZE)
+    total = sum(count for (category, count) in counts.items() if not category.startswith("X"))
+    pages = max(math.ceil(total / CASE_ITEMS_PAGE_SIZE), 1)
+    return render_template(
+        "case_discovery_list.html", items=case_items, counts=counts, page=page, pages=pages, case_id=case_id)
 
 
 @case_routes.route('/case/add/', methods=['GET', 'POST'])
@@ -79,12 +87,11 @@ def update_case_items():
 
     if operation == "add":
         # Add to the included list and remove from the excluded list.
-        success = DATABASE.add_to_case(session['email'], case_id, category, key, item)
-        success = DATABASE.del_from_case(session['email'], case_id, "X" + category, key, item)
+        success = DATABASE.toggle_case_item(session['email'], case_id, category, key, item, include=True)
         return jsonify({"success": success, "message": "Item added: {}".format(description)})
     elif operation == "del":
-        success = DATABASE.del_from_case(session['email'], case_id, category, key, item)
-        success = DATABASE.add_to_case(session['email'], case_id, "X" + category, key, item)
+        # Remove from the included list and add to the excluded list.
+        success = DATABASE.toggle_case_item(session['email'], case_id, category, key, item, include=False)
         return jsonify({"success": success, "message": "Item removed: {}".format(description)})
 
     message = "Invalid operation: {}".format(operation)
@@ -92,6 +99,38 @@ def update_case_items():
     return jsonify({"success": False, "message": message})
 
 
+@case_routes.route('/case/update_items/bulk/', methods=['POST'])
+@is_logged_in
+@is_case_set
+def update_case_items_bulk():
+    """
+    Include or exclude many items at once, e.g. a whole page of search results.
+    The form has *category*, *op* ("add" or "del") and *items*, a JSON list of
+    items, each with a *key* and the same fields as /case/update_items/.
+    """
+    fields = request.form
+    case_id = session['case']['_id']
+    category = fields['category']
+    operation = fields['op'].lower()
+
+    if operation not in ["add", "del"]:
+        message = "Invalid operation: {}".format(operation)
+        flash(message, "danger")
+        return jsonify({"success": False, "message": message})
+
+    try:
+        items = {
+            item['key']: {key: value for (key, value) in item.items() if key not in ['case_id', 'category', 'key', 'operation']}
+            for item in json.loads(fields['items'])
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"success": False, "message": "Invalid items: {}".format(e)})
+
+    success = DATABASE.toggle_case_items(session['email'], case_id, category, items, include=operation == "add")
+    verb = "added" if operation == "add" else "removed"
+    return jsonify({"success": success, "message": "{} items {}.".format(len(items), verb)})
+
+
 @case_routes.route('/case/<string:id>/', methods=['GET', 'POST'])
 @is_logged_in
 def get_case(id):
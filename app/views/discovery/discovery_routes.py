@@ -10,13 +10,12 @@ import random
 from passlib.hash import sha256_crypt
 
 from views.decorators import is_logged_in, is_case_set
-from util.database import Database
+from util.database import get_database
 from webservice import WebService
 from .forms.AddDiscoveryDocumentForm import AddDiscoveryDocumentForm
 from .forms.AddDiscoveryRequestForm import AddDiscoveryRequstItemForm
 
-DATABASE = Database()
-DATABASE.connect()
+DATABASE = get_database()
 WEBSERVICE = WebService(None)
 
 discovery_routes = Blueprint('discovery_routes', __name__, template_folder="templates")
@@ -15,10 +15,15 @@ import random
 from passlib.hash import sha256_crypt
 
 from views.decorators import is_logged_in, is_case_set
+from views.search_results import found_message
 
 from webservice import WebService
+from util.database import get_database
+
 WEBSERVICE = WebService(None)
 
+DATABASE = get_database()
+
 
 # Helper to create Public Data credentials from session variables
 def pd_credentials(mysession) -> dict:
@@ -44,10 +49,10 @@ def search_drivers(search_type, search_terms, search_state):
             flash(message, "warning")
             return redirect(url_for('driver_routes.search_dl'))
 
-        flash("Found {} matching drivers.".format(len(results)), "success")
+        flash(found_message(len(results), "drivers", getattr(results, "dedup_stats", None)), "success")
 
-        # if 'case' in session:
-        #    filter_results(results, session['case']['_id'], "PERSON")
+        if 'case' in session:
+            DATABASE.mark_case_status(results, session['email'], session['case']['_id'], "PERSON")
         results = sorted(results, key=lambda i: (i.case_status, i.driver_name))
         return render_template('drivers.html', drivers=results)
 
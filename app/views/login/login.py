@@ -20,9 +20,8 @@ from views.decorators import is_logged_in
 from .forms.RegisterForm import RegisterForm
 from .forms.SettingsForm import SettingsForm
 
-from util.database import Database
-DATABASE = Database()
-DATABASE.connect()
+from util.database import get_database
+DATABASE = get_database()
 
 login = Blueprint("login", __name__, template_folder="templates")
 
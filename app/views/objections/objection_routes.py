@@ -9,11 +9,10 @@ from wtforms import Form, StringField, TextAreaField, PasswordField, validators
 import random
 
 from views.decorators import is_logged_in, is_case_set, is_admin_user
-from util.database import Database
+from util.database import get_database
 from .forms.AddObjectionTemplateForm import AddObjectionTemplateForm
 
-DATABASE = Database()
-DATABASE.connect()
+DATABASE = get_database()
 
 objection_routes = Blueprint('objection_routes', __name__, template_folder='templates')
 
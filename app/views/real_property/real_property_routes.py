@@ -17,6 +17,7 @@ from passlib.hash import sha256_crypt
 from operator import itemgetter
 
 from views.decorators import is_logged_in, is_case_set
+from views.search_results import found_message
 
 from webservice import WebService
 WEBSERVICE = WebService(None)
@@ -53,7 +54,7 @@ def search(search_type, search_terms, search_state):
             flash(message, "warning")
             return redirect(url_for('rp_routes.search_rp'))
 
-        flash("Found {} matching properties.".format(len(results)), "success")
+        flash(found_message(len(results), "properties", getattr(results, "dedup_stats", None)), "success")
 
         # if 'case' in session:
         #    filter_results(results, session['case']['_id'], "PERSON")
@@ -0,0 +1,24 @@
+"""
+search_results.py - Helpers shared by the search views.
+
+Copyright (c) 2019 by Thomas J. Daley. All Rights Reserved.
+"""
+
+
+def found_message(count: int, noun: str, dedup_stats: dict = None) -> str:
+    """
+    Describe how many records a search found and, if it merged any duplicates,
+    how many.
+
+    Args:
+        count (int): Number of records found.
+        noun (str): What was found, e.g. "vehicles"
+        dedup_stats (dict): The search results' *dedup_stats*, if any. See Deduplicator.stats()
+
+    Returns:
+        (str): Message to flash to the user.
+    """
+    message = "Found {} matching {}.".format(count, noun)
+    if dedup_stats and dedup_stats["duplicates"]:
+        message += " Merged {duplicates} of {records} records as duplicates ({ratio:.1%}).".format(**dedup_stats)
+    return message
@@ -14,14 +14,14 @@ import random
 from passlib.hash import sha256_crypt
 
 from views.decorators import is_logged_in, is_case_set
+from views.search_results import found_message
 
 from webservice import WebService
-from util.database import Database
+from util.database import get_database
 
 WEBSERVICE = WebService(None)
 
-DATABASE = Database()
-DATABASE.connect()
+DATABASE = get_database()
 
 
 # Helper to create Public Data credentials from session variables
@@ -66,31 +66,6 @@ def join_results(search_type: str, prior_results: dict, new_results: list) -> di
     return merged_result
 
 
-def filter_results(results: list, case_id: str, category: str):
-    """
-    Sets the case status property of each item in the results list.
-
-    Args:
-        results (list): List of items founds during search.
-        case_id (str): _id property of case document in the cases collection.
-        categor (str): The category or category:sub_category of the items in *results*.
-
-    Return:
-        None. The *results* list is modified in place.
-    """
-    excluded = DATABASE.get_case_items(session['email'], case_id, "X{}".format(category))
-    if excluded:
-        for item in results:
-            if item.key() in excluded:
-                item.case_status = "X"
-
-    included = DATABASE.get_case_items(session['email'], case_id, category)
-    if included:
-        for item in results:
-            if item.key() in included:
-                item.case_status = "I"
-
-
 vehicle_routes = Blueprint("vehicle_routes", __name__, template_folder="templates")
 
 
@@ -119,7 +94,7 @@ def search_dmv():
     (success, message, search_results) = search_fn(credentials, search_terms=form["search_terms"], us_state=form["state"])
     print("Found {} records for {} search for '{}'.".format(len(search_results), search_type, form["search_terms"]))
     if case_id:
-        filter_results(search_results, case_id, "PROPERTY:VEHICLE")
+        DATABASE.mark_case_status(search_results, session['email'], case_id, "PROPERTY:VEHICLE")
 
     if success:
         # results = [search_results[key] for key in search_results.keys()]
@@ -136,7 +111,7 @@ def search_dmv():
             flash(message, "warning")
             return redirect(url_for('vehicle_routes.search_dmv'))
 
-        flash("Found {} matching vehicles.".format(len(results)), "success")
+        flash(found_message(len(results), "vehicles", getattr(search_results, "dedup_stats", None)), "success")
         return render_template('vehicles.html', vehicles=results)
     return render_template("search_error.html", formvariables=form, operation="Search: DMV", message=message)
 
@@ -8,11 +8,13 @@ Copyright (c) 2019 by Thomas J. Daley, J.D. All Rights Reserved.
 import argparse
 from datetime import datetime
 import json
-import xml.etree.ElementTree as ET
+from operator import itemgetter
 
+from util.depreciation import DepreciationSchedules, depreciation_schedules
 from util.logger import Logger
 from util.publicdata import PublicData
-from util.zillow import Zillow
+from util.resultset import Deduplicator, SearchResults
+from util.zillow import Zillow, search_result_fields
 from util.classes.dmvdetails import DmvDetails
 
 
@@ -93,7 +95,12 @@ class WebService(object):
         # appear to be blank records.
         results = [parcel for parcel in results if parcel['street'] != '']
 
-        return (success, "OK", results)
+        # The same parcel can appear more than once, e.g. on several pages. Keep the first.
+        deduplicator = Deduplicator(key=itemgetter("owner", "street", "csz"))
+        parcels = [parcel for parcel in results if deduplicator.add(parcel)]
+        dedup_stats = self.public_data.dedup_report(deduplicator)
+
+        return (success, "OK", SearchResults(parcels, dedup_stats))
 
     def zillow_data(self, parcel, zwsid: str) -> list:
         street = parcel.property_street
@@ -104,18 +111,15 @@ class WebService(object):
             parcel.zillow = False
             return parcel
 
-        root = tree.getroot()
-        address = root.find("./response/results/result/address")
+        fields = search_result_fields(tree.getroot())
         parcel.zillow = True
-        parcel.street = address.find("street").text
-        parcel.csz = "{}, {} {}".format(address.find("city").text, address.find("state").text, address.find("zipcode").text)
-        parcel.latitide = address.find("latitude").text
-        parcel.longitude = address.find("longitude").text
-        parcel.zestimate = float(root.find("./response/results/result/zestimate/amount").text)
-        details_link = root.find("./response/results/result/links/homedetails").text
-        comps_link = root.find("./response/results/result/links/comparables").text
-        parcel.zbranding = '<a href="{}">See more details for {} on Zillow.</a>'.format(details_link, parcel.property_street)
-        parcel.comps_link = comps_link
+        parcel.street = fields["street"]
+        parcel.csz = "{}, {} {}".format(fields["city"], fields["state"], fields["zipcode"])
+        parcel.latitide = fields["latitude"]
+        parcel.longitude = fields["longitude"]
+        parcel.zestimate = float(fields["zestimate"])
+        parcel.zbranding = '<a href="{}">See more details for {} on Zillow.</a>'.format(fields["homedetails"], parcel.property_street)
+        parcel.comps_link = fields["comparables"]
         return parcel
 
     def property_details(self, credentials: dict, db: str, ed: str, rec: str, us_state: str, get_zillow: bool, zwsid: str):
@@ -141,20 +145,18 @@ class WebService(object):
                 results.append(parcel)
                 continue
 
-            root = tree.getroot()
-            address = root.find("./response/results/result/address")
+            fields = search_result_fields(tree.getroot())
             parcel["zillow"] = True
-            parcel["street"] = address.find("street").text
+            parcel["street"] = fields["street"]
             parcel["csz"] = "{}, {} {}".format(
-                address.find("city").text,
-                address.find("state").text,
-                address.find("zipcode").text
+                fields["city"],
+                fields["state"],
+                fields["zipcode"]
             )
-            parcel["latitide"] = address.find("latitude").text
-            parcel["longitude"] = address.find("longitude").text
-            parcel["zestimate"] = float(root.find("./response/results/result/zestimate/amount").text)  # NOQA
-            details_link = root.find("./response/results/result/links/homedetails").text  # NOQA
-            parcel["zbranding"] = '<a href="{}">See more details for {} on Zillow.</a>'.format(details_link, parcel["street"])  # NOQA
+            parcel["latitide"] = fields["latitude"]
+            parcel["longitude"] = fields["longitude"]
+            parcel["zestimate"] = float(fields["zestimate"])
+            parcel["zbranding"] = '<a href="{}">See more details for {} on Zillow.</a>'.format(fields["homedetails"], parcel["street"])  # NOQA
             results.append(parcel)
         return results
 
@@ -181,6 +183,8 @@ class WebService(object):
             match_scope (str): One of main (search all fields); name (search
                 owner name field); plate (search for license plate);
                 or vin (search for VIN)
+            us_state (str): Two-letter state abbreviation or "*" to search
+                every state we can.
 
         Returns:
             (success, message, car_summaries): Where success is a bool
@@ -188,6 +192,14 @@ class WebService(object):
                 of any error encountered; and car_summaries is a list
                 of DmvSummary instances.
         """
+        if us_state == "*":
+            (success, message, car_summaries, report) = self.public_data.dmv_multi_state(
+                credentials=credentials,
+                search_terms=search_terms,
+                match_scope=match_scope)
+            self.logger.info("Multi-state DMV search: %s", report)
+            return (success, message, car_summaries)
+
         return self.public_data.dmv(
             credentials=credentials,
             search_terms=search_terms,
@@ -201,6 +213,14 @@ class WebService(object):
         search_scope: str,
         us_state: str
     ):
+        if us_state == "*":
+            (success, message, summaries, report) = self.public_data.drivers_license_multi_state(
+                credentials,
+                search_terms=search_terms,
+                match_scope=search_scope)
+            self.logger.info("Multi-state DL search: %s", report)
+            return (success, message, summaries)
+
         return self.public_data.drivers_license(
             credentials,
             search_terms=search_terms,
@@ -364,6 +384,38 @@ class WebService(object):
 
         return (schedule, message)
 
+    def amortization_schedules(
+        self,
+        model_years: list,
+        sold_prices: list,
+        title_dates: list,
+        sold_dates: list = None,
+        normal_useful_life: int = 15
+    ) -> DepreciationSchedules:
+        """
+        Compute amortization schedules for many assets at once, e.g. every vehicle
+        in a case. Gives the same schedules and messages as amortization_schedule()
+        but does the arithmetic for all of them in one pass.
+
+        Args:
+            model_years (list): Model year of each asset (YYYY).
+            sold_prices (list): Price each asset was sold for.
+            title_dates (list): Date each asset was first titled to the current owner (YYYYMMDD).
+            sold_dates (list): Date each asset was sold to the current owner (YYYYMMDD).
+            normal_useful_life (int): Number of years of normal useful life
+                (not remaining useful life.)
+
+        Returns:
+            (DepreciationSchedules): One row of values per asset plus a message for each.
+                Use its schedule() method to get a list like amortization_schedule()'s.
+        """
+        return depreciation_schedules(
+            model_years,
+            sold_prices,
+            title_dates,
+            sold_dates=sold_dates,
+            normal_useful_life=normal_useful_life)
+
 
 def print_schedule(schedule: list, message: str, details: DmvDetails):
     print("\n", "-" * 41, sep="")